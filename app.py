@@ -1,40 +1,831 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
+import functools
+import gzip
+import hashlib
+import itertools
 import json
-import time
-from converter import convert_mermaid_to_nsd
+import os
+import secrets
+import threading
+import zlib
+import assets
+from compact_svg import COMPACT_PRECISION
+from converter import convert_graph_to_nsd, convert_mermaid_to_nsd, iter_nsd_svg
+from diagram_store import DiagramStore
+from graph_json import validate_graph
+from graph_session import GraphSession, VersionConflict
+from layout_json import document_layout
+from live_session import LiveSession
+from metrics import MetricsRegistry, collect_trace, trace_count, trace_merge, trace_stage
+from nsd_cache import LRUCache, NSDCache, cache_key
+from paging import MIN_PAGE_HEIGHT, PAGE_HEIGHTS, load_document
+from pap import cache_options as pap_cache_options, convert_mermaid_to_pap
+from serving import ConversionError, ConversionLimits, ConversionPool, ServerBusy, UnstructuredFlowchart, check_deadline, enforce
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
+# /static is the development path (NSD_ASSET_BUNDLE=0) and always revalidated;
+# the editor normally loads the fingerprinted bundle from /assets
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
+# Larger request bodies are answered with 413 before they are read
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('NSD_MAX_BODY_BYTES', 16 * 1024 * 1024)) or None
+
+# Converted SVGs by content hash; see nsd_cache.NSDCache.from_env for the settings
+result_cache = NSDCache.from_env()
+
+# Per-stage timings of the convert endpoints, exported on /api/metrics.
+# NSD_METRICS=0 turns the collection off, NSD_SERVER_TIMING=1 adds a
+# Server-Timing header with the stages of each response.
+METRICS_ENABLED = os.environ.get('NSD_METRICS', '1') != '0'
+SERVER_TIMING = os.environ.get('NSD_SERVER_TIMING', '0') == '1'
+metrics_registry = MetricsRegistry()
+
+# Live preview sessions (see live_session.py), least recently edited dropped first.
+# They live in this process only; with several workers use sticky sessions.
+live_sessions = LRUCache(max_entries=int(os.environ.get('NSD_LIVE_SESSIONS', 64)), max_bytes=float('inf'))
+
+# Diagrams kept for delta uploads (see graph_session.py), per process like the live sessions
+sync_sessions = LRUCache(max_entries=int(os.environ.get('NSD_SYNC_SESSIONS', 64)), max_bytes=float('inf'))
+
+# Laid-out documents for the page and viewport endpoints, so scrolling
+# through a diagram lays it out once
+paged_documents = LRUCache(max_entries=int(os.environ.get('NSD_PAGED_DOCUMENTS', 16)), max_bytes=float('inf'))
+
+# Response compression: brotli if the client and the installed packages
+# allow it, else gzip. Bodies of responses with an ETag (the cached SVGs)
+# are kept compressed, so repeated exports do not compress again.
+COMPRESS_MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'image/svg+xml', 'text/plain')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+compressed_bodies = LRUCache(max_entries=256, max_bytes=16 * 1024 * 1024)
+
+# Conversions run on a bounded pool with node, depth and time limits (see
+# serving.py); a full queue is answered with 503, a missed deadline with 504
+conversion_limits = ConversionLimits.from_env()
+conversion_pool = ConversionPool.from_env()
+
+# Diagrams of one batch request converted at the same time; the others wait
+# in the request, so a batch of any size holds at most this many SVGs
+BATCH_IN_FLIGHT = int(os.environ.get('NSD_BATCH_IN_FLIGHT', conversion_pool.workers))
+
+# Saved diagrams and their renders (see diagram_store.py), in NSD_STORE_DB.
+# Opened on first use, so running the app does not create the file.
+STORE_PATH = os.environ.get('NSD_STORE_DB', 'struktogramme.db')
+_diagram_store = None
+_diagram_store_lock = threading.Lock()
+
+
+# Editor script and stylesheet, bundled, minified and precompressed (see
+# assets.py) under names that change with their content, so /assets can be
+# cached for a year. Rebuilt when a source file changes.
+ASSET_BUNDLE = os.environ.get('NSD_ASSET_BUNDLE', '1') != '0'
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+_asset_bundle = None
+_asset_sources = None
+_asset_bundle_lock = threading.Lock()
+
+
+def asset_bundle():
+    # None if bundling is off or failed; the page then loads the modules from /static
+    global _asset_bundle, _asset_sources
+    if not ASSET_BUNDLE:
+        return None
+    with _asset_bundle_lock:
+        sources = assets.source_files(app.static_folder)
+        if sources != _asset_sources:
+            _asset_sources = sources
+            try:
+                _asset_bundle = assets.build_assets(app.static_folder)
+            except ValueError as e:
+                app.logger.warning('Serving unbundled assets: %s', e)
+                _asset_bundle = None
+        return _asset_bundle
+
+
+def diagram_store():
+    global _diagram_store
+    with _diagram_store_lock:
+        if _diagram_store is None:
+            _diagram_store = DiagramStore(STORE_PATH)
+        return _diagram_store
+
+
+def _instrumented(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not METRICS_ENABLED:
+            return view(*args, **kwargs)
+        with collect_trace() as trace:
+            with trace_stage('total'):
+                try:
+                    response = app.make_response(view(*args, **kwargs))
+                except ConversionError as e:
+                    response = conversion_error(e)
+        if SERVER_TIMING:
+            # A streamed body is still to come; its stages miss the header
+            response.headers['Server-Timing'] = trace.server_timing()
+        if response.is_streamed:
+            # The body is produced after the view returned, so the request
+            # is recorded once the server has sent all of it
+            endpoint, status = request.endpoint, response.status_code
+            response.response = _traced_chunks(trace, response.response)
+            response.call_on_close(lambda: metrics_registry.observe(trace, endpoint, status))
+        else:
+            metrics_registry.observe(trace, request.endpoint, response.status_code)
+        return response
+    return wrapper
+
+
+def _traced_chunks(trace, chunks):
+    # Produces each chunk of a streamed body inside the request's trace
+    chunks = iter(chunks)
+    try:
+        while True:
+            with collect_trace(trace), trace_stage('total'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def _convert(func):
+    # Runs a conversion on conversion_pool; limit errors reach conversion_error()
+    return conversion_pool.run(func, conversion_limits)
+
+
+@app.errorhandler(ConversionError)
+def conversion_error(e):
+    body = {"error": str(e)}
+    if isinstance(e, UnstructuredFlowchart):
+        # [{"problem", "nodes": [Mermaid id, ...], "count"}, ...]
+        body["problems"] = e.problems
+    response = jsonify(body)
+    response.status_code = e.status
+    if e.status == 503:
+        response.headers['Retry-After'] = '1'
+    return response
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    conversion_pool.count_rejected('too_large')
+    return jsonify({"error": f"Request body larger than {app.config['MAX_CONTENT_LENGTH']} bytes"}), 413
+
+
+def _not_modified(key):
+    # The client sends the ETag of its last result; unchanged input needs no body
+    if request.if_none_match.contains_weak(key):
+        response = Response(status=304)
+        response.set_etag(key)
+        return response
+    return None
+
+
+def _svg_options(data):
+    # {"compact": true, "precision": 1} in the request; {} is the classic output
+    if not data.get('compact'):
+        return {}
+    precision = data.get('precision', COMPACT_PRECISION)
+    if type(precision) is not int or not 0 <= precision <= 4:
+        raise ValueError('precision must be an integer from 0 to 4')
+    return {'compact': True, 'precision': precision}
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, GZIP_LEVEL)
+
+
+def _compress_stream(chunks, encoding):
+    # Flushed after every chunk, so streamed SVGs still arrive piece by piece
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or not response.mimetype.startswith(COMPRESSIBLE_TYPES)):
+        return response
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        encoding = 'br'
+    elif accepted['gzip']:
+        encoding = 'gzip'
+    else:
+        return response
+    response.vary.add('Accept-Encoding')
+
+    etag, _ = response.get_etag()
+    if response.is_streamed:
+        response.response = _compress_stream(response.iter_encoded(), encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        if etag is None:
+            response.set_data(_compress(data, encoding))
+        else:
+            body_key = f'{request.endpoint}:{etag}:{encoding}'
+            body = compressed_bodies.get(body_key)
+            if body is None:
+                body = _compress(data, encoding)
+                compressed_bodies.put(body_key, body)
+            response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    if etag is not None:
+        # The encoded body differs from the uncompressed one
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def _svg_json_response(key, convert):
+    # Cached or freshly converted SVG as {"svg": ...}, tagged with its content hash
+    not_modified = _not_modified(key)
+    if not_modified is not None:
+        return not_modified
+
+    with trace_stage('cache_lookup'):
+        svg_output = result_cache.get(key)
+    if svg_output is None:
+        try:
+            svg_output = _convert(convert)
+        except ConversionError:
+            raise
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        result_cache.put(key, svg_output)
+
+    response = jsonify({"svg": svg_output})
+    response.set_etag(key)
+    return response
+
 
 @app.route('/')
 def index():
-    return render_template('index.html', v=int(time.time()))
+    bundle = asset_bundle()
+    if bundle is None:
+        script_url = url_for('static', filename='js/main.js')
+        style_url = url_for('static', filename='style.css')
+    else:
+        script_url = url_for('asset', name=bundle.urls['app.js'])
+        style_url = url_for('asset', name=bundle.urls['style.css'])
+    html = render_template('index.html', script_url=script_url, style_url=style_url)
+    # The page names the current asset files, so it is revalidated on every load
+    key = hashlib.sha256(html.encode('utf-8')).hexdigest()
+    not_modified = _not_modified(key)
+    if not_modified is None:
+        response = Response(html, mimetype='text/html')
+        response.set_etag(key)
+    else:
+        response = not_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/assets/<name>')
+def asset(name):
+    bundle = asset_bundle()
+    file = bundle.files.get(name) if bundle is not None else None
+    if file is None:
+        return jsonify({"error": "Unknown asset"}), 404
+    accepted = request.accept_encodings
+    encoding = next((coding for coding in ('br', 'gzip') if coding in file.encoded and accepted[coding]), None)
+    # The encoded files differ in their bytes, so each has its own ETag
+    etag = file.etag if encoding is None else f'{file.etag}-{encoding}'
+    response = _not_modified(etag)
+    if response is None:
+        response = Response(file.body if encoding is None else file.encoded[encoding], mimetype=file.mimetype)
+        response.set_etag(etag)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = ASSET_CACHE_CONTROL
+    return response
 
 @app.route('/api/save', methods=['POST'])
 def save_diagram():
+    # {"nodes", "edges", "subprograms"} as in the JSON download, plus optional
+    # "id" (new version of that diagram), "name" and "owner"
     data = request.json
-    print("Received diagram data:", json.dumps(data, indent=2))
-    # Here you would typically save to a database or file
-    return jsonify({"status": "success", "message": "Diagram saved (logged to console)"})
+    try:
+        validate_graph(data)
+        subprograms = data.get('subprograms', {})
+        if not isinstance(subprograms, dict):
+            raise ValueError('subprograms must be an object')
+        for sub_id, sub in subprograms.items():
+            validate_graph(sub)
+            if sub.get('name') is not None and not isinstance(sub['name'], str):
+                raise ValueError(f'name of subprogram {sub_id} must be a string')
+        for field in ('id', 'name', 'owner'):
+            if data.get(field) is not None and not isinstance(data[field], str):
+                raise ValueError(f'{field} must be a string')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    diagram_id, version = diagram_store().save(data, data.get('id'), data.get('name'), data.get('owner'))
+    return jsonify({"status": "success", "id": diagram_id, "version": version})
 
 @app.route('/api/convert_nsd', methods=['POST'])
+@_instrumented
 def convert_nsd():
-    data = request.json
+    with trace_stage('json_decode'):
+        data = request.json
     mermaid_code = data.get('mermaid')
     subprograms = data.get('subprograms', {})
     if not mermaid_code:
         return jsonify({"error": "No mermaid code provided"}), 400
+    try:
+        options = _svg_options(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
+    with trace_stage('cache_key'):
+        key = cache_key(mermaid_code, subprograms, options)
+    return _svg_json_response(key, lambda: convert_mermaid_to_nsd(mermaid_code, subprograms, **options))
+
+@app.route('/api/convert_nsd/graph', methods=['POST'])
+@_instrumented
+def convert_nsd_graph():
+    # The editor's graph format (TreeState.toGraphFormat) instead of Mermaid text
+    with trace_stage('json_decode'):
+        data = request.json
     try:
-        svg_output = convert_mermaid_to_nsd(mermaid_code, subprograms)
-        return jsonify({"svg": svg_output})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        validate_graph(data)
+        options = _svg_options(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    graph = {'nodes': data['nodes'], 'edges': data['edges']}
+    subprograms = data.get('subprograms', {})
+
+    with trace_stage('cache_key'):
+        key = cache_key(graph, subprograms, options)
+    return _svg_json_response(key, lambda: convert_graph_to_nsd(graph, subprograms, **options))
+
+@app.route('/api/convert_nsd/svg', methods=['POST'])
+@_instrumented
+def convert_nsd_svg():
+    # Same input as /api/convert_nsd, but streams the SVG document itself
+    with trace_stage('json_decode'):
+        data = request.json
+    mermaid_code = data.get('mermaid')
+    subprograms = data.get('subprograms', {})
+    if not mermaid_code:
+        return jsonify({"error": "No mermaid code provided"}), 400
+    try:
+        options = _svg_options(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    key = cache_key(mermaid_code, subprograms, options)
+    not_modified = _not_modified(key)
+    if not_modified is not None:
+        return not_modified
+
+    cached = result_cache.get(key)
+    if cached is not None:
+        response = Response(cached, mimetype='image/svg+xml')
+    else:
+        # Misses are streamed and not stored; holding the whole document
+        # would defeat the point of this endpoint
+        chunks = iter_nsd_svg(mermaid_code, subprograms, **options)
+        try:
+            # Layout runs before the first chunk, so errors still get a proper
+            # status; the limits cover it, the remaining chunks are only rendering
+            first = _convert(lambda: next(chunks))
+        except ConversionError:
+            raise
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        response = Response(itertools.chain([first], chunks), mimetype='image/svg+xml')
+    response.set_etag(key)
+    return response
+
+def _document_source(data):
+    # (program, subprograms) of a request with either "mermaid" or a graph
+    if 'nodes' in data:
+        validate_graph(data)
+        source = {'nodes': data['nodes'], 'edges': data['edges']}
+    elif data.get('mermaid'):
+        source = data['mermaid']
+    else:
+        raise ValueError('No mermaid code or graph provided')
+    return source, data.get('subprograms', {})
+
+@app.route('/api/convert_nsd/batch', methods=['POST'])
+@_instrumented
+def convert_nsd_batch():
+    # {"diagrams": [{"id"?, "mermaid" or "nodes"/"edges", "subprograms"?, "compact"?, "precision"?}, ...]}
+    # converted concurrently, streamed as NDJSON in the order they finish: one
+    # {"index", "id", "status": 200, "etag", "svg"} or {"index", "id", "status", "error"}
+    # line per diagram, then {"done": <count>, "errors": <count>}
+    with trace_stage('json_decode'):
+        data = request.json
+    diagrams = data.get('diagrams') if isinstance(data, dict) else None
+    if not isinstance(diagrams, list):
+        return jsonify({"error": "diagrams must be a list"}), 400
+    trace_count('batch_diagrams', len(diagrams))
+
+    # One trace per diagram: they run on several pool threads at once
+    item_traces = []
+
+    def convert_item(item):
+        # Runs on the pool; cache hits only cost the lookup
+        with collect_trace() as trace:
+            item_traces.append(trace)
+            if not isinstance(item, dict):
+                raise ValueError('every diagram must be an object')
+            options = _svg_options(item)
+            source, subprograms = _document_source(item)
+            key = cache_key(source, subprograms, options)
+            svg = result_cache.get(key)
+            if svg is None:
+                convert = convert_mermaid_to_nsd if isinstance(source, str) else convert_graph_to_nsd
+                svg = convert(source, subprograms, **options)
+                result_cache.put(key, svg)
+            return key, svg
+
+    def lines():
+        errors = 0
+        calls = ((k, functools.partial(convert_item, item)) for k, item in enumerate(diagrams))
+        for k, result, error in conversion_pool.run_many(calls, conversion_limits, BATCH_IN_FLIGHT):
+            item = diagrams[k]
+            line = {"index": k, "id": item.get('id') if isinstance(item, dict) else None}
+            if error is None:
+                line["status"] = 200
+                line["etag"], line["svg"] = result
+            else:
+                errors += 1
+                if isinstance(error, ConversionError):
+                    line["status"] = error.status
+                    if isinstance(error, UnstructuredFlowchart):
+                        line["problems"] = error.problems
+                else:
+                    line["status"] = 400 if isinstance(error, ValueError) else 500
+                line["error"] = str(error)
+            yield json.dumps(line) + '\n'
+        for trace in item_traces:
+            trace_merge(trace)
+        yield json.dumps({"done": len(diagrams), "errors": errors}) + '\n'
+
+    return Response(lines(), mimetype='application/x-ndjson')
+
+def _paged_document(data):
+    # The diagram of a page/viewport request, laid out or from paged_documents
+    source, subprograms = _document_source(data)
+    key = cache_key(source, subprograms, {'part': 'document'})
+    doc = paged_documents.get(key)
+    if doc is None:
+        doc = _convert(lambda: load_document(source, subprograms))
+        paged_documents.put(key, doc, size=1)
+    return key, doc
+
+@app.route('/api/convert_nsd/pages', methods=['POST'])
+@_instrumented
+def convert_nsd_pages():
+    # The diagram cut into pages, as NDJSON: first {"width", "height", "pages": [[y_from, y_to], ...]},
+    # then one {"page", "y_from", "y_to", "svg"} line per page, rendered while streaming.
+    # "page_size" ("a4", "a3", "letter") or "page_height" in px (at least MIN_PAGE_HEIGHT);
+    # "pages": [k, ...] selects pages. The conversion timeout covers the whole response:
+    # a page past it ends the stream with {"page", "status": 504, "error"}.
+    limits = conversion_limits.started()
+    with trace_stage('json_decode'):
+        data = request.json
+    try:
+        options = _svg_options(data)
+        page_height = data.get('page_height')
+        if page_height is None:
+            page_size = data.get('page_size', 'a4')
+            if not isinstance(page_size, str) or page_size not in PAGE_HEIGHTS:
+                raise ValueError(f'page_size must be one of {", ".join(PAGE_HEIGHTS)}')
+            page_height = PAGE_HEIGHTS[page_size]
+        elif isinstance(page_height, bool) or not isinstance(page_height, (int, float)):
+            raise ValueError('page_height must be a number')
+        elif page_height < MIN_PAGE_HEIGHT:
+            raise ValueError(f'page_height must be at least {MIN_PAGE_HEIGHT}')
+        selected = data.get('pages')
+        if selected is not None:
+            if not isinstance(selected, list) or not all(type(k) is int for k in selected):
+                raise ValueError('pages must be a list of page numbers')
+            selected = set(selected)
+        with trace_stage('layout'):
+            _, doc = _paged_document(data)
+        with trace_stage('paginate'):
+            breaks = doc.page_breaks(page_height)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    precision = options.get('precision')
+
+    def lines():
+        yield json.dumps({"width": doc.width, "height": doc.height, "pages": breaks}) + '\n'
+        for k, (y_from, y_to) in enumerate(breaks):
+            if selected is not None and k not in selected:
+                continue
+            try:
+                with enforce(limits), trace_stage('render'):
+                    check_deadline()
+                    svg = ''.join(doc.iter_page(y_from, y_to, precision, f'p{k}_'))
+            except ConversionError as e:
+                # The status line went out with the first line; the error ends the stream
+                conversion_pool.count_rejected(e.reason)
+                yield json.dumps({"page": k, "status": e.status, "error": str(e)}) + '\n'
+                return
+            yield json.dumps({"page": k, "y_from": y_from, "y_to": y_to, "svg": svg}) + '\n'
+
+    return Response(lines(), mimetype='application/x-ndjson')
+
+@app.route('/api/convert_nsd/viewport', methods=['POST'])
+@_instrumented
+def convert_nsd_viewport():
+    # Only the blocks between "y_from" and "y_to" (document coordinates) as SVG;
+    # X-Diagram-Width/-Height give the size of the whole diagram
+    with trace_stage('json_decode'):
+        data = request.json
+    try:
+        options = _svg_options(data)
+        y_from = data.get('y_from')
+        y_to = data.get('y_to')
+        if not isinstance(y_from, (int, float)) or not isinstance(y_to, (int, float)):
+            raise ValueError('y_from and y_to must be numbers')
+        with trace_stage('layout'):
+            key, doc = _paged_document(data)
+        etag = f'{key}:{y_from}:{y_to}:{options.get("precision", "-")}'
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+        with trace_stage('render'):
+            svg = doc.viewport(y_from, y_to, options.get('precision'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response = Response(svg, mimetype='image/svg+xml')
+    response.headers['X-Diagram-Width'] = str(doc.width)
+    response.headers['X-Diagram-Height'] = str(doc.height)
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/convert_nsd/layout', methods=['POST'])
+@_instrumented
+def convert_nsd_layout():
+    # The computed layout instead of an SVG, as parallel arrays (see layout_json.py),
+    # for clients that draw the blocks themselves. "precision": decimals, default 2.
+    with trace_stage('json_decode'):
+        data = request.json
+    try:
+        precision = data.get('precision', 2)
+        if type(precision) is not int or not 0 <= precision <= 4:
+            raise ValueError('precision must be an integer from 0 to 4')
+        source, subprograms = _document_source(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with trace_stage('cache_key'):
+        key = cache_key(source, subprograms, {'part': 'layout', 'precision': precision})
+    not_modified = _not_modified(key)
+    if not_modified is not None:
+        return not_modified
+
+    with trace_stage('cache_lookup'):
+        body = result_cache.get(key)
+    if body is None:
+        try:
+            with trace_stage('layout'):
+                _, doc = _paged_document(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        with trace_stage('encode'):
+            body = json.dumps(document_layout(doc, precision), separators=(',', ':'), ensure_ascii=False)
+        result_cache.put(key, body)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(key)
+    return response
+
+@app.route('/api/convert_pap', methods=['POST'])
+@_instrumented
+def convert_pap():
+    # Programmablaufplan of the Mermaid code, laid out on the server (see pap.py)
+    with trace_stage('json_decode'):
+        data = request.json
+    mermaid_code = data.get('mermaid')
+    if not mermaid_code:
+        return jsonify({"error": "No mermaid code provided"}), 400
+
+    with trace_stage('cache_key'):
+        key = cache_key(mermaid_code, None, pap_cache_options())
+    return _svg_json_response(key, lambda: convert_mermaid_to_pap(mermaid_code))
+
+def _sync_response(session_id, version, graph, subprograms, data):
+    # Conversion result of a sync session's diagram, saved in the store if asked for
+    options = _svg_options(data)
+    key = cache_key(graph, subprograms, options)
+    svg = result_cache.get(key)
+    if svg is None:
+        try:
+            svg = _convert(lambda: convert_graph_to_nsd(graph, subprograms, **options))
+        except ConversionError:
+            raise
+        except Exception as e:
+            return jsonify({"error": str(e), "session": session_id, "version": version}), 500
+        result_cache.put(key, svg)
+    result = {"session": session_id, "version": version, "svg": svg}
+
+    save = data.get('save')
+    if isinstance(save, dict):
+        saved_id, saved_version = diagram_store().save(
+            {**graph, 'subprograms': subprograms}, save.get('id'), save.get('name'), save.get('owner'))
+        result["saved"] = {"id": saved_id, "version": saved_version}
+    response = jsonify(result)
+    response.set_etag(key)
+    return response
+
+@app.route('/api/sync', methods=['POST'])
+@_instrumented
+def sync_start():
+    # Full upload: {"nodes", "edges", "subprograms", "compact"?, "save"?: {id?, name?, owner?}}
+    # -> {session, version, svg}; later changes go to /api/sync/<session> as deltas
+    with trace_stage('json_decode'):
+        data = request.json
+    try:
+        session = GraphSession(data, data.get('subprograms'))
+        _svg_options(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    session_id = secrets.token_urlsafe(16)
+    sync_sessions.put(session_id, session, size=1)
+    return _sync_response(session_id, session.version, session.graph(), session.subprograms, data)
+
+@app.route('/api/sync/<session_id>', methods=['POST'])
+@_instrumented
+def sync_delta(session_id):
+    # A delta against "base_version" (see graph_session.py); 409 if the session
+    # moved on, 404 if it expired: the client uploads the whole diagram then
+    session = sync_sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+    with trace_stage('json_decode'):
+        data = request.json
+    if not isinstance(data, dict):
+        return jsonify({"error": "delta must be an object"}), 400
+    with session.lock:
+        try:
+            _svg_options(data)
+            version = session.apply(data)
+        except VersionConflict as e:
+            return jsonify({"error": str(e), "version": session.version}), 409
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        graph = session.graph()
+        subprograms = session.subprograms
+    return _sync_response(session_id, version, graph, subprograms, data)
+
+@app.route('/api/live', methods=['POST'])
+@_instrumented
+def live_start():
+    # Starts a live preview session from {"mermaid": ...} or the graph format
+    data = request.json
+    try:
+        if isinstance(data, dict) and 'nodes' in data:
+            graph = {'nodes': data['nodes'], 'edges': data.get('edges')}
+            session = _convert(lambda: LiveSession.from_graph(graph))
+        elif isinstance(data, dict) and data.get('mermaid'):
+            session = _convert(lambda: LiveSession.from_mermaid(data['mermaid']))
+        else:
+            return jsonify({"error": "No mermaid code or graph provided"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    session_id = secrets.token_urlsafe(16)
+    live_sessions.put(session_id, session, size=1)
+    return jsonify({"session": session_id, "version": session.version, "svg": session.svg()})
+
+@app.route('/api/live/<session_id>/edit', methods=['POST'])
+@_instrumented
+def live_edit(session_id):
+    # {"ops": [...], "mode": "fragments" | "full"}; see live_session.py for the operations
+    session = live_sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+    data = request.json or {}
+    ops = data.get('ops')
+    if not isinstance(ops, list):
+        return jsonify({"error": "No ops provided"}), 400
+    mode = data.get('mode', 'fragments')
+
+    def edit():
+        # On the pool under the conversion limits; the lock is held there, so
+        # an edit past its deadline keeps the session until it stops
+        with session.lock:
+            return session.edit(ops, mode)
+
+    try:
+        result = _convert(edit)
+    except (ValueError, KeyError, TypeError, IndexError) as e:
+        # A half-applied edit leaves the layout inconsistent; the client starts over
+        live_sessions.discard(session_id)
+        return jsonify({"error": str(e)}), 400
+    except ConversionError as e:
+        # Only a full queue is sure to have left the session untouched
+        if not isinstance(e, ServerBusy):
+            live_sessions.discard(session_id)
+        raise
+    return jsonify(result)
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text format: request counts, stage histograms, cache counters
+    memory = result_cache.memory.stats()
+    extra = [
+        ('nsd_cache_entries', 'gauge', 'Entries in the in-memory result cache.', memory['entries']),
+        ('nsd_cache_bytes', 'gauge', 'Size of the in-memory result cache.', memory['bytes']),
+        ('nsd_cache_hits_total', 'counter', 'In-memory result cache hits.', memory['hits']),
+        ('nsd_cache_misses_total', 'counter', 'In-memory result cache misses.', memory['misses']),
+        ('nsd_cache_evictions_total', 'counter', 'In-memory result cache evictions.', memory['evictions']),
+    ]
+    pool = conversion_pool.stats()
+    extra += [
+        ('nsd_convert_running', 'gauge', 'Conversions running on the pool.', pool['running']),
+        ('nsd_convert_queue_depth', 'gauge', 'Conversions waiting for a pool thread.', pool['queued']),
+        ('nsd_convert_completed_total', 'counter', 'Conversions finished on the pool.', pool['completed']),
+    ]
+    for reason, n in sorted(pool['rejected'].items()):
+        extra.append((f'nsd_convert_rejected_{reason}_total', 'counter',
+                      f'Requests rejected or stopped by a limit ({reason.replace("_", " ")}).', n))
+    return Response(metrics_registry.render(extra), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/load', methods=['GET'])
+@_instrumented
 def load_diagram():
-    # Placeholder for loading logic
-    return jsonify({"status": "success", "data": {}})
+    # ?id=...[&version=n][&render=1[&compact=1&precision=p]]; with render the
+    # NSD comes along, from the result cache, the store or converted once
+    args = request.args
+    store = diagram_store()
+    try:
+        version = args.get('version', type=int)
+        options = _svg_options({'compact': args.get('compact') in ('1', 'true'),
+                                'precision': args.get('precision', COMPACT_PRECISION, type=int)})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    data = store.load(args.get('id', ''), version)
+    if data is None:
+        return jsonify({"error": "Unknown diagram or version"}), 404
+    result = {"status": "success", "data": data}
+
+    if args.get('render') in ('1', 'true'):
+        graph = {'nodes': data['nodes'], 'edges': data['edges']}
+        subprograms = data['subprograms']
+        key = cache_key(graph, subprograms, options)
+        svg = result_cache.get(key) or store.renders.get(key)
+        if svg is None:
+            try:
+                svg = _convert(lambda: convert_graph_to_nsd(graph, subprograms, **options))
+            except ConversionError:
+                raise
+            except Exception as e:
+                return jsonify({"error": str(e)}), 500
+            store.renders.put(key, svg)
+        result_cache.put(key, svg)
+        result["svg"] = svg
+    return jsonify(result)
+
+@app.route('/api/diagrams', methods=['GET'])
+def list_diagrams():
+    # ?owner=...&name=<prefix>&limit=100&offset=0, most recently updated first
+    args = request.args
+    try:
+        diagrams = diagram_store().list_diagrams(
+            owner=args.get('owner'), name=args.get('name'),
+            limit=args.get('limit', 100, type=int), offset=args.get('offset', 0, type=int))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"diagrams": diagrams})
+
+@app.route('/api/diagrams/<diagram_id>/versions', methods=['GET'])
+def diagram_versions(diagram_id):
+    versions = diagram_store().versions(diagram_id)
+    if not versions:
+        return jsonify({"error": "Unknown diagram"}), 404
+    return jsonify({"versions": [{"version": v, "saved": saved} for v, saved in versions]})
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
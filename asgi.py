@@ -0,0 +1,8 @@
+# ASGI entry point, e.g. `uvicorn asgi:application`. The Flask app stays
+# synchronous: asgiref runs each request on a thread, conversions go through
+# app.conversion_pool with its limits (see serving.py).
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app
+
+application = WsgiToAsgi(app)
@@ -0,0 +1,339 @@
+"""
+The editor's static assets, built once and served with long-lived caching.
+
+build_assets() turns static/js (ES modules, entry main.js) and
+static/style.css into an AssetBundle:
+- the modules concatenated in dependency order into one module script,
+  the imports between them and the export keywords removed
+- script and stylesheet minified: comments, indentation and blank lines
+  removed. The script keeps its line breaks, so automatic semicolon
+  insertion sees the same statements.
+- names with a content hash (app.3f9c2a1b7d4e.js): a changed file gets a
+  new URL, so every URL can be cached for good
+- gzip and, with the brotli package, brotli variants compressed once here
+
+The bundler knows only the forms the editor's modules use: one
+`import { A, B } from './X.js';` per line and `export` in front of a
+top-level class, function or variable. Anything else raises ValueError.
+
+    python assets.py dist/      writes the files, the .gz/.br variants and manifest.json
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENTRY_MODULE = 'main.js'
+STYLESHEET = 'style.css'
+HASH_LENGTH = 12
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+_IMPORT_RE = re.compile(r'''^import\s*\{([^}]*)\}\s*from\s*['"]\./([\w.-]+\.js)['"]\s*;?[ \t]*$''', re.M)
+_ANY_IMPORT_RE = re.compile(r'^\s*import\b(?!\s*\()', re.M)
+_EXPORT_RE = re.compile(r'^export\s+(?=(?:async\s+)?(?:function|class|const|let|var)\b)', re.M)
+_ANY_EXPORT_RE = re.compile(r'^\s*export\b', re.M)
+_DECLARATION_RE = re.compile(
+    r'^(?:export\s+)?(?:async\s+)?(?:function\*?|class|const|let|var)\s+([A-Za-z_$][\w$]*)', re.M)
+_USE_STRICT_RE = re.compile(r'''^\s*['"]use strict['"];?[ \t]*\n''', re.M)
+
+
+class Asset:
+    """
+    One built file. encoded holds the compressed bodies by content coding
+    ('gzip', 'br'); etag is the content hash.
+    """
+    __slots__ = ('name', 'mimetype', 'body', 'etag', 'encoded')
+
+    def __init__(self, name, mimetype, body):
+        self.name = name
+        self.mimetype = mimetype
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()
+        self.encoded = {'gzip': gzip.compress(body, GZIP_LEVEL, mtime=0)}
+        if brotli is not None:
+            self.encoded['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+
+
+class AssetBundle:
+    """
+    urls:    logical name ('app.js', 'style.css') -> fingerprinted name
+    files:   fingerprinted name -> Asset
+    sources: (path, mtime) of every input, to notice changes
+    """
+
+    def __init__(self, assets, sources):
+        self.urls = {}
+        self.files = {}
+        for logical, asset in assets.items():
+            self.urls[logical] = asset.name
+            self.files[asset.name] = asset
+        self.sources = sources
+
+    def write(self, out_dir):
+        """Writes the files, their .gz/.br variants and manifest.json (logical -> file name)."""
+        os.makedirs(out_dir, exist_ok=True)
+        suffixes = {'gzip': '.gz', 'br': '.br'}
+        for asset in self.files.values():
+            with open(os.path.join(out_dir, asset.name), 'wb') as f:
+                f.write(asset.body)
+            for coding, data in asset.encoded.items():
+                with open(os.path.join(out_dir, asset.name + suffixes[coding]), 'wb') as f:
+                    f.write(data)
+        with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.urls, f, indent=2)
+
+
+def fingerprint(name, body):
+    """app.js -> app.<first HASH_LENGTH hex digits of sha256>.js"""
+    stem, ext = os.path.splitext(name)
+    return f'{stem}.{hashlib.sha256(body).hexdigest()[:HASH_LENGTH]}{ext}'
+
+
+def source_files(static_dir):
+    """(path, mtime) of the inputs; the bundle is stale when this changes."""
+    js_dir = os.path.join(static_dir, 'js')
+    paths = [os.path.join(js_dir, name) for name in sorted(os.listdir(js_dir)) if name.endswith('.js')]
+    paths.append(os.path.join(static_dir, STYLESHEET))
+    return tuple((path, os.stat(path).st_mtime_ns) for path in paths)
+
+
+def bundle_modules(js_dir, entry=ENTRY_MODULE):
+    """The entry module and everything it imports as one script, dependencies first."""
+    modules = {}    # name -> source without imports and export keywords, in dependency order
+    declared = {}   # top-level name -> module declaring it
+    visiting = set()
+
+    def load(name):
+        if name in modules:
+            return
+        if name in visiting:
+            raise ValueError(f'{name}: circular import')
+        visiting.add(name)
+        with open(os.path.join(js_dir, name), encoding='utf-8') as f:
+            source = f.read()
+        exports = set(_DECLARATION_RE.findall(source))
+        for match in _IMPORT_RE.finditer(source):
+            load(match.group(2))
+            for imported in match.group(1).split(','):
+                imported = imported.strip()
+                if imported and declared.get(imported) != match.group(2):
+                    raise ValueError(f'{name}: {match.group(2)} does not export {imported}')
+        source = _IMPORT_RE.sub('', source)
+        if _ANY_IMPORT_RE.search(source):
+            raise ValueError(f'{name}: unsupported import statement')
+        source = _EXPORT_RE.sub('', source)
+        if _ANY_EXPORT_RE.search(source):
+            raise ValueError(f'{name}: unsupported export statement')
+        for top_level in exports:
+            if top_level in declared:
+                raise ValueError(f'{name}: {top_level} is also declared in {declared[top_level]}')
+            declared[top_level] = name
+        modules[name] = _USE_STRICT_RE.sub('', source)
+        visiting.discard(name)
+
+    load(entry)
+    return ''.join(f'// {name}\n{source.rstrip()}\n' for name, source in modules.items())
+
+
+# Characters after which a '/' starts a regular expression rather than a division
+_REGEX_AFTER = frozenset('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = frozenset(('return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new',
+                             'delete', 'void', 'throw', 'yield', 'await', 'instanceof'))
+_SPACE_RUN_RE = re.compile(r'[ \t]+')
+# A space next to these is never needed ('+', '-', '/' and '.' are left alone:
+# "a + +b", "a / /re/" and "1 .x" would change)
+_PUNCTUATION_SPACE_RE = re.compile(r' ?([{}()\[\],;:=<>!?&|*%^~]) ?')
+_IDENTIFIER_END_RE = re.compile(r'[\w$]+$')
+
+
+def _compact_code(code):
+    # Line breaks stay, everything else is reduced to what separates tokens
+    lines = []
+    for line in code.split('\n'):
+        line = _SPACE_RUN_RE.sub(' ', line)
+        line = _PUNCTUATION_SPACE_RE.sub(r'\1', line)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def _skip_string(src, i, quote):
+    j = i + 1
+    while src[j] != quote:
+        j += 2 if src[j] == '\\' else 1
+    return j + 1
+
+
+def _skip_regex(src, i):
+    j = i + 1
+    in_class = False
+    while True:
+        c = src[j]
+        if c == '\\':
+            j += 2
+            continue
+        if c == '[':
+            in_class = True
+        elif c == ']':
+            in_class = False
+        elif c == '/' and not in_class:
+            break
+        elif c == '\n':
+            raise ValueError(f'unterminated regular expression at offset {i}')
+        j += 1
+    j += 1
+    while j < len(src) and (src[j].isalnum() or src[j] in '_$'):
+        j += 1
+    return j
+
+
+def _skip_template(src, i):
+    # From '`' or the '}' closing a substitution to the closing '`' or the
+    # next '${'. Returns (end, opens a substitution).
+    j = i + 1
+    while True:
+        c = src[j]
+        if c == '\\':
+            j += 2
+        elif c == '`':
+            return j + 1, False
+        elif c == '$' and src[j + 1] == '{':
+            return j + 2, True
+        else:
+            j += 1
+
+
+def minify_js(src):
+    """
+    Removes comments, indentation, blank lines and spaces between tokens
+    that do not need them. Strings, template literals and regular
+    expressions are copied as they are.
+    """
+    pieces = []             # (is code, text)
+    substitutions = []      # brace depth at each open '${' of a template literal
+    depth = 0
+    i = code_start = 0
+    n = len(src)
+
+    def flush(end):
+        if end > code_start:
+            pieces.append((True, src[code_start:end]))
+
+    def regex_allowed(end):
+        before = src[code_start:end].rstrip()
+        if not before:
+            # Right after a literal: an operand, so a division
+            if pieces and not pieces[-1][0]:
+                return False
+            before = ''.join(text for _, text in pieces[-2:]).rstrip()
+            if not before:
+                return True
+        if before[-1] in _REGEX_AFTER:
+            return True
+        word = _IDENTIFIER_END_RE.search(before)
+        return word is not None and word.group() in _REGEX_KEYWORDS
+
+    while i < n:
+        c = src[i]
+        if c == '"' or c == "'":
+            flush(i)
+            j = _skip_string(src, i, c)
+            pieces.append((False, src[i:j]))
+            i = code_start = j
+        elif c == '`' or (c == '}' and substitutions and substitutions[-1] == depth):
+            if c == '}':
+                substitutions.pop()
+            flush(i)
+            j, opens = _skip_template(src, i)
+            if opens:
+                substitutions.append(depth)
+            pieces.append((False, src[i:j]))
+            i = code_start = j
+        elif c == '{':
+            depth += 1
+            i += 1
+        elif c == '}':
+            depth -= 1
+            i += 1
+        elif c == '/' and i + 1 < n and src[i + 1] == '/':
+            flush(i)
+            j = src.find('\n', i)
+            i = code_start = n if j < 0 else j
+        elif c == '/' and i + 1 < n and src[i + 1] == '*':
+            flush(i)
+            j = src.index('*/', i + 2) + 2
+            # A comment spanning lines still ends a line
+            pieces.append((True, '\n' if '\n' in src[i:j] else ' '))
+            i = code_start = j
+        elif c == '/' and regex_allowed(i):
+            flush(i)
+            j = _skip_regex(src, i)
+            pieces.append((False, src[i:j]))
+            i = code_start = j
+        else:
+            i += 1
+    flush(n)
+
+    out = []
+    for is_code, text in pieces:
+        if is_code:
+            text = _compact_code(text)
+        if out and text and (out[-1][-1:].isalnum() or out[-1][-1:] in '_$') \
+                and (text[0].isalnum() or text[0] in '_$'):
+            # Two words would run together
+            out.append(' ')
+        out.append(text)
+    # Blank lines and leading and trailing spaces go at the end, when the pieces are joined
+    lines = (line.strip() for line in ''.join(out).split('\n'))
+    return '\n'.join(line for line in lines if line) + '\n'
+
+
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACE_RE = re.compile(r'\s+')
+# Spaces before ':' separate selectors from pseudo classes ("a :hover"), only those after go
+_CSS_PUNCTUATION_RE = re.compile(r' ?([{};,>]) ?|(:) ')
+
+
+def minify_css(src):
+    """Removes comments and whitespace that does not separate anything."""
+    src = _CSS_COMMENT_RE.sub('', src)
+    src = _CSS_SPACE_RE.sub(' ', src)
+    src = _CSS_PUNCTUATION_RE.sub(lambda m: m.group(1) or m.group(2), src)
+    return src.replace(';}', '}').strip() + '\n'
+
+
+def build_assets(static_dir):
+    """Bundles, minifies, fingerprints and compresses the assets in static_dir."""
+    sources = source_files(static_dir)
+    script = minify_js(bundle_modules(os.path.join(static_dir, 'js'))).encode('utf-8')
+    with open(os.path.join(static_dir, STYLESHEET), encoding='utf-8') as f:
+        style = minify_css(f.read()).encode('utf-8')
+    return AssetBundle({
+        'app.js': Asset(fingerprint('app.js', script), 'text/javascript', script),
+        'style.css': Asset(fingerprint('style.css', style), 'text/css', style),
+    }, sources)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print('usage: python assets.py OUT_DIR', file=sys.stderr)
+        return 2
+    bundle = build_assets(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+    bundle.write(argv[0])
+    for logical, name in bundle.urls.items():
+        asset = bundle.files[name]
+        sizes = ', '.join(f'{coding} {len(data)}' for coding, data in asset.encoded.items())
+        print(f'{logical} -> {name} ({len(asset.body)} bytes; {sizes})')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+Batch conversion of diagram files to NSD SVGs.
+
+    python batch_convert.py course/ extra/*.mmd -o public/svg -j 4
+    python converter.py course/            (same command line)
+
+Inputs are files, glob patterns or directories (searched recursively for
+.mmd and editor .json files). Each diagram is written as <name>.svg, next
+to its input or under --out-dir with the same relative path. A manifest of
+content hashes lets later runs skip inputs whose output is up to date.
+
+Deliberately imports nothing from the web app, so startup stays fast.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from compact_svg import COMPACT_PRECISION
+from converter import write_nsd_svg, write_nsd_svg_from_graph
+from nsd_cache import cache_key
+
+INPUT_SUFFIXES = ('.mmd', '.json')
+MANIFEST_NAME = '.nsd_manifest.json'
+
+
+def find_inputs(patterns):
+    """Expands files, globs and directories into a sorted list of input paths."""
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for dirpath, dirnames, filenames in os.walk(pattern):
+                dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+                for name in filenames:
+                    if name.endswith(INPUT_SUFFIXES) and name != MANIFEST_NAME:
+                        found.add(os.path.join(dirpath, name))
+        elif glob.has_magic(pattern):
+            found.update(p for p in glob.glob(pattern, recursive=True)
+                         if os.path.isfile(p) and p.endswith(INPUT_SUFFIXES))
+        elif os.path.isfile(pattern):
+            found.add(pattern)
+        else:
+            raise FileNotFoundError(pattern)
+    return sorted(found)
+
+
+def load_diagram(path):
+    """
+    Reads an input file. Returns (kind, source, subprograms) with kind
+    'mermaid' (source is the text) or 'graph' (source is {nodes, edges}).
+    """
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    if not path.endswith('.json'):
+        return 'mermaid', text, None
+
+    # Editor file (ExportManager.saveJSON): the main graph plus subprogram graphs by subRef
+    data = json.loads(text)
+    if not isinstance(data, dict) or 'nodes' not in data or 'edges' not in data:
+        raise ValueError('not an editor diagram (no nodes/edges)')
+    graph = {'nodes': data['nodes'], 'edges': data['edges']}
+    stored = data.get('subprograms') or {}
+    subprograms = {}
+    # Like exportNSD: only referenced subprograms, named after their call
+    for node in data['nodes']:
+        ref = node.get('subRef')
+        if ref and ref in stored and ref not in subprograms:
+            subprograms[ref] = {'name': node.get('text') or ref, **stored[ref]}
+    return 'graph', graph, subprograms
+
+
+def output_path(path, out_dir, base):
+    stem = os.path.splitext(path)[0] + '.svg'
+    if out_dir is None:
+        return stem
+    return os.path.join(out_dir, os.path.relpath(stem, base))
+
+
+def _write_atomic(path, write):
+    # Readers never see a half-written file: write next to it, then rename
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def convert_file(job):
+    """
+    Worker: converts one input. job is (input path, output path, options)
+    with options the keyword arguments compact and precision.
+    Returns (input path, key, seconds, input bytes, error message or None).
+    """
+    path, out_path, options = job
+    t0 = time.perf_counter()
+    try:
+        kind, source, subprograms = load_diagram(path)
+        key = cache_key(source, subprograms, options)
+        if kind == 'mermaid':
+            _write_atomic(out_path, lambda f: write_nsd_svg(f, source, subprograms, workers=1, **options))
+        else:
+            _write_atomic(out_path, lambda f: write_nsd_svg_from_graph(f, source, subprograms, workers=1, **options))
+    except Exception as e:
+        return path, None, time.perf_counter() - t0, 0, f'{type(e).__name__}: {e}'
+    return path, key, time.perf_counter() - t0, os.path.getsize(path), None
+
+
+def load_manifest(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def run(patterns, out_dir=None, jobs=None, force=False, manifest_path=None, quiet=False,
+        compact=False, precision=COMPACT_PRECISION):
+    """Converts all inputs; returns (converted, skipped, failures)."""
+    t0 = time.perf_counter()
+    # Part of the manifest hash, so switching the output format converts again
+    options = {'compact': compact, 'precision': precision}
+    inputs = find_inputs(patterns)
+    base = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in inputs]) if inputs else '.'
+    if manifest_path is None:
+        manifest_path = os.path.join(out_dir or '.', MANIFEST_NAME)
+    manifest = {} if force else load_manifest(manifest_path)
+
+    todo = []
+    skipped = 0
+    for path in inputs:
+        out_path = output_path(os.path.abspath(path), out_dir and os.path.abspath(out_dir), base)
+        entry = manifest.get(os.path.abspath(path))
+        if entry is not None and os.path.exists(out_path):
+            try:
+                kind, source, subprograms = load_diagram(path)
+                if entry.get('hash') == cache_key(source, subprograms, options) and entry.get('output') == out_path:
+                    skipped += 1
+                    continue
+            except Exception:
+                pass  # converted again below, which reports the error
+        todo.append((path, out_path, options))
+
+    converted = 0
+    input_bytes = 0
+    failures = []
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(convert_file, todo, chunksize=max(1, len(todo) // (jobs * 4))))
+    else:
+        results = [convert_file(job) for job in todo]
+
+    for (path, key, seconds, size, error), (_, out_path, _) in zip(results, todo):
+        if error is not None:
+            failures.append((path, error))
+            manifest.pop(os.path.abspath(path), None)
+            continue
+        converted += 1
+        input_bytes += size
+        manifest[os.path.abspath(path)] = {'hash': key, 'output': out_path}
+        if not quiet:
+            print(f'  {path} -> {out_path} ({seconds * 1000:.0f} ms)')
+
+    _write_atomic(manifest_path, lambda f: json.dump(manifest, f, indent=1, sort_keys=True))
+
+    elapsed = time.perf_counter() - t0
+    print(f'{len(inputs)} inputs: {converted} converted, {skipped} unchanged, {len(failures)} failed '
+          f'in {elapsed:.2f} s ({converted / elapsed if elapsed else 0:.1f} files/s, '
+          f'{input_bytes / 2**20 / elapsed if elapsed else 0:.2f} MiB/s)')
+    for path, error in failures:
+        print(f'  FAILED {path}: {error}', file=sys.stderr)
+    return converted, skipped, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert Mermaid (.mmd) and editor (.json) diagrams to NSD SVGs')
+    parser.add_argument('inputs', nargs='+', help='files, glob patterns or directories')
+    parser.add_argument('-o', '--out-dir', help='output directory (default: next to each input)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('-f', '--force', action='store_true', help='ignore the manifest and convert everything')
+    parser.add_argument('--manifest', help=f'manifest file (default: {MANIFEST_NAME} in the output directory)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='only print the summary')
+    parser.add_argument('--compact', action='store_true', help='compact SVG (shared styles and shapes, rounded coordinates)')
+    parser.add_argument('--precision', type=int, default=COMPACT_PRECISION,
+                        help=f'decimals of coordinates with --compact (default: {COMPACT_PRECISION})')
+    args = parser.parse_args(argv)
+
+    try:
+        _, _, failures = run(args.inputs, args.out_dir, args.jobs, args.force, args.manifest, args.quiet,
+                             args.compact, args.precision)
+    except FileNotFoundError as e:
+        parser.error(f'no such file or directory: {e}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
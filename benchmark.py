@@ -0,0 +1,664 @@
+"""
+Performance benchmarks for the NSD converter.
+
+    python benchmark.py parse --lines 50000
+    python benchmark.py graph --nodes 100000
+    python benchmark.py startup
+    python benchmark.py render --blocks 1000 10000 100000
+    python benchmark.py subprograms --count 50 --workers 1 4
+    python benchmark.py suite --sizes 1000 10000 100000 --output results.json
+    python benchmark.py compare old.json results.json
+"""
+import argparse
+import datetime
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import converter
+from graph_json import build_structure_from_graph
+from layout import MIN_DIAGRAM_WIDTH, arrange_blocks, count_blocks, measure_blocks
+
+
+def make_flowchart(n_lines):
+    """
+    Builds editor-style Mermaid text with roughly n_lines lines:
+    a chain of loops, each containing an if/else with one command per branch.
+    """
+    defs = ['flowchart TD',
+            'classDef default fill:#fff,stroke:#000,stroke-width:1px;',
+            'start_node_id([Start])']
+    edges = []
+    prev, prev_label = 'start_node_id', ''
+    i = 0
+    # Each section adds 5 node lines and 7 edge lines
+    while len(defs) + len(edges) + 13 < n_lines:
+        loop, dec, yes, no, after = (f'n{i}_{k}' for k in ('loop', 'dec', 'yes', 'no', 'after'))
+        defs.append(f'{loop}(["i = 0 to {i}"])')
+        defs.append(f'{dec}{{"wert {i} > grenze"}}')
+        defs.append(f'{yes}["summe = summe + {i}"]')
+        defs.append(f'{no}[["ausgabe({i})"]]')
+        defs.append(f'{after}["zaehler = {i}"]')
+        edges.append(f'{prev} -->{prev_label} {loop}')
+        edges.append(f'{loop} --> {dec}')
+        edges.append(f'{dec} -->|Ja| {yes}')
+        edges.append(f'{dec} -->|Nein| {no}')
+        edges.append(f'{yes} --> {loop}')
+        edges.append(f'{no} --> {loop}')
+        edges.append(f'{loop} -->|Exit| {after}')
+        prev, prev_label = after, ''
+        i += 1
+    defs.append('end_node_id([End])')
+    edges.append(f'{prev} --> end_node_id')
+    return '\n'.join(defs + edges) + '\n'
+
+
+# ── Synthetic programs ────────────────────────────────────────
+
+LOOP_TYPES = ('for_loop', 'while_loop', 'repeat_loop')
+_WORDS = ('x', 'y', 'zaehler', 'summe', 'ausgabe', 'lies', 'wert', 'i', 'j', 'wenn',
+          'dann', 'led', 'pin', 'setze', 'warte', 'toggle', 'grenze', 'messwert')
+
+
+def _make_label(rnd, label_len):
+    words = []
+    length = -1
+    while length < label_len:
+        word = rnd.choice(_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)
+
+
+def make_program(size, depth=4, fanout=3, label_len=20, seed=0):
+    """
+    Random editor program in TreeState shape with `size` statements, nested
+    at most `depth` levels. If/else has two branches, a case `fanout`
+    branches; labels are about label_len characters long.
+    """
+    rnd = random.Random(seed)
+    ids = itertools.count()
+    root = []
+    # Sequences statements can go into, with their nesting level
+    open_seqs = [(root, 0)]
+    for _ in range(size):
+        # The newest sequence half of the time, so the requested depth is reached
+        seq, level = open_seqs[-1] if rnd.random() < 0.5 else rnd.choice(open_seqs)
+        node = {'id': f'n{next(ids)}', 'text': _make_label(rnd, label_len)}
+        r = rnd.random()
+        if level >= depth:
+            r = 0.4 + r * 0.6
+        if r < 0.15:
+            node['type'] = 'if_else'
+            node['branches'] = [{'label': 'Ja', 'children': []}, {'label': 'Nein', 'children': []}]
+        elif r < 0.25:
+            node['type'] = 'case'
+            node['branches'] = [{'label': str(k + 1) if k < fanout - 1 else 'sonst', 'children': []}
+                                for k in range(max(fanout, 2))]
+        elif r < 0.4:
+            node['type'] = rnd.choice(LOOP_TYPES)
+            node['children'] = []
+            open_seqs.append((node['children'], level + 1))
+        elif r < 0.48:
+            node['type'] = 'subprogram'
+        else:
+            node['type'] = 'command'
+        for branch in node.get('branches', ()):
+            open_seqs.append((branch['children'], level + 1))
+        seq.append(node)
+    return root
+
+
+def program_to_graph(root):
+    """Graph format as produced by TreeState.toGraphFormat, built without recursion."""
+    nodes = [{'id': 'start_node_id', 'type': 'start', 'text': 'Start'},
+             {'id': 'end_node_id', 'type': 'end', 'text': 'End'}]
+    edges = []
+    # (sequence, entry, exit, is loop body); each node's own edges are added
+    # before its successor edge, which is the order the converters rely on
+    work = [(root, 'start_node_id', 'end_node_id', False)]
+    while work:
+        seq, prev, exit_id, is_body = work.pop()
+        prev_is_loop = False
+        for node in seq:
+            node_id, t = node['id'], node['type']
+            nodes.append({'id': node_id, 'type': t, 'text': node['text']})
+            next_prev = node_id
+            if t in LOOP_TYPES:
+                body = node_id + '_body_dummy'
+                nodes.append({'id': body, 'type': 'join', 'text': ' '})
+                edges.append({'from': node_id, 'to': body})
+                work.append((node['children'], body, node_id, True))
+            elif t in ('if_else', 'case'):
+                merge = next_prev = node_id + '_merge'
+                nodes.append({'id': merge, 'type': 'join', 'text': ' '})
+                for k, branch in enumerate(node['branches']):
+                    if t == 'if_else':
+                        dummy = node_id + ('_true_dummy' if k == 0 else '_false_dummy')
+                    else:
+                        dummy = f'{node_id}_case_{k}'
+                    nodes.append({'id': dummy, 'type': 'join', 'text': ' '})
+                    edges.append({'from': node_id, 'to': dummy, 'label': branch['label']})
+                    work.append((branch['children'], dummy, merge, False))
+            edge = {'from': prev, 'to': node_id}
+            if prev_is_loop:
+                edge['label'] = 'Exit'
+            edges.append(edge)
+            prev, prev_is_loop = next_prev, t in LOOP_TYPES
+        edge = {'from': prev, 'to': exit_id}
+        if prev_is_loop and not is_body:
+            edge['label'] = 'Exit'
+        edges.append(edge)
+    return {'nodes': nodes, 'edges': edges}
+
+
+def graph_to_mermaid(graph):
+    """Mermaid text as MermaidGenerator._generateFromTreeState writes it."""
+    node_map = {n['id']: n for n in graph['nodes']}
+    fwd = {}
+    for e in graph['edges']:
+        fwd.setdefault(e['from'], []).append(e)
+
+    reachable = {}
+    queue = ['start_node_id']
+    for node_id in queue:
+        if node_id not in reachable:
+            reachable[node_id] = True
+            queue.extend(e['to'] for e in fwd.get(node_id, ()))
+
+    out = ['flowchart TD',
+           'classDef default fill:#fff,stroke:#000,stroke-width:1px;',
+           'classDef join fill:#fff,stroke:#000,stroke-width:0px;']
+    for node_id in reachable:
+        n = node_map.get(node_id)
+        if not n or n['type'] == 'join':
+            continue
+        label = (n.get('text') or '').replace('"', "'")
+        t = n['type']
+        if t == 'start':
+            out.append(f'{node_id}([Start])')
+        elif t == 'end':
+            out.append(f'{node_id}([End])')
+        elif t in ('if_else', 'case'):
+            out.append(f'{node_id}{{"{label}"}}')
+        elif t in LOOP_TYPES:
+            out.append(f'{node_id}(["{label}"])')
+        elif t == 'subprogram':
+            out.append(f'{node_id}[["{label}"]]')
+        else:
+            out.append(f'{node_id}["{label}"]')
+
+    def resolve_join(node_id):
+        seen = {node_id}
+        while True:
+            succ = fwd.get(node_id)
+            if not succ or succ[0]['to'] not in node_map:
+                return None
+            node_id = succ[0]['to']
+            if node_map[node_id]['type'] != 'join':
+                return node_id
+            if node_id in seen:
+                return None
+            seen.add(node_id)
+
+    for node_id in reachable:
+        n = node_map.get(node_id)
+        if not n or n['type'] == 'join':
+            continue
+        for e in fwd.get(node_id, ()):
+            target = e['to']
+            if target in node_map and node_map[target]['type'] == 'join':
+                target = resolve_join(target)
+                if target is None:
+                    continue
+            label = e.get('label') or ''
+            out.append(f"{node_id} -->{'|' + label + '|' if label else ''} {target}")
+    return '\n'.join(out) + '\n'
+
+
+def make_diagram(size, depth=4, fanout=3, label_len=20, subprograms=0, sub_size=50, seed=0):
+    """
+    A synthetic diagram in both input formats. Returns
+    (graph, mermaid, graph_subprograms, mermaid_subprograms).
+    """
+    graph = program_to_graph(make_program(size, depth, fanout, label_len, seed))
+    graph_subs = {}
+    mermaid_subs = {}
+    for k in range(subprograms):
+        sub_graph = program_to_graph(make_program(sub_size, depth, fanout, label_len, seed + 1 + k))
+        name = f'unterprogramm_{k}'
+        graph_subs[f'sub{k}'] = {'name': name, **sub_graph}
+        mermaid_subs[f'sub{k}'] = {'name': name, 'mermaid': graph_to_mermaid(sub_graph)}
+    return graph, graph_to_mermaid(graph), graph_subs, mermaid_subs
+
+
+def _legacy_parse_mermaid(content):
+    """The line/split/re.match parser the converter used before mermaid_parser."""
+    import networkx as nx
+    G = nx.DiGraph()
+    lines = content.split('\n')
+
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('graph') or line.startswith('flowchart') or line.startswith('classDef') or line.startswith('%%') or line.startswith('subgraph'):
+            continue
+
+        if '-->' in line:
+            parts = line.split('-->')
+            left_part = parts[0].strip()
+            right_part = parts[1].strip()
+
+            left_id, left_label, left_type = _legacy_parse_node_str(left_part)
+            if left_id:
+                if left_id not in G:
+                    G.add_node(left_id, label=left_label, type=left_type)
+                elif left_label != left_id:
+                    G.nodes[left_id]['label'] = left_label
+                    G.nodes[left_id]['type'] = left_type
+
+            edge_label = ""
+            if right_part.startswith('|'):
+                end_pipe = right_part.find('|', 1)
+                if end_pipe != -1:
+                    edge_label = right_part[1:end_pipe]
+                    right_part = right_part[end_pipe+1:].strip()
+
+            right_id, right_label, right_type = _legacy_parse_node_str(right_part)
+            if right_id:
+                if right_id not in G:
+                    G.add_node(right_id, label=right_label, type=right_type)
+                elif right_label != right_id:
+                    G.nodes[right_id]['label'] = right_label
+                    G.nodes[right_id]['type'] = right_type
+
+            if left_id and right_id:
+                G.add_edge(left_id, right_id, label=edge_label)
+        else:
+            node_id, node_label, node_type = _legacy_parse_node_str(line)
+            if node_id:
+                if node_id not in G:
+                    G.add_node(node_id, label=node_label, type=node_type)
+                elif node_label != node_id:
+                    G.nodes[node_id]['label'] = node_label
+                    G.nodes[node_id]['type'] = node_type
+
+    start_node = None
+    for node in G.nodes:
+        if G.in_degree(node) == 0:
+            start_node = node
+            break
+    if not start_node and len(G.nodes) > 0:
+        start_node = list(G.nodes)[0]
+
+    return G, start_node
+
+
+def _legacy_parse_node_str(node_str):
+    m = re.match(r'(\w+)\s*(\[\[".*?"\]\]|\[".*?"\]|\{".*?"\}|\(\[".*?"\]\)|\(\(".*?"\)\)|\(\[.*?\]\))?', node_str)
+    if not m: return None, None, None
+    node_id = m.group(1)
+    rest = m.group(2)
+    label = node_id
+    node_type = 'process'
+    if rest:
+        if rest.startswith('[["'):  label = rest[3:-3]; node_type = 'subprogram'
+        elif rest.startswith('["'): label = rest[2:-2]; node_type = 'process'
+        elif rest.startswith('{"'): label = rest[2:-2]; node_type = 'decision'
+        elif rest.startswith('(["'): label = rest[3:-3]; node_type = 'terminal'
+        elif rest.startswith('(("'): label = rest[3:-3]; node_type = 'loop'
+        elif rest.startswith('(['): label = rest[2:-2]; node_type = 'terminal'
+    return node_id, label, node_type
+
+
+def _best_time(func, arg, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(arg)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+def bench_parse(n_lines, repeat):
+    text = make_flowchart(n_lines)
+    lines = text.count('\n')
+    print(f'parse_mermaid: {lines} lines, best of {repeat}')
+
+    parsers = [('current', converter.parse_mermaid)]
+    try:
+        import networkx  # noqa: F401
+        parsers.insert(0, ('legacy', _legacy_parse_mermaid))
+    except ImportError:
+        print('  (networkx not installed, skipping legacy parser)')
+
+    results = {}
+    for name, func in parsers:
+        dt = _best_time(func, text, repeat)
+        results[name] = dt
+        print(f'  {name:<8} {dt * 1000:9.1f} ms  {lines / dt:12,.0f} lines/s')
+    if 'legacy' in results:
+        print(f'  speedup  {results["legacy"] / results["current"]:9.2f}x')
+
+
+def _retained_bytes(func, arg):
+    """Memory still allocated by func(arg)'s result, measured with tracemalloc."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = func(arg)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return after - before, peak - before
+
+
+def bench_graph(n_nodes):
+    # make_flowchart emits 5 nodes per 12 lines
+    text = make_flowchart(n_nodes * 12 // 5)
+    graph, _ = converter.parse_mermaid(text)
+    nodes = len(graph)
+    edges = len(graph.succ_nodes)
+    print(f'graph memory: {nodes} nodes, {edges} edges (per 100k nodes)')
+
+    builders = [('FlowGraph', converter.parse_mermaid)]
+    try:
+        import networkx  # noqa: F401
+        builders.insert(0, ('networkx', _legacy_parse_mermaid))
+    except ImportError:
+        print('  (networkx not installed, skipping networkx graph)')
+
+    for name, func in builders:
+        retained, peak = _retained_bytes(func, text)
+        scale = 100000 / nodes
+        print(f'  {name:<10} retained {retained * scale / 2**20:8.1f} MiB   peak {peak * scale / 2**20:8.1f} MiB')
+
+
+def _startup_time(code, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+def bench_startup(repeat):
+    print(f'process startup, best of {repeat}')
+    cases = [('python', 'pass'), ('import converter', 'import converter')]
+    try:
+        import networkx  # noqa: F401
+        cases.append(('import networkx', 'import networkx'))
+    except ImportError:
+        print('  (networkx not installed, skipping)')
+    for name, code in cases:
+        dt = _startup_time(code, repeat)
+        print(f'  {name:<18} {dt * 1000:8.1f} ms')
+
+
+def _max_rss_mib():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _render_once(n_blocks, mode):
+    """Runs in a fresh process so ru_maxrss only reflects this render."""
+    # make_flowchart yields 5 blocks per 12 lines
+    text = make_flowchart(n_blocks * 12 // 5)
+    graph, start = converter.parse_mermaid(text)
+    tree = converter.build_structure(graph, start, None)
+    converter.layout_blocks(tree)
+    del text, graph
+
+    rss_before = _max_rss_mib()
+    t0 = time.perf_counter()
+    if mode == 'string':
+        size = len(converter.render_blocks(tree))
+    else:
+        size = 0
+        with open(os.devnull, 'w') as out:
+            for piece in converter.iter_render_blocks(tree):
+                out.write(piece)
+                size += len(piece)
+    dt = time.perf_counter() - t0
+    print(json.dumps({'seconds': dt, 'bytes': size,
+                      'rss_before': rss_before, 'rss_after': _max_rss_mib()}))
+
+
+def bench_render(block_counts):
+    print('render_blocks: time and peak RSS (MiB) per diagram size')
+    print(f'  {"blocks":>8} {"mode":<7} {"time":>9} {"output":>9} {"peak RSS":>9} {"render +":>9}')
+    for n_blocks in block_counts:
+        for mode in ('string', 'stream'):
+            out = subprocess.run(
+                [sys.executable, __file__, '_render_once', str(n_blocks), mode],
+                check=True, capture_output=True, text=True).stdout
+            r = json.loads(out)
+            print(f'  {n_blocks:>8} {mode:<7} {r["seconds"] * 1000:7.0f}ms '
+                  f'{r["bytes"] / 2**20:6.1f}MiB {r["rss_after"]:9.1f} {r["rss_after"] - r["rss_before"]:9.1f}')
+
+
+def bench_subprograms(count, n_lines, worker_counts, repeat):
+    main_text = make_flowchart(n_lines)
+    # Distinct bodies, so every subprogram is its own cache entry
+    subprograms = {
+        f'sub{j}': {'name': f'unterprogramm_{j}',
+                    'mermaid': make_flowchart(n_lines).replace('summe', f'summe{j}')}
+        for j in range(count)
+    }
+    print(f'{count} subprograms of {n_lines} lines, best of {repeat}')
+    print(f'  {"workers":>7} {"cold":>10} {"main edited":>12}')
+    for workers in worker_counts:
+        # Start the pool outside the timed runs
+        converter.convert_subprograms({'w': {'mermaid': 'a --> b'}, 'w2': {'mermaid': 'c --> d'}}, workers)
+        cold = warm = None
+        for k in range(repeat):
+            converter._fragment_cache.clear()
+            t0 = time.perf_counter()
+            converter.convert_mermaid_to_nsd(main_text, subprograms, workers=workers)
+            dt = time.perf_counter() - t0
+            cold = dt if cold is None else min(cold, dt)
+
+            # Only the main program changed: every subprogram is a cache hit
+            edited = main_text.replace('zaehler = 0', f'zaehler = {k + 1}')
+            t0 = time.perf_counter()
+            converter.convert_mermaid_to_nsd(edited, subprograms, workers=workers)
+            dt = time.perf_counter() - t0
+            warm = dt if warm is None else min(warm, dt)
+        print(f'  {workers:>7} {cold * 1000:8.1f}ms {warm * 1000:10.1f}ms')
+
+
+def _time_stages(fmt, source, subprograms):
+    """One run of the pipeline; returns ({stage: seconds}, blocks, svg characters)."""
+    clock = time.perf_counter
+    times = {}
+    if fmt == 'mermaid':
+        t0 = clock()
+        graph, start = converter.parse_mermaid(source)
+        times['parse_mermaid'] = clock() - t0
+        t0 = clock()
+        tree = converter.build_structure(graph, start, None)
+        times['build_structure'] = clock() - t0
+    else:
+        t0 = clock()
+        tree = build_structure_from_graph(source)
+        times['build_structure_from_graph'] = clock() - t0
+    t0 = clock()
+    width = max(MIN_DIAGRAM_WIDTH, measure_blocks(tree))
+    times['measure_blocks'] = clock() - t0
+    t0 = clock()
+    arrange_blocks(tree, 0, 0, width)
+    times['arrange_blocks'] = clock() - t0
+    t0 = clock()
+    svg_size = len(converter.render_blocks(tree))
+    times['render_blocks'] = clock() - t0
+    if subprograms:
+        converter._fragment_cache.clear()
+        t0 = clock()
+        converter.convert_subprograms(subprograms, workers=1)
+        times['subprograms'] = clock() - t0
+    return times, count_blocks(tree), svg_size
+
+
+def _peak_memory(fmt, source, subprograms):
+    convert = converter.convert_mermaid_to_nsd if fmt == 'mermaid' else converter.convert_graph_to_nsd
+    converter._fragment_cache.clear()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    convert(source, subprograms, workers=1)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak - before
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def bench_suite(args):
+    """Per-stage timings over diagram sizes for both input formats; writes args.output."""
+    params = {k: getattr(args, k) for k in ('sizes', 'depth', 'fanout', 'label_len',
+                                            'subprograms', 'sub_size', 'repeat', 'seed')}
+    results = []
+    print(f'suite: depth {args.depth}, fan-out {args.fanout}, labels {args.label_len} chars, '
+          f'{args.subprograms} subprograms, best of {args.repeat}')
+    for size in args.sizes:
+        graph, mermaid, graph_subs, mermaid_subs = make_diagram(
+            size, args.depth, args.fanout, args.label_len, args.subprograms, args.sub_size, args.seed)
+        for fmt, source, subs in (('mermaid', mermaid, mermaid_subs), ('graph', graph, graph_subs)):
+            best = {}
+            for _ in range(args.repeat):
+                times, blocks, svg_size = _time_stages(fmt, source, subs)
+                for stage, dt in times.items():
+                    best[stage] = min(dt, best.get(stage, dt))
+            total = sum(best.values())
+            input_bytes = len(source) if fmt == 'mermaid' else len(json.dumps(source))
+            peak = _peak_memory(fmt, source, subs)
+            results.append({
+                'format': fmt, 'size': size, 'blocks': blocks,
+                'input_bytes': input_bytes, 'svg_bytes': svg_size,
+                'stages': best, 'total': total,
+                'blocks_per_s': blocks / total, 'peak_bytes': peak,
+            })
+            stages = '  '.join(f'{stage} {dt * 1000:.1f}' for stage, dt in best.items())
+            print(f'  {fmt:<7} {size:>7} {blocks:>7} blocks  {total * 1000:8.1f} ms  '
+                  f'{blocks / total:10,.0f} blocks/s  peak {peak / 2**20:6.1f} MiB')
+            print(f'          ms: {stages}')
+
+    # Scaling exponent between neighbouring sizes: 1.0 is linear
+    print('scaling (time ~ size^k)')
+    for fmt in ('mermaid', 'graph'):
+        rows = [r for r in results if r['format'] == fmt]
+        for a, b in zip(rows, rows[1:]):
+            ratio = math.log(b['blocks'] / a['blocks'])
+            ks = '  '.join(f'{stage} {math.log(b["stages"][stage] / a["stages"][stage]) / ratio:.2f}'
+                           for stage in a['stages'] if a['stages'][stage] > 0 and b['stages'].get(stage))
+            print(f'  {fmt:<7} {a["size"]}->{b["size"]}: {ks}')
+
+    report = {
+        'commit': _git_commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': params,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'results written to {args.output}')
+
+
+def bench_compare(old_path, new_path):
+    """Per-stage time ratio new/old for the rows both result files have."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f'{old.get("commit")} -> {new.get("commit")} (ratio < 1 is faster)')
+    old_rows = {(r['format'], r['size']): r for r in old['results']}
+    for row in new['results']:
+        base = old_rows.get((row['format'], row['size']))
+        if base is None:
+            continue
+        parts = [f'total {row["total"] / base["total"]:.2f}']
+        for stage, dt in row['stages'].items():
+            if base['stages'].get(stage):
+                parts.append(f'{stage} {dt / base["stages"][stage]:.2f}')
+        parts.append(f'peak {row["peak_bytes"] / base["peak_bytes"]:.2f}')
+        print(f'  {row["format"]:<7} {row["size"]:>7}  ' + '  '.join(parts))
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '_render_once':
+        _render_once(int(sys.argv[2]), sys.argv[3])
+        return
+
+    parser = argparse.ArgumentParser(description='NSD converter benchmarks')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('parse', help='Mermaid parsing throughput (lines/s)')
+    p.add_argument('--lines', type=int, default=50000)
+    p.add_argument('--repeat', type=int, default=5)
+
+    p = sub.add_parser('graph', help='graph memory per 100k nodes')
+    p.add_argument('--nodes', type=int, default=100000)
+
+    p = sub.add_parser('startup', help='interpreter start + import time')
+    p.add_argument('--repeat', type=int, default=10)
+
+    p = sub.add_parser('render', help='render time and peak RSS, string vs. streamed')
+    p.add_argument('--blocks', type=int, nargs='+', default=[1000, 10000, 100000])
+
+    p = sub.add_parser('subprograms', help='subprogram conversion, cold cache vs. only main program edited')
+    p.add_argument('--count', type=int, default=50)
+    p.add_argument('--lines', type=int, default=500, help='Mermaid lines per subprogram')
+    p.add_argument('--workers', type=int, nargs='+', default=[1, converter.SUBPROGRAM_WORKERS])
+    p.add_argument('--repeat', type=int, default=3)
+
+    p = sub.add_parser('suite', help='per-stage timings, throughput, peak memory and scaling on synthetic diagrams')
+    p.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='statements per diagram')
+    p.add_argument('--depth', type=int, default=4, help='maximum nesting depth')
+    p.add_argument('--fanout', type=int, default=3, help='branches per case')
+    p.add_argument('--label-len', type=int, default=20, help='characters per label')
+    p.add_argument('--subprograms', type=int, default=0)
+    p.add_argument('--sub-size', type=int, default=50, help='statements per subprogram')
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--output', default='benchmark_results.json')
+
+    p = sub.add_parser('compare', help='compare two suite result files')
+    p.add_argument('old')
+    p.add_argument('new')
+
+    args = parser.parse_args()
+    if args.command == 'parse':
+        bench_parse(args.lines, args.repeat)
+    elif args.command == 'graph':
+        bench_graph(args.nodes)
+    elif args.command == 'startup':
+        bench_startup(args.repeat)
+    elif args.command == 'render':
+        bench_render(args.blocks)
+    elif args.command == 'subprograms':
+        bench_subprograms(args.count, args.lines, args.workers, args.repeat)
+    elif args.command == 'suite':
+        bench_suite(args)
+    elif args.command == 'compare':
+        bench_compare(args.old, args.new)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+Compact SVG output for laid-out block lists.
+
+Produces the same drawing as converter.iter_render_blocks with far fewer
+bytes:
+  - presentation attributes come from one <style> block (STYLE) instead of
+    being repeated on every element; the root element needs class="nsd"
+  - every compound block is a <g transform="translate(...)">, so its
+    contents use small coordinates relative to the block
+  - coordinates are rounded to `precision` decimals; edges are rounded in
+    absolute coordinates first, so adjacent blocks still line up exactly
+  - shapes that occur more than once with the same size (block frames,
+    loop L-shapes, subprogram double frames, decision headers) are drawn
+    once in <defs> and placed with <use>
+"""
+import html
+
+from layout import FONT_SIZE, LINE_HEIGHT, PADDING_Y, SUBPROGRAM_BORDER, child_sequences
+
+COMPACT_PRECISION = 1
+
+# Scoped to .nsd, the preview puts the SVG inline into the editor page
+STYLE = (
+    '<style>'
+    '.nsd rect,.nsd polygon,.nsd line{stroke:#000;stroke-width:1}'
+    '.nsd rect{fill:#fff}.nsd rect.f{fill:none}.nsd polygon{fill:#e2e8f0}'
+    f'.nsd text{{font-size:{FONT_SIZE}px;font-family:Arial,sans-serif}}'
+    '.nsd .m{text-anchor:middle}.nsd .s{font-size:12px}'
+    '.nsd .h{font-size:15px;font-weight:bold}'
+    '</style>'
+)
+
+_COMPOUND_TYPES = frozenset(('decision', 'case', 'loop'))
+
+
+def number_format(precision):
+    """Formats a coordinate with at most `precision` decimals and no trailing zeros."""
+    def num(v):
+        s = f'{v:.{precision}f}'
+        if '.' in s:
+            s = s.rstrip('0').rstrip('.')
+        return '0' if s == '-0' else s
+    return num
+
+
+def _pos(x, y, num):
+    # x="0" and y="0" are the defaults
+    return (f' x="{num(x)}"' if x else '') + (f' y="{num(y)}"' if y else '')
+
+
+def _line(x1, y1, x2, y2, num):
+    return ('<line' + (f' x1="{num(x1)}"' if x1 else '') + (f' y1="{num(y1)}"' if y1 else '')
+            + (f' x2="{num(x2)}"' if x2 else '') + (f' y2="{num(y2)}"' if y2 else '') + '/>')
+
+
+def _column_edges(lay, r, bx):
+    # Column boundaries relative to the block, summed up like arrange_blocks does
+    edges = [0]
+    cx = lay.x
+    for cw in lay.columns:
+        cx += cw
+        edges.append(r(cx) - bx)
+    return edges
+
+
+def _shapes(block, r):
+    """
+    Frames of a block as (key, x, y), relative to its rounded top-left
+    corner. Equal keys draw equal shapes, so they can share one <defs> entry.
+    """
+    lay = block['layout']
+    t = block['type']
+    bx = r(lay.x)
+    by = r(lay.y)
+    w = r(lay.x + lay.width) - bx
+    h = r(lay.y + lay.height) - by
+
+    if t not in _COMPOUND_TYPES:
+        return [(('p' if t == 'subprogram' else 'r', w, h), 0, 0)]
+
+    hh = r(lay.y + lay.header_height) - by
+    if t == 'loop':
+        sp = r(lay.x + lay.columns[0]) - bx
+        return [(('l', w, h, hh, sp), 0, 0), (('r', w - sp, h - hh), sp, hh)]
+
+    edges = _column_edges(lay, r, bx)
+    shapes = [(('d', w, hh, edges[1]) if t == 'decision' else ('r', w, hh), 0, 0)]
+    # Filler below every column that is shorter than the block
+    content_h = lay.height - lay.header_height
+    for k, col_h in enumerate(lay.column_heights):
+        if col_h < content_h:
+            fy = r(lay.y + lay.header_height + col_h) - by
+            shapes.append((('r', edges[k + 1] - edges[k], h - fy), edges[k], fy))
+    return shapes
+
+
+def _draw(key, x, y, num, attr=''):
+    """SVG for one shape at (x, y); attr (e.g. an id) goes on the outer element."""
+    kind = key[0]
+    if kind == 'r':
+        return f'<rect{attr}{_pos(x, y, num)} width="{num(key[1])}" height="{num(key[2])}"/>'
+
+    if kind == 'l':
+        _, w, h, hh, sp = key
+        points = ' '.join(f'{num(x + px)},{num(y + py)}'
+                          for px, py in ((0, 0), (w, 0), (w, hh), (sp, hh), (sp, h), (0, h)))
+        return f'<polygon{attr} points="{points}"/>'
+
+    if kind == 'p':
+        # Doppelter Rahmen
+        _, w, h = key
+        b = SUBPROGRAM_BORDER
+        body = (f'<rect{_pos(x, y, num)} width="{num(w)}" height="{num(h)}"/>'
+                f'<rect class="f"{_pos(x + b, y + b, num)} width="{num(w - 2 * b)}" height="{num(h - 2 * b)}"/>')
+    else:
+        # Decision header: frame and the V to the branch split
+        _, w, hh, sx = key
+        body = (f'<rect{_pos(x, y, num)} width="{num(w)}" height="{num(hh)}"/>'
+                + _line(x, y, x + sx, y + hh, num) + _line(x + w, y, x + sx, y + hh, num))
+    return f'<g{attr}>{body}</g>' if attr else body
+
+
+def _iter_blocks(blocks):
+    stack = list(reversed(blocks))
+    while stack:
+        block = stack.pop()
+        yield block
+        for seq in child_sequences(block):
+            stack.extend(seq)
+
+
+def iter_render_compact(blocks, precision=COMPACT_PRECISION, id_prefix='n'):
+    """
+    Yields the compact SVG of a list of blocks laid out by layout_blocks():
+    a <defs> element with the repeated shapes, then the blocks. Shape ids are
+    id_prefix plus a counter, so fragments that end up in one document need
+    different prefixes. The caller supplies the <svg class="nsd"> root and STYLE.
+    """
+    num = number_format(precision)
+
+    def r(v):
+        return round(v, precision)
+
+    # Pass 1: which shapes occur more than once
+    counts = {}
+    for block in _iter_blocks(blocks):
+        for key, _, _ in _shapes(block, r):
+            counts[key] = counts.get(key, 0) + 1
+    ids = {}
+    defs = []
+    for key, n in counts.items():
+        if n > 1:
+            ids[key] = shape_id = f'{id_prefix}{len(ids):x}'
+            defs.append(_draw(key, 0, 0, num, f' id="{shape_id}"'))
+    if defs:
+        yield '<defs>' + ''.join(defs) + '</defs>'
+
+    def shape(key, x, y):
+        shape_id = ids.get(key)
+        if shape_id is None:
+            return _draw(key, x, y, num)
+        return f'<use href="#{shape_id}"{_pos(x, y, num)}/>'
+
+    # Pass 2: entries are strings or (block, origin x, origin y) with the
+    # rounded absolute origin of the enclosing <g>
+    stack = [(block, 0, 0) for block in reversed(blocks)]
+    while stack:
+        item = stack.pop()
+        if type(item) is str:
+            yield item
+            continue
+
+        block, ox, oy = item
+        lay = block['layout']
+        t = block['type']
+        bx = r(lay.x)
+        by = r(lay.y)
+        shapes = _shapes(block, r)
+
+        if t not in _COMPOUND_TYPES:
+            lx = bx - ox
+            ly = by - oy
+            key = shapes[0][0]
+            yield shape(key, lx, ly)
+            text_y = ly + PADDING_Y + FONT_SIZE / 2
+            if t == 'subprogram':
+                text_x = f' class="m" x="{num(lx + key[1] / 2)}"'
+            else:
+                text_x = f' x="{num(lx + 10)}"'
+            for line in lay.lines:
+                yield f'<text{text_x} y="{num(text_y)}">{html.escape(line)}</text>'
+                text_y += LINE_HEIGHT
+            continue
+
+        yield f'<g transform="translate({num(bx - ox)},{num(by - oy)})">'
+        for key, x, y in shapes:
+            yield shape(key, x, y)
+
+        w = shapes[0][0][1]
+        hh = r(lay.y + lay.header_height) - by
+        label = html.escape(block['label'])
+
+        if t == 'decision':
+            sx = shapes[0][0][3]
+            yield f'<text class="m" x="{num((w / 2 + sx) / 2)}" y="{num(hh / 2)}">{label}</text>'
+            yield f'<text class="m s" x="{num(sx / 2)}" y="{num(hh - 5)}">Ja</text>'
+            yield f'<text class="m s" x="{num((sx + w) / 2)}" y="{num(hh - 5)}">Nein</text>'
+
+        elif t == 'case':
+            edges = _column_edges(lay, r, bx)
+            split_y = hh * 0.6
+            first = edges[1]
+            last = edges[-2]
+            yield f'<text class="m" x="{num(w / 2)}" y="{num(hh * 0.3 + 5)}">{label}</text>'
+            yield _line(0, 0, first, split_y, num)
+            yield _line(w, 0, last, split_y, num)
+            if len(block['branches']) > 2:
+                yield _line(first, split_y, last, split_y, num)
+            for i, branch in enumerate(block['branches']):
+                left = edges[i]
+                right = edges[i + 1]
+                yield f'<text class="m s" x="{num((left + right) / 2)}" y="{num(hh - 5)}">{html.escape(branch["label"])}</text>'
+                if i < len(block['branches']) - 1:
+                    yield _line(right, split_y, right, hh, num)
+
+        else:
+            yield f'<text x="10" y="{num(hh / 2 + 5)}">{label}</text>'
+
+        stack.append('</g>')
+        for seq in reversed(child_sequences(block)):
+            stack.extend((child, bx, by) for child in reversed(seq))
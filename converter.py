@@ -1,687 +1,574 @@
-import networkx as nx
-import re
 import html
-import math
-
-# Constants for layout
-FONT_SIZE = 14
-CHAR_WIDTH_AVG = 8  # Approximate width of a character in pixels
-LINE_HEIGHT = 20
-PADDING_X = 10
-PADDING_Y = 10
-MIN_BLOCK_WIDTH = 100
-
-def convert_mermaid_to_nsd(mermaid_content, subprograms=None):
-    graph, start_node = parse_mermaid(mermaid_content)
-    if not start_node:
-        return '<svg><text>Error: No start node found</text></svg>'
-        
-    structured_tree = build_structure(graph, start_node, None, set())
-    total_min_width = calculate_min_widths(structured_tree)
-    width = max(800, total_min_width)
-    total_height = calculate_heights(structured_tree, width)
-    
-    svg_content = render_blocks(structured_tree, 0, 0, width)
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from compact_svg import COMPACT_PRECISION, STYLE as COMPACT_STYLE, iter_render_compact, number_format
+from flow_analysis import immediate_post_dominators, loop_forest, loop_head, structure_problems
+from flowgraph import FlowGraph
+from graph_json import build_structure_from_graph
+from layout import (
+    FONT_SIZE, LINE_HEIGHT, PADDING_Y, SUBPROGRAM_BORDER,
+    count_blocks, layout_blocks,
+)
+from mermaid_parser import scan_mermaid
+from metrics import trace_count, trace_stage, tracing
+from nsd_cache import LRUCache, cache_key
+from serving import UnstructuredFlowchart, active_limits, check_deadline, check_depth, check_nodes, enforce
+
+SVG_CHUNK_SIZE = 64 * 1024  # Bytes per chunk when streaming
+
+# Subprograms below the main program: space above each, height of its heading
+SUBPROGRAM_GAP = 40
+SUBPROGRAM_LABEL_H = 28
+
+# Processes for converting subprograms that are not in the fragment cache;
+# 1 converts them in the calling process. The frozen executable always does,
+# a spawned worker would start the whole app again.
+SUBPROGRAM_WORKERS = 1 if getattr(sys, 'frozen', False) else int(
+    os.environ.get('NSD_SUBPROGRAM_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Rendered subprograms by content hash, see convert_subprograms()
+_fragment_cache = LRUCache(max_entries=1024, max_bytes=32 * 1024 * 1024)
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+def convert_mermaid_to_nsd(mermaid_content, subprograms=None, workers=None, compact=False, precision=COMPACT_PRECISION):
+    return ''.join(iter_nsd_svg(mermaid_content, subprograms, workers=workers, compact=compact, precision=precision))
+
+def convert_graph_to_nsd(graph_data, subprograms=None, workers=None, compact=False, precision=COMPACT_PRECISION):
+    """Like convert_mermaid_to_nsd, for the editor's graph format (nodes/edges)."""
+    return ''.join(iter_nsd_svg_from_graph(graph_data, subprograms, workers=workers, compact=compact, precision=precision))
+
+def write_nsd_svg(fileobj, mermaid_content, subprograms=None, workers=None, compact=False, precision=COMPACT_PRECISION):
+    """Streams the NSD SVG into a text file object."""
+    for chunk in iter_nsd_svg(mermaid_content, subprograms, workers=workers, compact=compact, precision=precision):
+        fileobj.write(chunk)
+
+def write_nsd_svg_from_graph(fileobj, graph_data, subprograms=None, workers=None, compact=False, precision=COMPACT_PRECISION):
+    """write_nsd_svg for the editor's graph format."""
+    for chunk in iter_nsd_svg_from_graph(graph_data, subprograms, workers=workers, compact=compact, precision=precision):
+        fileobj.write(chunk)
+
+def iter_nsd_svg(mermaid_content, subprograms=None, chunk_size=SVG_CHUNK_SIZE, workers=None,
+                 compact=False, precision=COMPACT_PRECISION):
+    """
+    Generates the NSD SVG as a sequence of string chunks of about chunk_size
+    characters, e.g. for a Flask streaming response. The whole diagram is
+    laid out first (the root element needs the total size), then rendered
+    piece by piece, so the complete document never exists as one string.
+
+    compact=True renders with compact_svg: shared styles and shapes,
+    relative coordinates rounded to `precision` decimals.
+    """
+    with trace_stage('parse'):
+        graph, start_node = parse_mermaid(mermaid_content)
+    trace_count('nodes', len(graph))
+    trace_count('edges', len(graph.succ_nodes))
+    if start_node is None:
+        yield '<svg><text>Error: No start node found</text></svg>'
+        return
+
+    analysis = check_structure(graph, start_node)
+    with trace_stage('structure'):
+        structured_tree = build_structure(graph, start_node, None, analysis=analysis)
+    yield from _iter_document(structured_tree, subprograms, chunk_size, workers, precision if compact else None)
+
+def iter_nsd_svg_from_graph(graph_data, subprograms=None, chunk_size=SVG_CHUNK_SIZE, workers=None,
+                            compact=False, precision=COMPACT_PRECISION):
+    """
+    iter_nsd_svg for the editor's graph format: the block tree is read from
+    the typed nodes directly (see graph_json). Subprograms may be given as
+    Mermaid ({name, mermaid}) or as graphs ({name, nodes, edges}).
+    """
+    with trace_stage('structure'):
+        structured_tree = build_structure_from_graph(graph_data)
+    trace_count('nodes', len(graph_data['nodes']))
+    trace_count('edges', len(graph_data['edges']))
+    if structured_tree is None:
+        yield '<svg><text>Error: No start node found</text></svg>'
+        return
+
+    yield from _iter_document(structured_tree, subprograms, chunk_size, workers, precision if compact else None)
+
+def _iter_document(structured_tree, subprograms, chunk_size, workers, precision):
+    # precision is None for the classic output, else the compact precision
+    if tracing():
+        trace_count('blocks', count_blocks(structured_tree))
+    width, total_height = layout_blocks(structured_tree)
+    check_deadline()
+
+    # SVG of each subprogram: heading and its fragment moved below the previous one
+    sub_parts = []
     current_y = total_height
-    
+
     # Subprogramme als separate NSD-Diagramme darunter rendern
     if subprograms:
-        GAP = 40
-        LABEL_H = 28
-        for node_id, sub_data in subprograms.items():
-            name       = sub_data.get('name', node_id)
-            sub_mermaid = sub_data.get('mermaid', '')
-            if not sub_mermaid:
-                continue
-            sub_graph, sub_start = parse_mermaid(sub_mermaid)
-            if not sub_start:
-                continue
-            sub_tree   = build_structure(sub_graph, sub_start, None, set())
-            sub_min_w  = calculate_min_widths(sub_tree)
-            sub_w      = max(800, sub_min_w)
-            sub_h      = calculate_heights(sub_tree, sub_w)
-            current_y += GAP
-            svg_content += (
-                f'<text x="0" y="{current_y + LABEL_H - 6}" '
-                f'font-size="15" font-weight="bold" '
-                f'font-family="Arial, sans-serif">'
-                f'Unterprogramm: {html.escape(name)}</text>'
-            )
-            current_y += LABEL_H
-            svg_content += render_blocks(sub_tree, 0, current_y, sub_w)
+        with trace_stage('subprograms'):
+            sub_results = convert_subprograms(subprograms, workers, precision)
+        for name, (fragment, sub_w, sub_h) in sub_results:
+            current_y += SUBPROGRAM_GAP
+            sub_parts.append(subprogram_heading(name, current_y, precision))
+            current_y += SUBPROGRAM_LABEL_H
+            sub_parts.append(f'<g transform="translate(0,{current_y})">{fragment}</g>')
             current_y += sub_h
             width = max(width, sub_w)
-    
-    return f'<svg width="{width}" height="{current_y}" xmlns="http://www.w3.org/2000/svg" style="font-family: Arial, sans-serif;">{svg_content}</svg>'
 
-def parse_mermaid(content):
-    G = nx.DiGraph()
-    lines = content.split('\n')
-    edge_pattern = re.compile(r'(.+?)\s*-->\s*(?:\|(.*?)\|\s*)?(.+)')
-    
-    for line in lines:
-        line = line.strip()
-        if not line or line.startswith('graph') or line.startswith('flowchart') or line.startswith('classDef') or line.startswith('%%') or line.startswith('subgraph'):
+    def pieces():
+        if precision is None:
+            yield f'<svg width="{width}" height="{current_y}" xmlns="http://www.w3.org/2000/svg" style="font-family: Arial, sans-serif;">'
+            yield from iter_render_blocks(structured_tree)
+        else:
+            num = number_format(precision)
+            yield f'<svg class="nsd" width="{num(width)}" height="{num(current_y)}" xmlns="http://www.w3.org/2000/svg">'
+            yield COMPACT_STYLE
+            yield from iter_render_compact(structured_tree, precision)
+        yield from sub_parts
+        yield '</svg>'
+
+    buf = []
+    size = 0
+    output_size = 0
+    # When streamed, this includes the time the consumer spends per chunk
+    with trace_stage('render'):
+        for piece in pieces():
+            buf.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                check_deadline()
+                yield ''.join(buf)
+                output_size += size
+                buf.clear()
+                size = 0
+        if buf:
+            yield ''.join(buf)
+            output_size += size
+    trace_count('output_chars', output_size)
+
+def subprogram_heading(name, y, precision=None):
+    """The 'Unterprogramm: name' heading whose box starts at y."""
+    if precision is None:
+        return (f'<text x="0" y="{y + SUBPROGRAM_LABEL_H - 6}" '
+                f'font-size="15" font-weight="bold" '
+                f'font-family="Arial, sans-serif">'
+                f'Unterprogramm: {html.escape(name)}</text>')
+    return f'<text class="h" y="{y + SUBPROGRAM_LABEL_H - 6}">Unterprogramm: {html.escape(name)}</text>'
+
+def render_subprogram(source, precision=None, id_prefix='u', limits=None):
+    """
+    Converts one subprogram on its own, laid out at the origin. source is
+    Mermaid text or a graph dict. Returns (svg_fragment, width, height), or
+    None without a start node. With a precision the fragment is compact,
+    its shape ids start with id_prefix. limits are the serving limits of the
+    request, passed along explicitly for worker processes.
+    """
+    with enforce(limits if limits is not None else active_limits()):
+        tree = build_tree(source)
+        if tree is None:
+            return None
+        width, height = layout_blocks(tree)
+        check_deadline()
+        if precision is None:
+            return ''.join(iter_render_blocks(tree)), width, height
+        return ''.join(iter_render_compact(tree, precision, id_prefix)), width, height
+
+def build_tree(source):
+    """Block tree of Mermaid text or a graph dict; None without a start node."""
+    if isinstance(source, str):
+        graph, start_node = parse_mermaid(source)
+        if start_node is None:
+            return None
+        return build_structure(graph, start_node, None, analysis=check_structure(graph, start_node))
+    return build_structure_from_graph(source)
+
+def subprogram_sources(subprograms):
+    """(name, Mermaid text or graph) of each non-empty subprogram, in order."""
+    for node_id, sub_data in (subprograms or {}).items():
+        if 'nodes' in sub_data:
+            source = {'nodes': sub_data['nodes'], 'edges': sub_data.get('edges', [])}
+        else:
+            source = sub_data.get('mermaid', '')
+            if not source:
+                continue
+        yield sub_data.get('name', node_id), source
+
+def convert_subprograms(subprograms, workers=None, precision=None):
+    """
+    Renders the subprograms in order. Returns a list of
+    (name, (svg_fragment, width, height)), skipping empty ones.
+
+    Fragments are memoized by the hash of their Mermaid text, so a body
+    referenced several times or left unchanged between exports is converted
+    once. Misses are converted on a process pool of `workers` processes
+    (default SUBPROGRAM_WORKERS) when there is more than one. A precision
+    selects compact fragments (see render_subprogram).
+    """
+    if workers is None:
+        workers = SUBPROGRAM_WORKERS
+
+    entries = []    # (name, key) in output order
+    fragments = {}  # key -> fragment, () for a subprogram without start node
+    missing = {}    # key -> Mermaid text or graph
+    for name, source in subprogram_sources(subprograms):
+        key = cache_key(source, options={'part': 'subprogram', 'precision': precision})
+        entries.append((name, key))
+        if key in fragments or key in missing:
             continue
-            
-        if '-->' in line:
-            parts = line.split('-->')
-            left_part = parts[0].strip()
-            right_part = parts[1].strip()
-            
-            left_id, left_label, left_type = parse_node_str(left_part)
-            if left_id:
-                if left_id not in G: 
-                    G.add_node(left_id, label=left_label, type=left_type)
-                else:
-                    # Update label if we have a better one (not just ID)
-                    if left_label != left_id:
-                        G.nodes[left_id]['label'] = left_label
-                        G.nodes[left_id]['type'] = left_type
-                
-            edge_label = ""
-            if right_part.startswith('|'):
-                end_pipe = right_part.find('|', 1)
-                if end_pipe != -1:
-                    edge_label = right_part[1:end_pipe]
-                    right_part = right_part[end_pipe+1:].strip()
-            
-            right_id, right_label, right_type = parse_node_str(right_part)
-            if right_id:
-                if right_id not in G: 
-                    G.add_node(right_id, label=right_label, type=right_type)
-                else:
-                    if right_label != right_id:
-                        G.nodes[right_id]['label'] = right_label
-                        G.nodes[right_id]['type'] = right_type
+        fragment = _fragment_cache.get(key)
+        if fragment is None:
+            missing[key] = source
+        else:
+            fragments[key] = fragment
 
-            if left_id and right_id:
-                G.add_edge(left_id, right_id, label=edge_label)
+    if missing:
+        keys = list(missing)
+        texts = [missing[key] for key in keys]
+        precisions = [precision] * len(keys)
+        # Compact fragments get their own shape ids, as several share a document
+        prefixes = ['u' + key[:8] for key in keys]
+        # Worker processes do not inherit the request's serving limits
+        limits = [active_limits()] * len(keys)
+        if workers > 1 and len(keys) > 1:
+            results = _subprogram_pool(workers).map(render_subprogram, texts, precisions, prefixes, limits)
         else:
-            node_id, node_label, node_type = parse_node_str(line)
-            if node_id:
-                if node_id not in G: 
-                    G.add_node(node_id, label=node_label, type=node_type)
-                else:
-                    if node_label != node_id:
-                        G.nodes[node_id]['label'] = node_label
-                        G.nodes[node_id]['type'] = node_type
-
-    start_node = None
-    for node in G.nodes:
-        if G.in_degree(node) == 0:
-            start_node = node
-            break
-    if not start_node and len(G.nodes) > 0:
-        start_node = list(G.nodes)[0]
-        
-    return G, start_node
-
-def parse_node_str(node_str):
-    m = re.match(r'(\w+)\s*(\[\[".*?"\]\]|\[".*?"\]|\{".*?"\}|\(\[".*?"\]\)|\(\(".*?"\)\)|\(\[.*?\]\))?', node_str)
-    if not m: return None, None, None
-    node_id = m.group(1)
-    rest = m.group(2)
-    label = node_id
-    node_type = 'process'
-    if rest:
-        if rest.startswith('[["'):  label = rest[3:-3]; node_type = 'subprogram'
-        elif rest.startswith('["'): label = rest[2:-2]; node_type = 'process'
-        elif rest.startswith('{"'): label = rest[2:-2]; node_type = 'decision'
-        elif rest.startswith('(["'): label = rest[3:-3]; node_type = 'terminal'
-        elif rest.startswith('(("'): label = rest[3:-3]; node_type = 'loop'
-        elif rest.startswith('(['): label = rest[2:-2]; node_type = 'terminal'
-    return node_id, label, node_type
-
-def build_structure(G, current_node, stop_node, visited):
-    blocks = []
-    while current_node and current_node != stop_node:
-        if current_node in visited:
-            # Loop back detected, stop processing this path
-            break
-        
+            results = map(render_subprogram, texts, precisions, prefixes, limits)
+        for key, result in zip(keys, results):
+            check_deadline()
+            fragment = result or ()
+            fragments[key] = fragment
+            _fragment_cache.put(key, fragment, len(result[0]) if result else 1)
+
+    return [(name, fragments[key]) for name, key in entries if fragments[key]]
+
+def _subprogram_pool(workers):
+    # One pool per process, created on first use and replaced if the size changes
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+def parse_mermaid(content):
+    """
+    Parses Mermaid flowchart text into a FlowGraph.
+    Returns (graph, start_node) with start_node as integer node id or None.
+    """
+    G = FlowGraph()
+    scan_mermaid(content, G.add_node, G.add_edge)
+    G.freeze()
+    check_nodes(len(G))
+    return G, G.start_node()
+
+def check_structure(G, start_node):
+    """
+    Analyses the parsed flowchart once: the immediate post-dominators and
+    the loop-nesting forest. Raises UnstructuredFlowchart with the problems
+    found (flow_analysis.structure_problems), otherwise returns
+    (ipdom, loops) for build_structure's `analysis`.
+    """
+    with trace_stage('post_dominators'):
+        ipdom = immediate_post_dominators(G)
+    with trace_stage('loop_forest'):
+        loops = loop_forest(G, start_node)
+    with trace_stage('validate'):
+        problems = structure_problems(G, start_node, ipdom, loops)
+    if problems:
+        raise UnstructuredFlowchart(problems)
+    return ipdom, loops
+
+def build_structure(G, current_node, stop_node, visited=None, analysis=None):
+    """
+    Turns the flowchart graph into a nested list of blocks, starting at
+    current_node and following the flow until stop_node. Every block
+    carries the Mermaid id of its node as 'id'.
+
+    Loops are taken from the graph's loop-nesting forest (see
+    flow_analysis.loop_forest): a node with two successors heads a loop
+    when one of them is inside its loop and the other is not, whatever its
+    shape and edge labels. Loops left anywhere else, e.g. by a test at the
+    end of the body, are refused as unstructured_loop. `analysis` is the
+    result of check_structure for this graph; without it the graph is
+    checked here.
+
+    Runs on an explicit work stack instead of recursion, so nesting depth is
+    not limited by the interpreter's recursion limit. Every block sequence
+    being built is one frame [node, stop_node, blocks, added]. `visited` holds
+    the nodes on the current path through the structure: a frame records the
+    nodes it adds and removes them when it finishes, so sibling branches
+    start from the same state without copying the set.
+    """
+    if visited is None:
+        visited = set()
+    # Merge points of all branch nodes and the loops, computed once for the
+    # whole graph; unstructured flowcharts are refused before anything is built
+    ipdom, loops = analysis if analysis is not None else check_structure(G, current_node)
+    root = []
+    stack = [[current_node, stop_node, root, []]]
+    steps = 0
+
+    while stack:
+        steps += 1
+        if not steps & 0xFFF:
+            check_deadline()
+        frame = stack[-1]
+        current_node, stop_node, blocks, added = frame
+
+        if current_node is None or current_node == stop_node or current_node in visited:
+            # End of sequence, or a jump back into the path outside of any
+            # loop (unstructured): leave this scope
+            stack.pop()
+            visited.difference_update(added)
+            continue
+
         visited.add(current_node)
-        node_data = G.nodes[current_node]
-        label = node_data.get('label', current_node)
-        successors = list(G.successors(current_node))
-        
-        if len(successors) == 2:
-            # Check if it's a loop (Head) or Decision or Case (with 2 options)
-            node_data = G.nodes[current_node]
-            node_type = node_data.get('type', 'process')
-            
-            # 1. Check for Loop
-            # Since we switched to (["..."]) for loops (stadium shape), they are parsed as 'terminal'.
-            if node_type == 'loop' or node_type == 'terminal':
-                # Identify Body vs Exit
-                edge1 = G.get_edge_data(current_node, successors[0])
-                label1 = edge1.get('label', '').lower()
-                
-                if 'exit' in label1:
-                    exit_node = successors[0]
-                    body_start_node = successors[1]
-                else:
-                    body_start_node = successors[0]
-                    exit_node = successors[1]
-                
-                # Build Body
-                body_blocks = build_structure(G, body_start_node, current_node, visited.copy())
-                
-                blocks.append({
-                    'type': 'loop',
-                    'label': label,
-                    'children': body_blocks
-                })
-                current_node = exit_node
-                
+        added.append(current_node)
+        label = G.labels[current_node]
+        successors = G.successors(current_node)
+        edge_labels = G.successor_labels(current_node)
+
+        head = loop_head(G, loops, current_node)
+        if head is not None:
+            # Loop head: one successor leads back to it (the body), the other
+            # leaves the loop. Shape and edge labels do not matter.
+            body_start_node, exit_node = head
+
+            body_blocks = []
+            blocks.append({
+                'id': G.ids[current_node],
+                'type': 'loop',
+                'label': label,
+                'children': body_blocks
+            })
+            frame[0] = exit_node
+            stack.append([body_start_node, current_node, body_blocks, []])
+
+        elif len(successors) == 2 and _is_yes_no(edge_labels[0].lower()):
+            # Standard Decision (Yes/No)
+            merge_node = ipdom[current_node] if ipdom[current_node] != -1 else None
+
+            label1 = edge_labels[0].lower()
+            if 'ja' in label1 or 'yes' in label1 or 'true' in label1:
+                yes_node, no_node = successors
             else:
-                # 2. Check for Standard Decision (Yes/No)
-                edge1 = G.get_edge_data(current_node, successors[0])
-                edge2 = G.get_edge_data(current_node, successors[1])
-                label1 = edge1.get('label', '').lower()
-                label2 = edge2.get('label', '').lower()
-                
-                is_standard_decision = False
-                if 'ja' in label1 or 'yes' in label1 or 'true' in label1:
-                     is_standard_decision = True
-                elif 'nein' in label1 or 'no' in label1 or 'false' in label1:
-                     is_standard_decision = True
-                     
-                if is_standard_decision:
-                    # Treat as If/Else Decision
-                    merge_node = find_merge_node(G, successors[0], successors[1], current_node)
-                    
-                    if 'ja' in label1 or 'yes' in label1 or 'true' in label1:
-                        yes_node = successors[0]; no_node = successors[1]
-                    else:
-                        yes_node = successors[1]; no_node = successors[0]
-                    
-                    yes_block = build_structure(G, yes_node, merge_node, visited.copy())
-                    no_block = build_structure(G, no_node, merge_node, visited.copy())
-                    
-                    blocks.append({
-                        'type': 'decision',
-                        'label': label,
-                        'yes': yes_block,
-                        'no': no_block
-                    })
-                    current_node = merge_node
-                else:
-                    # 3. Fallback: Treat as Case with 2 branches
-                    # This happens if labels are like "1", "default", etc.
-                    # We utilize the general N-branch logic below by NOT advancing here.
-                    # We just change the flow to fall through to the elif len >= 2 block?
-                    # No, we must handle it or restructure the if/elif.
-                    
-                    # Let's handle it here to avoid complex flow control.
-                    merge_node = find_merge_node(G, successors[0], successors[1], current_node)
-                    
-                    if not merge_node:
-                         # Should not happen
-                         current_node = successors[0] 
-                    else:
-                        branches = []
-                        for succ in successors:
-                            edge = G.get_edge_data(current_node, succ)
-                            b_label = edge.get('label', '')
-                            b_blocks = build_structure(G, succ, merge_node, visited.copy())
-                            branches.append({
-                                'label': b_label,
-                                'children': b_blocks
-                            })
-                            
-                        blocks.append({
-                            'type': 'case',
-                            'label': label,
-                            'branches': branches
-                        })
-                        current_node = merge_node
-            
+                no_node, yes_node = successors
+
+            yes_block = []
+            no_block = []
+            blocks.append({
+                'id': G.ids[current_node],
+                'type': 'decision',
+                'label': label,
+                'yes': yes_block,
+                'no': no_block
+            })
+            frame[0] = merge_node
+            # Pushed in reverse so the yes branch is built first
+            stack.append([no_node, merge_node, no_block, []])
+            stack.append([yes_node, merge_node, yes_block, []])
+
         elif len(successors) >= 2:
-             # Case Statement Handling (General Branching)
-             # If it wasn't caught as loop or simple decision above...
-             # Actually, simple decision logic (len=2) is handled above. 
-             # But if len > 2, it falls here.
-             # ALSO, if len=2 but labels are not yes/no, it might be a Case with 2 options.
-             
-             # Identify Merge Node for N branches
-             # Heuristic: Find common successor of all branches.
-             # Or iteratively find merge of B1 and B2, then Res and B3...
-             
-             # Start with finding merge of first two
-             merge_node = find_merge_node(G, successors[0], successors[1], current_node)
-             for i in range(2, len(successors)):
-                 if not merge_node: break
-                 merge_node = find_merge_node(G, merge_node, successors[i], current_node)
-                 
-             if not merge_node:
-                 # Fallback: Treat as individual paths (shouldn't happen in structured graph)
-                 print(f"Warning: No merge node found for Case {label}")
-                 blocks.append({'type': 'process', 'label': label})
-                 current_node = successors[0]
-                 continue
-                 
-             branches = []
-             for succ in successors:
-                 edge = G.get_edge_data(current_node, succ)
-                 b_label = edge.get('label', '')
-                 b_blocks = build_structure(G, succ, merge_node, visited.copy())
-                 branches.append({
-                     'label': b_label,
-                     'children': b_blocks
-                 })
-                 
-             blocks.append({
-                 'type': 'case',
-                 'label': label,
-                 'branches': branches
-             })
-             
-             current_node = merge_node
+            # Case: a 2-way branch whose labels are not yes/no (e.g. "1",
+            # "default") or a general N-way branch.
+            # Without a merge node every branch runs to an end of the program
+            merge_node = ipdom[current_node] if ipdom[current_node] != -1 else None
+
+            branches = [{'label': b_label, 'children': []} for b_label in edge_labels]
+            blocks.append({
+                'id': G.ids[current_node],
+                'type': 'case',
+                'label': label,
+                'branches': branches
+            })
+            frame[0] = merge_node
+            for succ, branch in reversed(list(zip(successors, branches))):
+                stack.append([succ, merge_node, branch['children'], []])
 
         elif len(successors) == 1:
-            
             # Skip empty/dummy nodes
-            if not label or not label.strip():
-                current_node = successors[0]
-                continue
+            if label and label.strip():
+                blocks.append({'id': G.ids[current_node], 'type': 'process', 'label': label})
+            frame[0] = successors[0]
 
-            # My editor generates: id(("label")) for loops.
-            # The parser needs to read the node shape or type.
-            # parse_mermaid stores 'type' in G.nodes.
-            
-            node_type = G.nodes[current_node].get('type', 'process')
-            
-            if node_type == 'terminal' or 'loop' in label.lower() or 'while' in label.lower() or 'for' in label.lower():
-                 # It's likely a loop header in my editor's context (if I used specific shapes)
-                 # But standard Mermaid might just be a decision.
-                 # Let's check if my editor uses specific shapes.
-                 # My editor uses (("label")) which is 'terminal' or 'circle' in my parser?
-                 # parse_node_str: (["..."]) is terminal. (("...")) is not handled in my ported parser!
-                 # I need to update parse_node_str to handle (("...")) as loop.
-                 pass
-
-            blocks.append({'type': 'process', 'label': label})
-            current_node = successors[0]
-        else:
-            blocks.append({'type': 'process', 'label': label})
-            current_node = None
-            
-    return blocks
-
-def find_merge_node(G, node1, node2, forbidden_node=None):
-    visited1 = set()
-    queue1 = [node1]
-    
-    # Interleaved BFS with forbidden node check
-    visited2 = set()
-    queue2 = [node2]
-    
-    iter_count = 0
-    while (queue1 or queue2) and iter_count < 1000:
-        iter_count += 1
-        
-        # Step 1
-        if queue1:
-            n = queue1.pop(0)
-            if n in visited2: return n
-            if n not in visited1:
-                visited1.add(n)
-                successors = list(G.successors(n))
-                for succ in successors:
-                    if succ != forbidden_node:
-                        queue1.append(succ)
-        
-        # Step 2
-        if queue2:
-            n = queue2.pop(0)
-            if n in visited1: return n
-            if n not in visited2:
-                visited2.add(n)
-                successors = list(G.successors(n))
-                for succ in successors:
-                    if succ != forbidden_node:
-                        queue2.append(succ)
-                        
-    return None
-
-def calculate_min_widths(blocks):
-    """
-    Recursively calculates the minimum width for a list of blocks.
-    Annotates each block with 'min_width'.
-    Returns the max min_width of the list.
-    """
-    max_width = MIN_BLOCK_WIDTH
-    
-    for block in blocks:
-        text_width = len(block['label']) * CHAR_WIDTH_AVG + PADDING_X * 2
-        
-        if block['type'] in ('process', 'subprogram'):
-            block['min_width'] = max(text_width, MIN_BLOCK_WIDTH)
-            
-        elif block['type'] == 'decision':
-            yes_width = calculate_min_widths(block['yes'])
-            no_width = calculate_min_widths(block['no'])
-            
-            # Decision needs to fit its own label too
-            decision_label_width = text_width
-            
-            # The width of a decision block is the sum of its branches
-            # But it also needs to be at least wide enough for its header label
-            block['min_width'] = max(yes_width + no_width, decision_label_width)
-            
-            # Store branch widths for proportional rendering
-            block['yes_min_width'] = yes_width
-            block['no_min_width'] = no_width
-
-        elif block['type'] == 'case':
-            total_b_width = 0
-            for branch in block['branches']:
-                 b_w = calculate_min_widths(branch['children'])
-                 # Branch needs to fit its label
-                 b_text_w = len(branch['label']) * CHAR_WIDTH_AVG + PADDING_X * 2
-                 branch['min_width'] = max(b_w, b_text_w)
-                 total_b_width += branch['min_width']
-            
-            text_width = len(block['label']) * CHAR_WIDTH_AVG + PADDING_X * 2
-            block['min_width'] = max(total_b_width, text_width)
-            
-        elif block['type'] == 'loop':
-            children_width = calculate_min_widths(block['children'])
-            # Loop needs spacer + children
-            block['min_width'] = max(text_width, children_width + 30) # 30 is spacer
-            
         else:
-            # Fallback for unknown types (e.g. terminal)
-            block['min_width'] = max(text_width, MIN_BLOCK_WIDTH)
-            
-        max_width = max(max_width, block['min_width'])
-        
-    return max_width
-
-def calculate_heights(blocks, width):
+            blocks.append({'id': G.ids[current_node], 'type': 'process', 'label': label})
+            frame[0] = None
+
+    check_depth(root)
+    return root
+
+def _is_yes_no(edge_label):
+    return ('ja' in edge_label or 'yes' in edge_label or 'true' in edge_label
+            or 'nein' in edge_label or 'no' in edge_label or 'false' in edge_label)
+
+def render_blocks(blocks):
+    return ''.join(iter_render_blocks(blocks))
+
+def iter_render_blocks(blocks):
     """
-    Recursively calculates height based on available width.
-    Annotates each block with 'height'.
-    Returns total height.
+    Yields the SVG elements for a list of blocks laid out by layout_blocks(),
+    in document order. Geometry is read from each block's BlockLayout.
+    Walks the tree with an explicit stack: an entry is either a finished
+    element string or a block still to be expanded.
     """
-    total_h = 0
-    for block in blocks:
-        # Calculate text wrapping
-        # Available width for text
-        text_area_width = width - PADDING_X * 2
-        text_len = len(block['label']) * CHAR_WIDTH_AVG
-        lines = math.ceil(text_len / max(1, text_area_width))
-        text_height = lines * LINE_HEIGHT + PADDING_Y * 2
-        
-        if block['type'] in ('process', 'subprogram'):
-            block['height'] = max(40, text_height)
-            total_h += block['height']
-            
-        elif block['type'] == 'decision':
-            # ... (existing decision logic) ...
-            yes_min = block['yes_min_width']
-            no_min = block['no_min_width']
-            total_min = yes_min + no_min
-            
-            yes_w = width * (yes_min / total_min)
-            no_w = width - yes_w
-            
-            yes_h = calculate_heights(block['yes'], yes_w)
-            no_h = calculate_heights(block['no'], no_w)
-            
-            content_height = max(yes_h, no_h)
-            header_height = max(40, text_height + 20)
-            
-            block['height'] = header_height + content_height
-            block['header_height'] = header_height
-            block['content_height'] = content_height
-            block['yes_width'] = yes_w
-            block['no_width'] = no_w
-            
-            total_h += block['height']
-
-        elif block['type'] == 'case':
-            # Case Logic
-            # Distribute width proportionally to min_width
-            total_min = sum(b['min_width'] for b in block['branches'])
-            if total_min == 0: total_min = 1
-            
-            current_x = 0
-            max_content_h = 0
-            
-            for branch in block['branches']:
-                # Calculate assigned width
-                ratio = branch['min_width'] / total_min
-                b_width = width * ratio
-                branch['width'] = b_width
-                
-                # Calculate height of children
-                h = calculate_heights(branch['children'], b_width)
-                max_content_h = max(max_content_h, h)
-                
-            header_height = max(40, text_height + 20)
-            
-            block['height'] = header_height + max_content_h
-            block['header_height'] = header_height
-            block['content_height'] = max_content_h
-            
-            block['content_height'] = max_content_h
-            
-            total_h += block['height']
-            
-        elif block['type'] == 'loop':
-            # Loop has a spacer (30px) and content
-            spacer_width = 30
-            content_width = width - spacer_width
-            
-            # Calculate content height
-            content_h = calculate_heights(block['children'], content_width)
-            
-            # Header height
-            header_height = max(30, text_height)
-            
-            block['height'] = header_height + content_h
-            block['header_height'] = header_height
-            block['content_height'] = content_h
-            block['spacer_width'] = spacer_width
-            block['content_width'] = content_width
-            
-            total_h += block['height']
-            
-    return total_h
-
-def render_blocks(blocks, x, y, width):
-    svg = ""
-    current_y = y
-    
-    for block in blocks:
-        if block['type'] == 'process':
-            h = block['height']
-            svg += f'<rect x="{x}" y="{current_y}" width="{width}" height="{h}" fill="white" stroke="black" stroke-width="1"/>'
-            lines = wrap_text(block['label'], width - PADDING_X * 2)
-            text_y = current_y + PADDING_Y + FONT_SIZE/2
-            for line in lines:
-                svg += f'<text x="{x + 10}" y="{text_y}" font-size="{FONT_SIZE}" font-family="Arial, sans-serif">{html.escape(line)}</text>'
-                text_y += LINE_HEIGHT
-            current_y += h
+    stack = []
+    _push_sequence(stack, blocks)
+
+    while stack:
+        item = stack.pop()
+        if type(item) is str:
+            yield item
+            continue
+
+        block = item
+        lay = block['layout']
+        x = lay.x
+        current_y = lay.y
+        width = lay.width
+        t = block['type']
+
+        if t == 'decision':
+            header_h = lay.header_height
+            content_h = lay.height - header_h
+            yes_w, no_w = lay.columns
+            yes_content_h, no_content_h = lay.column_heights
 
-        elif block['type'] == 'subprogram':
-            # Doppelter Rahmen (Struktogramm-Standard für Unterprogramme)
-            h = block['height']
-            border = 4
-            svg += f'<rect x="{x}" y="{current_y}" width="{width}" height="{h}" fill="white" stroke="black" stroke-width="1"/>'
-            svg += f'<rect x="{x+border}" y="{current_y+border}" width="{width-2*border}" height="{h-2*border}" fill="none" stroke="black" stroke-width="1"/>'
-            lines = wrap_text(block['label'], width - PADDING_X * 2 - border * 2)
-            text_y = current_y + PADDING_Y + FONT_SIZE/2
-            for line in lines:
-                svg += f'<text x="{x + width/2}" y="{text_y}" text-anchor="middle" font-size="{FONT_SIZE}" font-family="Arial, sans-serif">{html.escape(line)}</text>'
-                text_y += LINE_HEIGHT
-            current_y += h
-
-        elif block['type'] == 'decision':
-            header_h = block['header_height']
-            content_h = block['content_height']
-            yes_w = block['yes_width']
-            no_w = block['no_width']
-            
             # Header - White background for IF, but with V-shape lines
-            svg += f'<rect x="{x}" y="{current_y}" width="{width}" height="{header_h}" fill="white" stroke="black" stroke-width="1"/>'
-            svg += f'<line x1="{x}" y1="{current_y}" x2="{x+yes_w}" y2="{current_y+header_h}" stroke="black" stroke-width="1"/>'
-            svg += f'<line x1="{x+width}" y1="{current_y}" x2="{x+yes_w}" y2="{current_y+header_h}" stroke="black" stroke-width="1"/>'
-            
+            yield f'<rect x="{x}" y="{current_y}" width="{width}" height="{header_h}" fill="white" stroke="black" stroke-width="1"/>'
+            yield f'<line x1="{x}" y1="{current_y}" x2="{x+yes_w}" y2="{current_y+header_h}" stroke="black" stroke-width="1"/>'
+            yield f'<line x1="{x+width}" y1="{current_y}" x2="{x+yes_w}" y2="{current_y+header_h}" stroke="black" stroke-width="1"/>'
+
             # Label
             block_center_x = x + width / 2
             intersection_x = x + yes_w
             label_x = (block_center_x + intersection_x) / 2
-            
-            svg += f'<text x="{label_x}" y="{current_y + header_h/2}" text-anchor="middle" font-size="{FONT_SIZE}" font-family="Arial, sans-serif">{html.escape(block["label"])}</text>'
-            
+
+            yield f'<text x="{label_x}" y="{current_y + header_h/2}" text-anchor="middle" font-size="{FONT_SIZE}" font-family="Arial, sans-serif">{html.escape(block["label"])}</text>'
+
             # True/False
-            svg += f'<text x="{x + yes_w/2}" y="{current_y + header_h - 5}" text-anchor="middle" font-size="12" font-family="Arial, sans-serif">Ja</text>'
-            svg += f'<text x="{x + yes_w + no_w/2}" y="{current_y + header_h - 5}" text-anchor="middle" font-size="12" font-family="Arial, sans-serif">Nein</text>'
-            
-            # Branches
-            svg += render_blocks(block['yes'], x, current_y + header_h, yes_w)
-            svg += render_blocks(block['no'], x + yes_w, current_y + header_h, no_w)
-            
-            # Fill empty space
-            yes_content_h = sum(b['height'] for b in block['yes'])
-            no_content_h = sum(b['height'] for b in block['no'])
-            
-            if yes_content_h < content_h:
-                svg += f'<rect x="{x}" y="{current_y + header_h + yes_content_h}" width="{yes_w}" height="{content_h - yes_content_h}" fill="white" stroke="black" stroke-width="1"/>'
+            yield f'<text x="{x + yes_w/2}" y="{current_y + header_h - 5}" text-anchor="middle" font-size="12" font-family="Arial, sans-serif">Ja</text>'
+            yield f'<text x="{x + yes_w + no_w/2}" y="{current_y + header_h - 5}" text-anchor="middle" font-size="12" font-family="Arial, sans-serif">Nein</text>'
+
+            # Branches, then fill empty space below the shorter one
             if no_content_h < content_h:
-                svg += f'<rect x="{x + yes_w}" y="{current_y + header_h + no_content_h}" width="{no_w}" height="{content_h - no_content_h}" fill="white" stroke="black" stroke-width="1"/>'
-                
-            current_y += header_h + content_h
-
-        elif block['type'] == 'case':
-            header_h = block['header_height']
-            content_h = block['content_height']
-            
+                stack.append(f'<rect x="{x + yes_w}" y="{current_y + header_h + no_content_h}" width="{no_w}" height="{content_h - no_content_h}" fill="white" stroke="black" stroke-width="1"/>')
+            if yes_content_h < content_h:
+                stack.append(f'<rect x="{x}" y="{current_y + header_h + yes_content_h}" width="{yes_w}" height="{content_h - yes_content_h}" fill="white" stroke="black" stroke-width="1"/>')
+            _push_sequence(stack, block['no'])
+            _push_sequence(stack, block['yes'])
+
+        elif t == 'case':
+            header_h = lay.header_height
+            content_h = lay.height - header_h
+
             # Render Header
-            svg += f'<rect x="{x}" y="{current_y}" width="{width}" height="{header_h}" fill="white" stroke="black" stroke-width="1"/>'
-            
+            yield f'<rect x="{x}" y="{current_y}" width="{width}" height="{header_h}" fill="white" stroke="black" stroke-width="1"/>'
+
             # Geometry for Fan
             branches = block['branches']
             n_branches = len(branches)
             split_y_ratio = 0.6
             split_y_px = header_h * split_y_ratio
-            
+
             # Label (Top Center)
-            svg += f'<text x="{x + width/2}" y="{current_y + split_y_px/2 + 5}" text-anchor="middle" font-size="{FONT_SIZE}" font-family="Arial, sans-serif">{html.escape(block["label"])}</text>'
-            
-            current_x = x
-            
-            # Calculate segments
-            # First pass: Get exact x positions
-            
-            # Draw lines
+            yield f'<text x="{x + width/2}" y="{current_y + split_y_px/2 + 5}" text-anchor="middle" font-size="{FONT_SIZE}" font-family="Arial, sans-serif">{html.escape(block["label"])}</text>'
+
             # Left Diagonal: (x, y) -> top-right of first branch label area
-            branch0_w = branches[0]['width']
+            branch0_w = lay.columns[0]
             p1_x = x + branch0_w
-            
-            svg += f'<line x1="{x}" y1="{current_y}" x2="{p1_x}" y2="{current_y + split_y_px}" stroke="black" stroke-width="1"/>'
-            
-            # Right Diagonal: (x+width, y) -> top-left of last branch label area (or right of N-2)
-            # Actually, standard visual is diagonals to the outer separators.
-            # Mirroring JS implementation:
-            # Diagonals connect corners to the SplitY line.
-            
-            # Render Branches and Header Parts
+            yield f'<line x1="{x}" y1="{current_y}" x2="{p1_x}" y2="{current_y + split_y_px}" stroke="black" stroke-width="1"/>'
+
+            # Right Diagonal: (x+width, y) -> top-left of last branch label area
+            last_branch_w = lay.columns[-1]
+            p2_x = x + width - last_branch_w
+
+            # Everything after the branches, pushed first so it comes out last
+            if n_branches > 2:
+                stack.append(f'<line x1="{p1_x}" y1="{current_y + split_y_px}" x2="{p2_x}" y2="{current_y + split_y_px}" stroke="black" stroke-width="1"/>')
+            stack.append(f'<line x1="{x + width}" y1="{current_y}" x2="{p2_x}" y2="{current_y + split_y_px}" stroke="black" stroke-width="1"/>')
+
+            # Branch label, separator, content and filler for each branch
+            branch_items = []
             render_x = x
-            
             for i, branch in enumerate(branches):
-                b_width = branch['width']
-                
-                # Branch Label
+                b_width = lay.columns[i]
                 label_center_x = render_x + b_width / 2
-                svg += f'<text x="{label_center_x}" y="{current_y + header_h - 5}" text-anchor="middle" font-size="12" font-family="Arial, sans-serif">{html.escape(branch["label"])}</text>'
-                
-                # Vertical Separator (except for last one)
-                if i < n_branches:
-                     # Line from splitY to bottom of header
-                     sep_x = render_x + b_width
-                     if i < n_branches - 1:
-                         svg += f'<line x1="{sep_x}" y1="{current_y + split_y_px}" x2="{sep_x}" y2="{current_y + header_h}" stroke="black" stroke-width="1"/>'
-                
-                # Render Block Content
-                svg += render_blocks(branch['children'], render_x, current_y + header_h, b_width)
-                
-                # Fill Empty Space
-                b_content_h = sum(b['height'] for b in branch['children'])
+                branch_items.append(f'<text x="{label_center_x}" y="{current_y + header_h - 5}" text-anchor="middle" font-size="12" font-family="Arial, sans-serif">{html.escape(branch["label"])}</text>')
+
+                # Vertical Separator from splitY to bottom of header (except for last one)
+                sep_x = render_x + b_width
+                if i < n_branches - 1:
+                    branch_items.append(f'<line x1="{sep_x}" y1="{current_y + split_y_px}" x2="{sep_x}" y2="{current_y + header_h}" stroke="black" stroke-width="1"/>')
+
+                branch_items.append(branch['children'])
+
+                b_content_h = lay.column_heights[i]
                 if b_content_h < content_h:
-                    svg += f'<rect x="{render_x}" y="{current_y + header_h + b_content_h}" width="{b_width}" height="{content_h - b_content_h}" fill="white" stroke="black" stroke-width="1"/>'
-                
-                render_x += b_width
+                    branch_items.append(f'<rect x="{render_x}" y="{current_y + header_h + b_content_h}" width="{b_width}" height="{content_h - b_content_h}" fill="white" stroke="black" stroke-width="1"/>')
 
-            # Right Diagonal
-            last_branch_w = branches[-1]['width']
-            p2_x = x + width - last_branch_w
-            svg += f'<line x1="{x + width}" y1="{current_y}" x2="{p2_x}" y2="{current_y + split_y_px}" stroke="black" stroke-width="1"/>'
+                render_x += b_width
 
-            # Middle Line (if needed)
-            if n_branches > 2:
-                 svg += f'<line x1="{p1_x}" y1="{current_y + split_y_px}" x2="{p2_x}" y2="{current_y + split_y_px}" stroke="black" stroke-width="1"/>'
+            for entry in reversed(branch_items):
+                if type(entry) is str:
+                    stack.append(entry)
+                else:
+                    _push_sequence(stack, entry)
 
-            current_y += header_h + content_h
+        elif t == 'loop':
+            header_h = lay.header_height
+            content_h = lay.height - header_h
+            spacer_w, content_w = lay.columns
 
-        elif block['type'] == 'loop':
-            header_h = block['header_height']
-            content_h = block['content_height']
-            spacer_w = block['spacer_width']
-            content_w = block['content_width']
-            
             # L-Shape Polygon (Header + Spacer)
             # Points: Top-Left -> Top-Right -> Bottom-Right(Header) -> Inner-Corner -> Bottom-Right(Spacer) -> Bottom-Left -> Close
-            
             p1 = f"{x},{current_y}"
             p2 = f"{x+width},{current_y}"
             p3 = f"{x+width},{current_y+header_h}"
             p4 = f"{x+spacer_w},{current_y+header_h}"
             p5 = f"{x+spacer_w},{current_y+header_h+content_h}"
             p6 = f"{x},{current_y+header_h+content_h}"
-            
-            svg += f'<polygon points="{p1} {p2} {p3} {p4} {p5} {p6}" fill="#e2e8f0" stroke="black" stroke-width="1"/>'
-            
+
+            yield f'<polygon points="{p1} {p2} {p3} {p4} {p5} {p6}" fill="#e2e8f0" stroke="black" stroke-width="1"/>'
+
             # Label
-            svg += f'<text x="{x + 10}" y="{current_y + header_h/2 + 5}" font-size="{FONT_SIZE}" font-family="Arial, sans-serif">{html.escape(block["label"])}</text>'
-            
+            yield f'<text x="{x + 10}" y="{current_y + header_h/2 + 5}" font-size="{FONT_SIZE}" font-family="Arial, sans-serif">{html.escape(block["label"])}</text>'
+
             # Content Area (White)
-            # We draw this *over* the L-shape. 
+            # We draw this *over* the L-shape.
             # The top edge of this rect will match the bottom edge of the header part of the L-shape.
             # The left edge will match the right edge of the spacer part.
-            svg += f'<rect x="{x + spacer_w}" y="{current_y + header_h}" width="{content_w}" height="{content_h}" fill="white" stroke="black" stroke-width="1"/>'
-            
-            # Render Children
-            svg += render_blocks(block['children'], x + spacer_w, current_y + header_h, content_w)
-            
-            current_y += header_h + content_h
+            yield f'<rect x="{x + spacer_w}" y="{current_y + header_h}" width="{content_w}" height="{content_h}" fill="white" stroke="black" stroke-width="1"/>'
 
-    return svg
+            _push_sequence(stack, block['children'])
+
+        elif t == 'subprogram':
+            # Doppelter Rahmen (Struktogramm-Standard für Unterprogramme)
+            h = lay.height
+            border = SUBPROGRAM_BORDER
+            yield f'<rect x="{x}" y="{current_y}" width="{width}" height="{h}" fill="white" stroke="black" stroke-width="1"/>'
+            yield f'<rect x="{x+border}" y="{current_y+border}" width="{width-2*border}" height="{h-2*border}" fill="none" stroke="black" stroke-width="1"/>'
+            text_y = current_y + PADDING_Y + FONT_SIZE/2
+            for line in lay.lines:
+                yield f'<text x="{x + width/2}" y="{text_y}" text-anchor="middle" font-size="{FONT_SIZE}" font-family="Arial, sans-serif">{html.escape(line)}</text>'
+                text_y += LINE_HEIGHT
 
-def wrap_text(text, max_width):
-    """
-    Simple word wrap
-    """
-    words = text.split()
-    lines = []
-    current_line = []
-    current_len = 0
-    
-    for word in words:
-        word_len = len(word) * CHAR_WIDTH_AVG
-        if current_len + word_len <= max_width:
-            current_line.append(word)
-            current_len += word_len + CHAR_WIDTH_AVG # Space
         else:
-            if current_line:
-                lines.append(" ".join(current_line))
-            current_line = [word]
-            current_len = word_len
-            
-    if current_line:
-        lines.append(" ".join(current_line))
-        
-    return lines if lines else [text]
+            h = lay.height
+            yield f'<rect x="{x}" y="{current_y}" width="{width}" height="{h}" fill="white" stroke="black" stroke-width="1"/>'
+            text_y = current_y + PADDING_Y + FONT_SIZE/2
+            for line in lay.lines:
+                yield f'<text x="{x + 10}" y="{text_y}" font-size="{FONT_SIZE}" font-family="Arial, sans-serif">{html.escape(line)}</text>'
+                text_y += LINE_HEIGHT
+
+def _push_sequence(stack, blocks):
+    """Pushes a block list so that its first block is popped first."""
+    stack.extend(reversed(blocks))
+
+if __name__ == '__main__':
+    # Command line: batch conversion of files and directories, see batch_convert
+    from batch_convert import main
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+SQLite store for saved diagrams.
+
+A diagram has an id, a name, an owner and numbered versions. Every version
+refers to its program and its subprograms by content hash; the JSON behind
+a hash is kept once, zlib-compressed, in the blobs table, so a subprogram
+shared by many diagrams or unchanged between versions takes no extra space.
+Saving content identical to the latest version does not add a version.
+
+Rendered NSDs live in the same file (a nsd_cache.DiskCache keyed by
+nsd_cache.cache_key), so loading a saved diagram can return its SVG too.
+
+Tables:
+    blobs     (hash, data, size)                       compressed JSON by sha256
+    diagrams  (id, name, owner, version, created, updated)
+              indexed by owner/updated, name and updated
+    versions  (diagram_id, version, program, subprograms, saved)
+              subprograms is a JSON list of [node_id, blob hash]
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+from nsd_cache import DiskCache
+
+DEFAULT_NAME = 'Unbenannt'
+MAX_LIST_LIMIT = 1000
+
+
+def _canonical(data):
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+class DiagramStore:
+    """Diagrams with versions in one SQLite file, safe to share between threads and processes."""
+
+    def __init__(self, path, render_max_bytes=512 * 1024 * 1024):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(
+            'CREATE TABLE IF NOT EXISTS blobs ('
+            ' hash TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL) WITHOUT ROWID;'
+            'CREATE TABLE IF NOT EXISTS diagrams ('
+            ' id TEXT PRIMARY KEY, name TEXT NOT NULL, owner TEXT NOT NULL,'
+            ' version INTEGER NOT NULL, created REAL NOT NULL, updated REAL NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS diagrams_owner_updated ON diagrams (owner, updated);'
+            'CREATE INDEX IF NOT EXISTS diagrams_name ON diagrams (name);'
+            'CREATE INDEX IF NOT EXISTS diagrams_updated ON diagrams (updated);'
+            'CREATE TABLE IF NOT EXISTS versions ('
+            ' diagram_id TEXT NOT NULL, version INTEGER NOT NULL, program TEXT NOT NULL,'
+            ' subprograms TEXT NOT NULL, saved REAL NOT NULL,'
+            ' PRIMARY KEY (diagram_id, version)) WITHOUT ROWID;')
+        self.renders = DiskCache(path, render_max_bytes)
+
+    def _put_blob(self, data):
+        # Content-addressed: storing the same JSON twice keeps one row
+        raw = _canonical(data)
+        digest = hashlib.sha256(raw).hexdigest()
+        self._conn.execute('INSERT OR IGNORE INTO blobs (hash, data, size) VALUES (?, ?, ?)',
+                           (digest, zlib.compress(raw), len(raw)))
+        return digest
+
+    def _get_blobs(self, digests):
+        rows = self._conn.execute(
+            f'SELECT hash, data FROM blobs WHERE hash IN ({",".join("?" * len(digests))})',
+            list(digests)).fetchall()
+        return {digest: json.loads(zlib.decompress(data)) for digest, data in rows}
+
+    def save(self, data, diagram_id=None, name=None, owner=None):
+        """
+        Saves a diagram in the editor's format ({nodes, edges, subprograms}).
+        Without diagram_id a new diagram is created; name and owner None keep
+        the stored ones. Returns (id, version); the version only advances
+        when the content changed.
+        """
+        program = {'nodes': data['nodes'], 'edges': data['edges']}
+        subprograms = data.get('subprograms') or {}
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                program_hash = self._put_blob(program)
+                sub_refs = json.dumps([[node_id, self._put_blob(sub)] for node_id, sub in subprograms.items()])
+
+                row = None
+                if diagram_id is not None:
+                    row = self._conn.execute(
+                        'SELECT d.version, d.name, d.owner, v.program, v.subprograms FROM diagrams d'
+                        ' JOIN versions v ON v.diagram_id = d.id AND v.version = d.version WHERE d.id = ?',
+                        (diagram_id,)).fetchone()
+                else:
+                    diagram_id = uuid.uuid4().hex
+
+                if row is None:
+                    version = 1
+                    self._conn.execute(
+                        'INSERT INTO diagrams (id, name, owner, version, created, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                        (diagram_id, name or DEFAULT_NAME, owner or '', version, now, now))
+                else:
+                    version, old_name, old_owner, old_program, old_subs = row
+                    name = name or old_name
+                    owner = old_owner if owner is None else owner
+                    if (old_program, old_subs) != (program_hash, sub_refs):
+                        version += 1
+                    elif name == old_name and owner == old_owner:
+                        # Nothing changed
+                        self._conn.execute('COMMIT')
+                        return diagram_id, version
+                    self._conn.execute(
+                        'UPDATE diagrams SET name = ?, owner = ?, version = ?, updated = ? WHERE id = ?',
+                        (name, owner, version, now, diagram_id))
+
+                self._conn.execute(
+                    'INSERT OR IGNORE INTO versions (diagram_id, version, program, subprograms, saved)'
+                    ' VALUES (?, ?, ?, ?, ?)',
+                    (diagram_id, version, program_hash, sub_refs, now))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return diagram_id, version
+
+    def load(self, diagram_id, version=None):
+        """
+        The diagram as saved: {id, name, owner, version, updated, nodes,
+        edges, subprograms}; the latest version unless one is given.
+        None if there is no such diagram or version.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT d.name, d.owner, v.version, v.saved, v.program, v.subprograms FROM diagrams d'
+                ' JOIN versions v ON v.diagram_id = d.id AND v.version = COALESCE(?, d.version)'
+                ' WHERE d.id = ?', (version, diagram_id)).fetchone()
+            if row is None:
+                return None
+            name, owner, version, saved, program_hash, sub_refs = row
+            sub_refs = json.loads(sub_refs)
+            blobs = self._get_blobs({program_hash, *(digest for _, digest in sub_refs)})
+        program = blobs[program_hash]
+        return {
+            'id': diagram_id,
+            'name': name,
+            'owner': owner,
+            'version': version,
+            'updated': saved,
+            'nodes': program['nodes'],
+            'edges': program['edges'],
+            'subprograms': {node_id: blobs[digest] for node_id, digest in sub_refs},
+        }
+
+    def list_diagrams(self, owner=None, name=None, limit=100, offset=0):
+        """
+        Diagrams without content, most recently updated first; name matches
+        as a prefix. limit is capped at MAX_LIST_LIMIT; a negative offset
+        raises ValueError.
+        """
+        if offset < 0:
+            raise ValueError('offset must not be negative')
+        where = []
+        params = []
+        if owner is not None:
+            where.append('owner = ?')
+            params.append(owner)
+        if name:
+            # Prefix range instead of LIKE, so the name index is used
+            where.append('name >= ? AND name < ?')
+            params += [name, name + '\U0010ffff']
+        sql = 'SELECT id, name, owner, version, created, updated FROM diagrams'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY updated DESC LIMIT ? OFFSET ?'
+        # SQLite reads a negative LIMIT as no limit at all
+        params += [max(0, min(limit, MAX_LIST_LIMIT)), offset]
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(zip(('id', 'name', 'owner', 'version', 'created', 'updated'), row)) for row in rows]
+
+    def versions(self, diagram_id):
+        """[(version, saved time), ...] of a diagram, oldest first."""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT version, saved FROM versions WHERE diagram_id = ? ORDER BY version',
+                (diagram_id,)).fetchall()
+
+    def stats(self):
+        with self._lock:
+            diagrams, = self._conn.execute('SELECT COUNT(*) FROM diagrams').fetchone()
+            versions, = self._conn.execute('SELECT COUNT(*) FROM versions').fetchone()
+            blobs, raw, stored = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM blobs').fetchone()
+        return {
+            'path': self.path,
+            'diagrams': diagrams,
+            'versions': versions,
+            'blobs': blobs,
+            'blob_bytes': raw,
+            'blob_bytes_compressed': stored,
+            'renders': self.renders.stats(),
+        }
@@ -0,0 +1,427 @@
+from array import array
+
+from metrics import trace_count
+from serving import check_deadline
+
+
+def predecessor_index(G):
+    """
+    Predecessor lists of a frozen FlowGraph in CSR form:
+    the predecessors of n are pred_nodes[pred_start[n]:pred_start[n+1]].
+    """
+    n = len(G)
+    succ_start, succ_nodes = G.succ_start, G.succ_nodes
+
+    pred_start = array('i', bytes(4 * (n + 1)))
+    for v in succ_nodes:
+        pred_start[v + 1] += 1
+    for i in range(n):
+        pred_start[i + 1] += pred_start[i]
+
+    fill = array('i', pred_start)
+    pred_nodes = array('i', bytes(4 * len(succ_nodes)))
+    for u in range(n):
+        for p in range(succ_start[u], succ_start[u + 1]):
+            v = succ_nodes[p]
+            pred_nodes[fill[v]] = u
+            fill[v] += 1
+    return pred_start, pred_nodes
+
+
+def immediate_post_dominators(G):
+    """
+    Immediate post-dominator of every node of a frozen FlowGraph.
+
+    Uses the Cooper-Harvey-Kennedy iteration ("A Simple, Fast Dominance
+    Algorithm") on the reversed graph, rooted at a virtual exit that every
+    node without successors leads to. Loop back-edges stay in the graph:
+    they are what connects a loop body to the loop's exit.
+
+    Returns an array where ipdom[n] is a node id, or -1 if n is only
+    post-dominated by the virtual exit or cannot reach an exit at all.
+    For a branch node, ipdom[n] is the node where its branches merge.
+    """
+    n = len(G)
+    exit_node = n
+    succ_start, succ_nodes = G.succ_start, G.succ_nodes
+    pred_start, pred_nodes = predecessor_index(G)
+
+    # Postorder of the reversed graph, walked iteratively from the virtual exit
+    po_num = array('i', [-1]) * (n + 1)
+    order = []
+    seen = bytearray(n + 1)
+    seen[exit_node] = 1
+    exits = [u for u in range(n) if succ_start[u] == succ_start[u + 1]]
+    stack = [(exit_node, 0)]
+    while stack:
+        node, i = stack[-1]
+        if node == exit_node:
+            children, lo = exits, 0
+            hi = len(exits)
+        else:
+            children, lo, hi = pred_nodes, pred_start[node], pred_start[node + 1]
+        while lo + i < hi and seen[children[lo + i]]:
+            i += 1
+        if lo + i < hi:
+            child = children[lo + i]
+            stack[-1] = (node, i + 1)
+            seen[child] = 1
+            stack.append((child, 0))
+        else:
+            stack.pop()
+            po_num[node] = len(order)
+            order.append(node)
+
+    idom = array('i', [-1]) * (n + 1)
+    idom[exit_node] = exit_node
+    order.pop()  # the virtual exit itself
+    order.reverse()
+
+    passes = 0
+    changed = True
+    while changed:
+        check_deadline()
+        changed = False
+        passes += 1
+        for b in order:
+            # Predecessors in the reversed graph are the successors in G
+            lo, hi = succ_start[b], succ_start[b + 1]
+            if lo == hi:
+                new_idom = exit_node
+            else:
+                new_idom = -1
+                for p in range(lo, hi):
+                    s = succ_nodes[p]
+                    if idom[s] == -1:
+                        continue
+                    if new_idom == -1:
+                        new_idom = s
+                        continue
+                    # Intersect: walk both fingers up to the common ancestor
+                    f1, f2 = s, new_idom
+                    while f1 != f2:
+                        while po_num[f1] < po_num[f2]:
+                            f1 = idom[f1]
+                        while po_num[f2] < po_num[f1]:
+                            f2 = idom[f2]
+                    new_idom = f1
+            if idom[b] != new_idom:
+                idom[b] = new_idom
+                changed = True
+
+    # Iterations until the dominator tree was stable
+    trace_count('postdom_passes', passes)
+
+    ipdom = idom[:n]
+    for b in range(n):
+        if ipdom[b] == exit_node:
+            ipdom[b] = -1
+    return ipdom
+
+
+# Kinds of loop headers in a LoopForest
+LOOP_NONE = 0           # not a loop header
+LOOP_SELF = 1           # only an edge to itself
+LOOP_REDUCIBLE = 2      # entered through the header only
+LOOP_IRREDUCIBLE = 3    # also entered in the middle, e.g. by a goto-like jump
+
+
+class LoopForest:
+    """
+    Loop-nesting forest of a frozen FlowGraph, see loop_forest().
+
+    kind:   per node, one of the LOOP_* kinds
+    header: per node, the header of the innermost loop containing it, -1
+            outside of all loops. A header's own entry is the loop around its
+            loop, so these are the parent links of the forest.
+    order:  the nodes reachable from the start, in depth-first preorder
+    """
+    __slots__ = ('kind', 'header', 'order', '_first', '_last')
+
+    def __init__(self, kind, header, order, first, last):
+        self.kind = kind
+        self.header = header
+        self.order = order
+        self._first = first
+        self._last = last
+
+    def is_header(self, n):
+        return self.kind[n] != LOOP_NONE
+
+    def contains(self, h, n):
+        """True if n belongs to the loop headed by h, h itself and nested loops included."""
+        return self._first[h] <= self._first[n] <= self._last[h]
+
+
+def loop_forest(G, start):
+    """
+    Finds the loops of a frozen FlowGraph reachable from start and how they
+    nest, in near-linear time (Havlak, "Nesting of Reducible and
+    Irreducible Loops"): a depth-first search classifies the edges into a
+    node's ancestors as back edges, then the nodes are visited in reverse
+    preorder and every loop collects its body by walking backwards from
+    the sources of its back edges, with inner loops already merged into
+    their headers by union-find. Nodes not reachable from start are in no
+    loop.
+    """
+    n = len(G)
+    succ_start, succ_nodes = G.succ_start, G.succ_nodes
+    pred_start, pred_nodes = predecessor_index(G)
+
+    # Preorder number of every reached node and the last number in its subtree:
+    # w is an ancestor of v in the search tree iff number[w] <= number[v] <= last[number[w]]
+    number = array('i', [-1]) * n
+    order = array('i')
+    last = array('i', bytes(4 * n))
+    if start is not None:
+        number[start] = 0
+        order.append(start)
+        stack = [(start, succ_start[start])]
+        while stack:
+            v, p = stack[-1]
+            if p < succ_start[v + 1]:
+                stack[-1] = (v, p + 1)
+                w = succ_nodes[p]
+                if number[w] < 0:
+                    number[w] = len(order)
+                    order.append(w)
+                    stack.append((w, succ_start[w]))
+            else:
+                stack.pop()
+                last[number[v]] = len(order) - 1
+    reached = len(order)
+
+    # From here on nodes are handled by their preorder number
+    kind = bytearray(n)
+    header = array('i', [-1]) * n
+    union = array('i', range(n))
+    member = array('i', [-1]) * n     # number of the loop a node was last collected for
+    entries = {}                      # extra loop entries handed to enclosing loops
+
+    def find(x):
+        while union[x] != x:
+            union[x] = union[union[x]]
+            x = union[x]
+        return x
+
+    def entry_edges(x):
+        # Sources of the forward and cross edges into x, i.e. not from its subtree
+        v = order[x]
+        for p in range(pred_start[v], pred_start[v + 1]):
+            y = number[pred_nodes[p]]
+            if y >= 0 and not x <= y <= last[x]:
+                yield y
+        yield from entries.get(x, ())
+
+    for w in range(reached - 1, -1, -1):
+        if not w & 0xFFF:
+            check_deadline()
+        body = []
+        v = order[w]
+        for p in range(pred_start[v], pred_start[v + 1]):
+            y = number[pred_nodes[p]]
+            if y < 0 or not w <= y <= last[w]:
+                continue
+            if y == w:
+                kind[w] = LOOP_SELF
+                continue
+            y = find(y)
+            if member[y] != w:
+                member[y] = w
+                body.append(y)
+        if not body:
+            continue
+
+        kind[w] = LOOP_REDUCIBLE
+        work = list(body)
+        while work:
+            x = work.pop()
+            for y in entry_edges(x):
+                y = find(y)
+                if not w <= y <= last[w]:
+                    # Entered from outside of w's subtree: w is not the only entry
+                    kind[w] = LOOP_IRREDUCIBLE
+                    entries.setdefault(w, []).append(y)
+                elif y != w and member[y] != w:
+                    member[y] = w
+                    body.append(y)
+                    work.append(y)
+        for x in body:
+            header[x] = w
+            union[x] = w
+
+    # Forest preorder intervals: a header has a smaller number than its loop's
+    # nodes, so one pass in number order places every node inside its parent
+    size = array('i', [1]) * n
+    for x in range(reached - 1, -1, -1):
+        if header[x] >= 0:
+            size[header[x]] += size[x]
+    first_by_number = array('i', bytes(4 * n))
+    cursor = array('i', bytes(4 * n))
+    roots = 0
+    for x in range(reached):
+        h = header[x]
+        if h < 0:
+            first_by_number[x] = roots
+            roots += size[x]
+        else:
+            first_by_number[x] = cursor[h]
+            cursor[h] += size[x]
+        cursor[x] = first_by_number[x] + 1
+
+    node_kind = bytearray(n)
+    node_header = array('i', [-1]) * n
+    first = array('i', bytes(4 * n))
+    last_in_loop = array('i', bytes(4 * n))
+    loops = 0
+    for x in range(reached):
+        v = order[x]
+        node_kind[v] = kind[x]
+        loops += kind[x] != LOOP_NONE
+        if header[x] >= 0:
+            node_header[v] = order[header[x]]
+        first[v] = first_by_number[x]
+        last_in_loop[v] = first_by_number[x] + size[x] - 1
+    # Unreached nodes: singletons after the reached ones
+    for v in range(n):
+        if number[v] < 0:
+            first[v] = last_in_loop[v] = roots
+            roots += 1
+
+    trace_count('loops', loops)
+    return LoopForest(node_kind, node_header, order, first, last_in_loop)
+
+
+def loop_head(G, loops, n):
+    """
+    (body start, exit) if n heads a loop the Struktogramm can show: two
+    successors, one inside n's loop and one outside. Else None.
+    """
+    if G.succ_start[n + 1] - G.succ_start[n] != 2 or not loops.is_header(n):
+        return None
+    a, b = G.successors(n)
+    in_a = loops.contains(n, a)
+    if in_a == loops.contains(n, b):
+        return None
+    return (a, b) if in_a else (b, a)
+
+
+# Node ids listed per problem of structure_problems()
+MAX_REPORTED_NODES = 100
+
+
+def structure_problems(G, start, ipdom, loops):
+    """
+    What keeps a frozen FlowGraph from being a Struktogramm, in linear
+    time from its post-dominators and loop forest. Returns a list of
+    {"problem", "nodes", "count"} with the Mermaid ids (at most
+    MAX_REPORTED_NODES) of:
+
+    multiple_entries:   nodes without predecessors, when there are several
+    irreducible_loop:   headers of loops that can be entered in the middle
+    endless_loop:       headers of the outermost loops that cannot be left
+    unstructured_loop:  headers of loops that are left other than by a test
+                        at the header, e.g. by a test at the end of the body
+                        or a jump out of the body
+    no_merge:           branch nodes with a branch that never reaches an end,
+                        so it cannot meet the others
+    jump:               nodes entered by more edges than the branches merging
+                        there explain, e.g. the target of a jump from one
+                        branch into another
+
+    Branches that each run to an end of the program count as merged.
+    """
+    n = len(G)
+    succ_start, succ_nodes = G.succ_start, G.succ_nodes
+    problems = {}
+
+    entries = [v for v in range(n) if G.in_degrees[v] == 0]
+    if len(entries) > 1:
+        problems['multiple_entries'] = entries
+    irreducible = [v for v in loops.order if loops.kind[v] == LOOP_IRREDUCIBLE]
+    if irreducible:
+        problems['irreducible_loop'] = irreducible
+
+    # Nodes from which an end (a node without successors) can be reached
+    pred_start, pred_nodes = predecessor_index(G)
+    reaches_end = bytearray(n)
+    work = [v for v in range(n) if succ_start[v] == succ_start[v + 1]]
+    for v in work:
+        reaches_end[v] = 1
+    while work:
+        v = work.pop()
+        for p in range(pred_start[v], pred_start[v + 1]):
+            u = pred_nodes[p]
+            if not reaches_end[u]:
+                reaches_end[u] = 1
+                work.append(u)
+
+    endless = [h for h in loops.order if loops.kind[h] != LOOP_NONE and not reaches_end[h]
+               and (loops.header[h] == -1 or reaches_end[loops.header[h]])]
+    if endless:
+        problems['endless_loop'] = endless
+
+    # A loop the Struktogramm can show is left by one edge only, the exit
+    # of the test at its header (see loop_head). Each edge leaving a loop is
+    # checked against the loops around its source up to the first one it
+    # stays in, stopping at the first bad one, so this stays linear.
+    bad_loop = bytearray(n)
+    for h in loops.order:
+        if loops.kind[h] in (LOOP_SELF, LOOP_REDUCIBLE) and reaches_end[h] and loop_head(G, loops, h) is None:
+            bad_loop[h] = 1
+    for u in loops.order:
+        inner = u if loops.is_header(u) else loops.header[u]
+        for p in range(succ_start[u], succ_start[u + 1]):
+            v = succ_nodes[p]
+            h = inner
+            if h == u and not loops.contains(h, v):
+                # The exit of u's own test; it may leave the loops around it too
+                h = loops.header[h]
+            if h != -1 and not loops.contains(h, v) and loops.kind[h] != LOOP_IRREDUCIBLE:
+                bad_loop[h] = 1
+    unstructured = [h for h in loops.order if bad_loop[h]]
+    if unstructured:
+        problems['unstructured_loop'] = unstructured
+
+    # Edges a node may be entered by: one from the flow before it, one more
+    # per extra branch of every branch node merging there. Back edges of a
+    # loop are counted apart: one from the end of the body, plus the extra
+    # branches merging at the header from inside the loop.
+    expected = array('i', [1]) * n
+    expected_back = array('i', [1]) * n
+    if start is not None:
+        expected[start] = 0
+    no_merge = []
+    for b in loops.order:
+        out = succ_start[b + 1] - succ_start[b]
+        if out < 2 or loop_head(G, loops, b) is not None:
+            continue
+        if not all(reaches_end[succ_nodes[p]] for p in range(succ_start[b], succ_start[b + 1])):
+            no_merge.append(b)
+            continue
+        m = ipdom[b]
+        if m == -1:
+            # Every branch runs to an end of its own
+            continue
+        if loops.is_header(m) and loops.contains(m, b):
+            expected_back[m] += out - 1
+        else:
+            expected[m] += out - 1
+    if no_merge:
+        problems['no_merge'] = no_merge
+
+    entered = array('i', bytes(4 * n))
+    entered_back = array('i', bytes(4 * n))
+    for u in loops.order:
+        for p in range(succ_start[u], succ_start[u + 1]):
+            v = succ_nodes[p]
+            if loops.is_header(v) and loops.contains(v, u):
+                entered_back[v] += 1
+            else:
+                entered[v] += 1
+    jumps = [v for v in loops.order if entered[v] > expected[v] or entered_back[v] > expected_back[v]]
+    if jumps:
+        problems['jump'] = jumps
+
+    return [{'problem': problem, 'nodes': [G.ids[v] for v in nodes[:MAX_REPORTED_NODES]], 'count': len(nodes)}
+            for problem, nodes in problems.items()]
@@ -0,0 +1,147 @@
+from array import array
+
+
+class FlowGraph:
+    """
+    Compact directed graph for parsed flowcharts.
+
+    Nodes are interned to consecutive integers in insertion order; `ids`,
+    `labels` and `types` are indexed by that integer. Edges are collected in
+    insertion order and, after freeze(), stored CSR-style: the successors of
+    node n are succ_nodes[succ_start[n]:succ_start[n+1]] with their edge
+    labels at the same positions in succ_labels.
+    """
+
+    def __init__(self):
+        self.ids = []        # int -> Mermaid id
+        self.index = {}      # Mermaid id -> int
+        self.labels = []
+        self.types = []
+
+        # Edge list while building; a repeated (source, target) only updates the label
+        self._edge_src = array('i')
+        self._edge_dst = array('i')
+        self._edge_labels = []
+        self._edge_pos = {}
+
+        self.succ_start = array('i', [0])
+        self.succ_nodes = array('i')
+        self.succ_labels = []
+        self.in_degrees = array('i')
+        self.frozen = True
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add_node(self, node_id, label, node_type):
+        """
+        Adds a node or, if it exists, takes over label and type when the
+        new label is more than the bare id. Returns the integer id.
+        """
+        n = self.index.get(node_id)
+        if n is None:
+            n = len(self.ids)
+            self.index[node_id] = n
+            self.ids.append(node_id)
+            self.labels.append(label)
+            self.types.append(node_type)
+            self.frozen = False
+        elif label != node_id:
+            self.labels[n] = label
+            self.types[n] = node_type
+        return n
+
+    def add_edge(self, source_id, target_id, label=''):
+        """Adds an edge between two Mermaid ids (nodes are created as needed)."""
+        u = self.index.get(source_id)
+        if u is None:
+            u = self.add_node(source_id, source_id, 'process')
+        v = self.index.get(target_id)
+        if v is None:
+            v = self.add_node(target_id, target_id, 'process')
+
+        if self._edge_pos is None:
+            self._edge_pos = {(s << 32) | d: e for e, (s, d) in enumerate(zip(self._edge_src, self._edge_dst))}
+        key = (u << 32) | v
+        pos = self._edge_pos.get(key)
+        if pos is None:
+            self._edge_pos[key] = len(self._edge_labels)
+            self._edge_src.append(u)
+            self._edge_dst.append(v)
+            self._edge_labels.append(label)
+            self.frozen = False
+        else:
+            self._edge_labels[pos] = label
+            self.frozen = False
+
+    def freeze(self):
+        """Builds the successor arrays and in-degrees from the edge list."""
+        n = len(self.ids)
+        src = self._edge_src
+        dst = self._edge_dst
+
+        start = array('i', bytes(4 * (n + 1)))
+        in_degrees = array('i', bytes(4 * n))
+        for u in src:
+            start[u + 1] += 1
+        for v in dst:
+            in_degrees[v] += 1
+        for i in range(n):
+            start[i + 1] += start[i]
+
+        # Stable placement keeps each node's successors in edge insertion order
+        fill = array('i', start)
+        nodes = array('i', bytes(4 * len(src)))
+        labels = [''] * len(src)
+        edge_labels = self._edge_labels
+        for e in range(len(src)):
+            u = src[e]
+            p = fill[u]
+            nodes[p] = dst[e]
+            labels[p] = edge_labels[e]
+            fill[u] = p + 1
+
+        self.succ_start = start
+        self.succ_nodes = nodes
+        self.succ_labels = labels
+        self.in_degrees = in_degrees
+        self.frozen = True
+        # The dedup index is only needed while edges are added; rebuilt on demand
+        self._edge_pos = None
+        return self
+
+    def successors(self, n):
+        return self.succ_nodes[self.succ_start[n]:self.succ_start[n + 1]]
+
+    def successor_labels(self, n):
+        return self.succ_labels[self.succ_start[n]:self.succ_start[n + 1]]
+
+    def edge_label(self, u, v):
+        for p in range(self.succ_start[u], self.succ_start[u + 1]):
+            if self.succ_nodes[p] == v:
+                return self.succ_labels[p]
+        return None
+
+    def in_degree(self, n):
+        return self.in_degrees[n]
+
+    def out_degree(self, n):
+        return self.succ_start[n + 1] - self.succ_start[n]
+
+    def start_node(self):
+        """First node without predecessors, else the first node, else None."""
+        for n, d in enumerate(self.in_degrees):
+            if d == 0:
+                return n
+        return 0 if self.ids else None
+
+    def to_networkx(self):
+        """Compatibility adapter: the same graph as a networkx.DiGraph keyed by Mermaid ids."""
+        import networkx as nx
+        G = nx.DiGraph()
+        for n, node_id in enumerate(self.ids):
+            G.add_node(node_id, label=self.labels[n], type=self.types[n])
+        for u, node_id in enumerate(self.ids):
+            for p in range(self.succ_start[u], self.succ_start[u + 1]):
+                G.add_edge(node_id, self.ids[self.succ_nodes[p]], label=self.succ_labels[p])
+        return G
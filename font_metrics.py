@@ -0,0 +1,115 @@
+"""
+Advance widths of the font the diagrams are drawn in.
+
+The SVGs use Arial (font-family="Arial, sans-serif"). Arial is metric
+compatible with Helvetica, so the widths below are the Helvetica AFM widths
+in 1/1000 em: printable ASCII, Latin-1 (umlauts, ß) and a few typographic
+characters that show up in labels. Characters without an entry get
+DEFAULT_WIDTH, East Asian wide characters a full em.
+
+Measuring is a table lookup per character. For Latin-1 text the lookup runs
+in C: bytes.translate() maps every byte to its width in quarter units and
+sum() adds them up, which also works for many texts at once (measure_many).
+"""
+import unicodedata
+
+FONT_FAMILY = 'Arial'
+UNITS_PER_EM = 1000
+DEFAULT_WIDTH = 556
+WIDE_WIDTH = 1000
+
+# ' ' .. '~'
+_ASCII_WIDTHS = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,  # space .. /
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,  # 0 .. ?
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,  # @ .. O
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,  # P .. _
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,  # ` .. o
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,  # p .. ~
+)
+
+# U+00A0 .. U+00FF
+_LATIN1_WIDTHS = (
+    278, 333, 556, 556, 556, 556, 260, 556, 333, 737, 370, 556, 584, 333, 737, 333,
+    400, 584, 333, 333, 333, 556, 537, 278, 333, 333, 365, 556, 834, 834, 834, 611,
+    667, 667, 667, 667, 667, 667, 1000, 722, 667, 667, 667, 667, 278, 278, 278, 278,
+    722, 722, 778, 778, 778, 778, 778, 584, 778, 722, 722, 722, 722, 667, 667, 611,
+    556, 556, 556, 556, 556, 556, 889, 500, 556, 556, 556, 556, 278, 278, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 584, 611, 556, 556, 556, 556, 500, 556, 500,
+)
+
+_EXTRA_WIDTHS = {
+    '–': 556, '—': 1000,
+    '‘': 222, '’': 222, '‚': 222,
+    '“': 333, '”': 333, '„': 333,
+    '•': 350, '…': 1000, '€': 556,
+    '←': 1000, '↑': 1000, '→': 1000, '↓': 1000,
+    '≠': 549, '≤': 549, '≥': 549,
+}
+
+# Widths of all characters with an entry
+WIDTHS = {chr(32 + i): w for i, w in enumerate(_ASCII_WIDTHS)}
+WIDTHS.update({chr(0xA0 + i): w for i, w in enumerate(_LATIN1_WIDTHS)})
+WIDTHS.update(_EXTRA_WIDTHS)
+WIDTHS['\t'] = WIDTHS[' ']
+
+# Latin-1 byte -> width / 4 (the widest glyph, '@', still fits into a byte).
+# Latin-1 text is therefore measured in steps of 4/1000 em. Control
+# characters have no width.
+_QUARTERS = bytes(round(WIDTHS[chr(b)] / 4) if chr(b) in WIDTHS else 0 for b in range(256))
+# For measure_many(): NUL separates the texts and becomes 255, which no glyph has
+_SEPARATED_QUARTERS = b'\xff' + _QUARTERS[1:]
+
+
+def char_width(ch):
+    """Advance width of one character in 1/1000 em, as text_units() counts it."""
+    code = ord(ch)
+    if code < 256:
+        return _QUARTERS[code] * 4
+    w = _EXTRA_WIDTHS.get(ch)
+    if w is not None:
+        return w
+    if unicodedata.east_asian_width(ch) in ('W', 'F'):
+        return WIDE_WIDTH
+    return DEFAULT_WIDTH
+
+
+def text_units(text):
+    """Advance width of a text in 1/1000 em."""
+    try:
+        return sum(text.encode('latin-1').translate(_QUARTERS)) * 4
+    except UnicodeEncodeError:
+        return sum(map(char_width, text))
+
+
+def measure(text, font_size):
+    """Width of a text in pixels at the given font size."""
+    # text_units() inlined, this runs once per block
+    try:
+        return sum(text.encode('latin-1').translate(_QUARTERS)) * 4 * font_size / UNITS_PER_EM
+    except UnicodeEncodeError:
+        return sum(map(char_width, text)) * font_size / UNITS_PER_EM
+
+
+def measure_many(texts, font_size):
+    """
+    Widths of many texts (labels, the words of a label) in pixels, measured
+    with one table lookup over all of them instead of one per text.
+    """
+    if not texts:
+        return []
+    joined = '\0'.join(texts)
+    try:
+        data = joined.encode('latin-1').translate(_SEPARATED_QUARTERS)
+    except UnicodeEncodeError:
+        data = None
+    if data is None or joined.count('\0') >= len(texts):
+        # Not Latin-1, or a text contains NUL itself
+        return [measure(text, font_size) for text in texts]
+    # Same arithmetic as measure(), so both give identical floats
+    return [sum(part) * 4 * font_size / UNITS_PER_EM for part in data.split(b'\xff')]
+
+
+def metrics_key():
+    """Identifies the width table, part of the render cache key."""
+    return (FONT_FAMILY, _QUARTERS, tuple(sorted(_EXTRA_WIDTHS.items())))
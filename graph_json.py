@@ -0,0 +1,147 @@
+"""
+Block tree from the editor's graph format (TreeState.toGraphFormat), without
+going through Mermaid text.
+
+    {"nodes": [{"id", "type", "text", "subRef"?}, ...],
+     "edges": [{"from", "to", "label"?}, ...]}
+
+The node types say what each node is, and the serializer fixes the edge
+order, so nothing has to be guessed from edge labels:
+    for_loop / while_loop / repeat_loop   edges [body, exit]
+    if_else                               edges [yes, no], merge at "<id>_merge"
+    case                                  one edge per branch, merge at "<id>_merge"
+    join                                  helper node, followed through
+"""
+
+from serving import check_deadline, check_depth, check_nodes
+
+LOOP_TYPES = frozenset(('for_loop', 'while_loop', 'repeat_loop'))
+START_NODE_ID = 'start_node_id'
+
+
+def validate_graph(data):
+    """Raises ValueError unless data looks like the graph format."""
+    if not isinstance(data, dict):
+        raise ValueError('graph must be an object')
+    nodes = data.get('nodes')
+    edges = data.get('edges')
+    if not isinstance(nodes, list) or not isinstance(edges, list):
+        raise ValueError('graph needs "nodes" and "edges" lists')
+    for node in nodes:
+        validate_node(node)
+    for edge in edges:
+        validate_edge(edge)
+
+
+def validate_node(node):
+    """Raises ValueError unless node is a node of the graph format with string fields."""
+    if not isinstance(node, dict) or not isinstance(node.get('id'), str):
+        raise ValueError('every node needs a string "id"')
+    for field in ('type', 'text', 'subRef'):
+        if node.get(field) is not None and not isinstance(node[field], str):
+            raise ValueError(f'"{field}" of node {node["id"]} must be a string')
+
+
+def validate_edge(edge):
+    """Raises ValueError unless edge is an edge of the graph format with string fields."""
+    if not isinstance(edge, dict) or not isinstance(edge.get('from'), str) or not isinstance(edge.get('to'), str):
+        raise ValueError('every edge needs string "from" and "to"')
+    if edge.get('label') is not None and not isinstance(edge['label'], str):
+        raise ValueError(f'label of edge {edge["from"]} -> {edge["to"]} must be a string')
+
+
+def start_node_id(nodes):
+    """The start node: start_node_id, else the first node of type start, else None."""
+    if START_NODE_ID in nodes:
+        return START_NODE_ID
+    for node_id, node in nodes.items():
+        if node.get('type') == 'start':
+            return node_id
+    return None
+
+
+def build_structure_from_graph(data):
+    """
+    Builds the same nested block list as converter.build_structure, read
+    from the graph format, with the node ids as block 'id'. Subprogram
+    calls become 'subprogram' blocks.
+    Returns None if the graph has no start node.
+    """
+    validate_graph(data)
+    check_nodes(len(data['nodes']))
+    nodes = {node['id']: node for node in data['nodes']}
+    successors = {}
+    for edge in data['edges']:
+        successors.setdefault(edge['from'], []).append((edge['to'], edge.get('label') or ''))
+
+    start = start_node_id(nodes)
+    if start is None:
+        return None
+
+    # Same explicit work stack as build_structure: frames are [node, stop_node, blocks]
+    root = []
+    visited = set()
+    stack = [[start, None, root]]
+    steps = 0
+
+    while stack:
+        steps += 1
+        if not steps & 0xFFF:
+            check_deadline()
+        frame = stack[-1]
+        node_id, stop_node, blocks = frame
+
+        if node_id is None or node_id == stop_node or node_id in visited or node_id not in nodes:
+            stack.pop()
+            continue
+
+        visited.add(node_id)
+        node = nodes[node_id]
+        node_type = node.get('type')
+        label = node.get('text') or ''
+        out = successors.get(node_id, ())
+
+        if node_type == 'join':
+            frame[0] = out[0][0] if out else None
+
+        elif node_type in LOOP_TYPES:
+            body_blocks = []
+            blocks.append({'id': node_id, 'type': 'loop', 'label': label, 'children': body_blocks})
+            frame[0] = out[1][0] if len(out) > 1 else None
+            stack.append([out[0][0] if out else None, node_id, body_blocks])
+
+        elif node_type == 'if_else' and len(out) == 2:
+            merge_node = node_id + '_merge'
+            yes_block = []
+            no_block = []
+            blocks.append({'id': node_id, 'type': 'decision', 'label': label, 'yes': yes_block, 'no': no_block})
+            frame[0] = merge_node
+            # Pushed in reverse so the yes branch is built first
+            stack.append([out[1][0], merge_node, no_block])
+            stack.append([out[0][0], merge_node, yes_block])
+
+        elif node_type == 'case' and out:
+            merge_node = node_id + '_merge'
+            branches = [{'label': b_label, 'children': []} for _, b_label in out]
+            blocks.append({'id': node_id, 'type': 'case', 'label': label, 'branches': branches})
+            frame[0] = merge_node
+            for (succ, _), branch in reversed(list(zip(out, branches))):
+                stack.append([succ, merge_node, branch['children']])
+
+        elif node_type == 'case':
+            # Without branches there is nothing to split; continue after it
+            blocks.append({'id': node_id, 'type': 'process', 'label': label})
+            frame[0] = node_id + '_merge'
+
+        elif node_type == 'subprogram':
+            blocks.append({'id': node_id, 'type': 'subprogram', 'label': label})
+            frame[0] = out[0][0] if out else None
+
+        else:
+            # start, end, command; empty commands are left out like in the Mermaid path
+            if node_type in ('start', 'end') or label.strip():
+                blocks.append({'id': node_id, 'type': 'process', 'label': label})
+            frame[0] = out[0][0] if out else None
+
+    check_depth(root)
+    return root
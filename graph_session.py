@@ -0,0 +1,130 @@
+"""
+Versioned copy of an editor diagram on the server, updated by deltas.
+
+The client uploads the diagram once ({nodes, edges, subprograms}, the
+graph format of graph_json) and then only sends what changed against the
+last version the server acknowledged:
+
+    {"base_version": 3,
+     "nodes": {"text":   {id: text, ...},         changed labels
+               "put":    [node, ...],             added or replaced nodes
+               "remove": [id, ...]},              also drops their outgoing edges
+     "edges": {id: [{"to", "label"?}, ...], ...},  new outgoing edges of a node
+     "subprograms": {"put": {id: {...}}, "remove": [id, ...]}}
+
+Edges are replaced per source node, because graph_json reads the meaning
+of a node's edges (yes/no, body/exit, case branches) from their order.
+A delta against another version than the current one is refused
+(VersionConflict); the client then uploads the whole diagram again.
+
+Sessions live in the memory of one process; behind several workers they
+need sticky routing, like live_session.
+"""
+import threading
+
+from graph_json import validate_edge, validate_graph, validate_node
+
+
+class VersionConflict(Exception):
+    """The delta was made against another version than the session's."""
+
+
+def _require(condition, message):
+    if not condition:
+        raise ValueError(message)
+
+
+class GraphSession:
+    """
+    nodes:       node id -> node, in upload order
+    out:         node id -> list of its outgoing edges
+    subprograms: subprogram id -> its graph ({name?, nodes, edges})
+    version:     1 after the upload, +1 per applied delta
+    """
+
+    def __init__(self, graph, subprograms=None):
+        validate_graph(graph)
+        _require(isinstance(subprograms or {}, dict), '"subprograms" must be an object')
+        for sub in (subprograms or {}).values():
+            validate_graph(sub)
+        self.nodes = {node['id']: node for node in graph['nodes']}
+        self.out = {}
+        for edge in graph['edges']:
+            self.out.setdefault(edge['from'], []).append(edge)
+        self.subprograms = dict(subprograms or {})
+        self.version = 1
+        self.lock = threading.Lock()
+
+    def graph(self):
+        """The current main program in the graph format."""
+        return {'nodes': list(self.nodes.values()),
+                'edges': [edge for edges in self.out.values() for edge in edges]}
+
+    def apply(self, delta):
+        """
+        Applies a delta (see the module docstring) and returns the new
+        version. Raises VersionConflict for a stale base_version and
+        ValueError for a malformed delta; the session is unchanged then.
+        """
+        _require(isinstance(delta, dict), 'delta must be an object')
+        base_version = delta.get('base_version')
+        # Not isinstance: True == 1 would pass as version 1
+        _require(type(base_version) is int, 'base_version must be an integer')
+        if base_version != self.version:
+            raise VersionConflict(f'session is at version {self.version}')
+
+        # Applied to shallow copies, so a bad delta leaves the session as it was
+        nodes = dict(self.nodes)
+        out = dict(self.out)
+        subprograms = dict(self.subprograms)
+
+        node_delta = delta.get('nodes') or {}
+        _require(isinstance(node_delta, dict), '"nodes" must be an object')
+        removed = node_delta.get('remove') or []
+        _require(isinstance(removed, list) and all(isinstance(i, str) for i in removed),
+                 '"nodes.remove" must be a list of node ids')
+        for node_id in removed:
+            nodes.pop(node_id, None)
+            out.pop(node_id, None)
+        put = node_delta.get('put') or []
+        _require(isinstance(put, list), '"nodes.put" must be a list')
+        for node in put:
+            validate_node(node)
+            nodes[node['id']] = node
+        texts = node_delta.get('text') or {}
+        _require(isinstance(texts, dict), '"nodes.text" must be an object')
+        for node_id, text in texts.items():
+            _require(node_id in nodes, f'unknown node {node_id}')
+            _require(isinstance(text, str), f'text of node {node_id} must be a string')
+            nodes[node_id] = {**nodes[node_id], 'text': text}
+
+        edge_delta = delta.get('edges') or {}
+        _require(isinstance(edge_delta, dict), '"edges" must be an object')
+        for node_id, edges in edge_delta.items():
+            _require(isinstance(edges, list), f'edges of {node_id} must be a list')
+            for edge in edges:
+                _require(isinstance(edge, dict), 'every edge must be an object')
+                validate_edge({**edge, 'from': node_id})
+            if edges:
+                out[node_id] = [{**edge, 'from': node_id} for edge in edges]
+            else:
+                out.pop(node_id, None)
+
+        sub_delta = delta.get('subprograms') or {}
+        _require(isinstance(sub_delta, dict), '"subprograms" must be an object')
+        sub_put = sub_delta.get('put') or {}
+        _require(isinstance(sub_put, dict), '"subprograms.put" must be an object')
+        for sub_id, sub in sub_put.items():
+            validate_graph(sub)
+            subprograms[sub_id] = sub
+        sub_removed = sub_delta.get('remove') or []
+        _require(isinstance(sub_removed, list) and all(isinstance(i, str) for i in sub_removed),
+                 '"subprograms.remove" must be a list of subprogram ids')
+        for sub_id in sub_removed:
+            subprograms.pop(sub_id, None)
+
+        self.nodes = nodes
+        self.out = out
+        self.subprograms = subprograms
+        self.version += 1
+        return self.version
@@ -0,0 +1,339 @@
+import functools
+
+from font_metrics import measure, measure_many
+from metrics import trace_stage
+
+# Constants for layout
+FONT_SIZE = 14
+LINE_HEIGHT = 20
+PADDING_X = 10
+PADDING_Y = 10
+MIN_BLOCK_WIDTH = 100
+MIN_DIAGRAM_WIDTH = 800
+LOOP_SPACER_WIDTH = 30
+SUBPROGRAM_BORDER = 4
+
+
+class BlockLayout:
+    """
+    Geometry of one block, stored as block['layout'].
+
+    measure_blocks() fills min_width and min_columns, arrange_blocks()
+    everything else. The renderer only reads these records.
+
+    min_columns:    minimum column widths of a decision or case, None otherwise
+    columns:        decision (yes, no), case one entry per branch,
+                    loop (spacer, content); not set for simple blocks
+    column_heights: height of the block list in each column (decision/case)
+    label_width:    width of the label text on one line
+    lines:          label lines as drawn
+    """
+    __slots__ = ('min_width', 'min_columns', 'label_width', 'x', 'y', 'width', 'height',
+                 'header_height', 'columns', 'column_heights', 'lines')
+
+    def __init__(self, min_width, min_columns=None, label_width=0):
+        # The remaining fields are assigned by arrange_blocks()
+        self.min_width = min_width
+        self.min_columns = min_columns
+        self.label_width = label_width
+
+    @property
+    def content_height(self):
+        return self.height - self.header_height
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def text_width(text):
+    """Width of a text in pixels, from the font's glyph widths (font_metrics)."""
+    return measure(text, FONT_SIZE)
+
+
+_COMPOUND_TYPES = frozenset(('decision', 'case', 'loop'))
+
+
+def child_sequences(block):
+    """The block lists nested directly inside a block, in column order."""
+    t = block['type']
+    if t == 'decision':
+        return (block['yes'], block['no'])
+    if t == 'case':
+        return [branch['children'] for branch in block['branches']]
+    if t == 'loop':
+        return (block['children'],)
+    return ()
+
+
+def count_blocks(blocks):
+    """Number of blocks in a block list, nested ones included."""
+    count = 0
+    stack = [blocks]
+    while stack:
+        seq = stack.pop()
+        count += len(seq)
+        for block in seq:
+            stack.extend(child_sequences(block))
+    return count
+
+
+def nesting_depth(blocks):
+    """How deep loops, decisions and cases are nested; 0 for a flat list."""
+    depth = 0
+    stack = [(blocks, 0)]
+    while stack:
+        seq, level = stack.pop()
+        if level > depth:
+            depth = level
+        for block in seq:
+            for child in child_sequences(block):
+                stack.append((child, level + 1))
+    return depth
+
+
+def sequence_min_width(blocks):
+    """Minimum width of a measured block list."""
+    max_width = MIN_BLOCK_WIDTH
+    for block in blocks:
+        w = block['layout'].min_width
+        if w > max_width:
+            max_width = w
+    return max_width
+
+
+def measure_block(block):
+    """
+    Measures a single block whose nested blocks are already measured, e.g.
+    after its label changed. An existing BlockLayout is updated in place and
+    keeps its arrangement. Returns the block's BlockLayout.
+    """
+    t = block['type']
+    text_w = text_width(block['label'])
+    label_width = text_w + PADDING_X * 2
+    min_columns = None
+
+    if t == 'decision':
+        yes_width = sequence_min_width(block['yes'])
+        no_width = sequence_min_width(block['no'])
+        # The sum of its branches, but at least wide enough for its header label
+        min_columns = [yes_width, no_width]
+        min_width = max(yes_width + no_width, label_width)
+
+    elif t == 'case':
+        min_columns = []
+        for branch in block['branches']:
+            # Branch needs to fit its label
+            b_text_w = text_width(branch['label']) + PADDING_X * 2
+            min_columns.append(max(sequence_min_width(branch['children']), b_text_w))
+        min_width = max(sum(min_columns), label_width)
+
+    elif t == 'loop':
+        children_width = sequence_min_width(block['children'])
+        min_width = max(label_width, children_width + LOOP_SPACER_WIDTH)
+
+    else:
+        min_width = label_width if label_width > MIN_BLOCK_WIDTH else MIN_BLOCK_WIDTH
+
+    lay = block.get('layout')
+    if lay is None:
+        lay = block['layout'] = BlockLayout(min_width, min_columns, text_w)
+    else:
+        lay.min_width = min_width
+        lay.min_columns = min_columns
+        lay.label_width = text_w
+    return lay
+
+
+def measure_blocks(blocks):
+    """
+    Bottom-up pass: annotates every block with a BlockLayout holding its
+    minimum width. Returns the minimum width of the whole list.
+    """
+    # Post-order on an explicit stack of block lists; a compound block is
+    # pushed as (block,) below its child lists and finished after them.
+    stack = [blocks]
+    while stack:
+        item = stack.pop()
+
+        if type(item) is not tuple:
+            for block in item:
+                if block['type'] in _COMPOUND_TYPES:
+                    stack.append((block,))
+                    stack.extend(child_sequences(block))
+                else:
+                    # Statement labels are mostly unique, text_width()'s cache would only churn
+                    text_w = measure(block['label'], FONT_SIZE)
+                    w = text_w + PADDING_X * 2
+                    block['layout'] = BlockLayout(w if w > MIN_BLOCK_WIDTH else MIN_BLOCK_WIDTH, None, text_w)
+            continue
+
+        measure_block(item[0])
+
+    return sequence_min_width(blocks)
+
+
+def column_widths(block, width):
+    """Column widths of a measured compound block placed at the given width."""
+    t = block['type']
+    lay = block['layout']
+    if t == 'decision':
+        yes_min, no_min = lay.min_columns
+        yes_w = width * (yes_min / (yes_min + no_min))
+        return [yes_w, width - yes_w]
+    if t == 'case':
+        # Distribute width proportionally to min_width
+        total_min = sum(lay.min_columns)
+        if total_min == 0: total_min = 1
+        return [width * (b_min / total_min) for b_min in lay.min_columns]
+    return [LOOP_SPACER_WIDTH, width - LOOP_SPACER_WIDTH]
+
+
+def arrange_blocks(blocks, x, y, width):
+    """
+    Top-down pass after measure_blocks(): assigns position, width, wrapped
+    label lines and height to every block, placing the list at (x, y) with
+    the given width. Returns the total height of the list.
+    """
+    # Frames are [blocks, index, x, y, width, height_so_far, owner, column];
+    # a bare BlockLayout on the stack finishes that block once its columns are done.
+    stack = [[blocks, 0, x, y, width, 0, None, 0]]
+    total_height = 0
+
+    while stack:
+        frame = stack[-1]
+
+        if type(frame) is BlockLayout:
+            # All columns of a compound block are placed
+            stack.pop()
+            lay = frame
+            lay.height = lay.header_height + max(lay.column_heights, default=0)
+            parent = stack[-1]
+            parent[1] += 1
+            parent[3] += lay.height
+            parent[5] += lay.height
+            continue
+
+        seq, i, x, y, width, seq_height, owner, column = frame
+        n = len(seq)
+        text_area_width = width - PADDING_X * 2
+
+        # Run of simple blocks: place them without going through the stack
+        while i < n:
+            block = seq[i]
+            t = block['type']
+            if t in _COMPOUND_TYPES:
+                break
+            lay = block['layout']
+            lay.x = x
+            lay.y = y
+            lay.width = width
+            # Doppelter Rahmen takes space on both sides
+            avail = text_area_width - SUBPROGRAM_BORDER * 2 if t == 'subprogram' else text_area_width
+            label = block['label']
+            if lay.label_width <= avail:
+                # wrap_text() fast path, using the width from measure_blocks()
+                words = label.split()
+                lines = [" ".join(words)] if words else [label]
+            else:
+                lines = list(_wrap_words(label, avail))
+            lay.lines = lines
+            lay.header_height = 0
+            h = len(lines) * LINE_HEIGHT + PADDING_Y * 2
+            if h < 40:
+                h = 40
+            lay.height = h
+            y += h
+            seq_height += h
+            i += 1
+
+        if i == n:
+            stack.pop()
+            if owner is None:
+                total_height = seq_height
+            else:
+                owner.column_heights[column] = seq_height
+            continue
+
+        frame[1] = i
+        frame[3] = y
+        frame[5] = seq_height
+
+        lay = block['layout']
+        lay.x = x
+        lay.y = y
+        lay.width = width
+        label = block['label']
+
+        # Header labels are drawn on a single line
+        lay.lines = [label] if label else []
+        text_height = len(lay.lines) * LINE_HEIGHT + PADDING_Y * 2
+
+        lay.columns = column_widths(block, width)
+        if t == 'decision':
+            yes_w, no_w = lay.columns
+            lay.header_height = max(40, text_height + 20)
+            columns = [(block['yes'], x, yes_w), (block['no'], x + yes_w, no_w)]
+
+        elif t == 'case':
+            columns = []
+            b_x = x
+            for branch, b_width in zip(block['branches'], lay.columns):
+                columns.append((branch['children'], b_x, b_width))
+                b_x += b_width
+            lay.header_height = max(40, text_height + 20)
+
+        else:
+            lay.header_height = max(30, text_height)
+            columns = [(block['children'], x + LOOP_SPACER_WIDTH, lay.columns[1])]
+
+        lay.column_heights = [0] * len(columns)
+        stack.append(lay)
+        content_y = y + lay.header_height
+        for k in range(len(columns) - 1, -1, -1):
+            c_blocks, c_x, c_w = columns[k]
+            stack.append([c_blocks, 0, c_x, content_y, c_w, 0, lay, k])
+
+    return total_height
+
+
+def layout_blocks(blocks, x=0, y=0, min_width=MIN_DIAGRAM_WIDTH):
+    """Measures and arranges a block list. Returns (width, height)."""
+    with trace_stage('measure'):
+        width = max(min_width, measure_blocks(blocks))
+    with trace_stage('arrange'):
+        height = arrange_blocks(blocks, x, y, width)
+    return width, height
+
+
+def wrap_text(text, max_width):
+    """
+    Simple word wrap
+    """
+    if text_width(text) <= max_width:
+        # Everything fits on one line
+        words = text.split()
+        return [" ".join(words)] if words else [text]
+    return list(_wrap_words(text, max_width))
+
+
+@functools.lru_cache(maxsize=1 << 14)
+def _wrap_words(text, max_width):
+    # Memoized per (text, width): equal labels in equal columns are wrapped once
+    words = text.split()
+    space = text_width(' ')
+    lines = []
+    current_line = []
+    current_len = 0
+
+    for word, word_len in zip(words, measure_many(words, FONT_SIZE)):
+        if current_len + word_len <= max_width:
+            current_line.append(word)
+            current_len += word_len + space
+        else:
+            if current_line:
+                lines.append(" ".join(current_line))
+            current_line = [word]
+            current_len = word_len
+
+    if current_line:
+        lines.append(" ".join(current_line))
+
+    return tuple(lines) if lines else (text,)
@@ -0,0 +1,122 @@
+"""
+The computed NSD layout as JSON, for clients that draw the diagram themselves.
+
+layout_blocks() gives every block a BlockLayout; document_layout() writes
+those of a PagedDocument (main program and subprograms, stacked as in the
+SVG) as parallel arrays instead of one object per block:
+
+    {"width": 800, "height": 1840,
+     "types": ["process", "subprogram", "decision", "case", "loop"],
+     "headings": {"name": [...], "y": [...]},      subprogram headings
+     "blocks": {
+        "id":     [...],   node id of the block
+        "type":   [...],   index into "types"
+        "parent": [...],   index of the enclosing block, -1 at the top level
+        "column": [...],   column of the parent the block is in (0 at the top level)
+        "x", "y", "width", "height": [...],
+        "header": [...],   header height of decision, case and loop, 0 otherwise
+        "lines":  [...],   number of label lines; the lines follow in "text"
+        "columns": [...]}, number of columns (decision 2, case one per branch,
+                           loop spacer and content, 0 otherwise); their
+                           widths, content heights and labels follow in
+     "text": [...],
+     "column_width": [...], "column_height": [...], "column_label": [...]}
+
+Blocks are in document order, a compound block before its nested blocks,
+so "parent" always points backwards. The flat arrays are read in block
+order with a running offset. Decision columns are yes/no, labelled by the
+renderer; only case columns carry a label, the others have null. Numbers
+are rounded to `precision` decimals.
+"""
+from layout import child_sequences
+
+BLOCK_TYPES = ('process', 'subprogram', 'decision', 'case', 'loop')
+_TYPE_INDEX = {t: k for k, t in enumerate(BLOCK_TYPES)}
+
+
+def _number(precision):
+    def num(v):
+        v = round(v, precision)
+        # 120.0 -> 120 keeps the JSON short
+        return int(v) if v == int(v) else v
+    return num
+
+
+def document_layout(doc, precision=2):
+    """The layout of a PagedDocument as a dict of parallel arrays (see the module docstring)."""
+    num = _number(precision)
+    ids, types, parents, columns_in, xs, ys, widths, heights, headers, line_counts, column_counts = (
+        [] for _ in range(11))
+    text = []
+    column_width = []
+    column_height = []
+    column_label = []
+    heading_names = []
+    heading_ys = []
+
+    for name, heading_y, blocks in doc.sections:
+        if name is not None:
+            heading_names.append(name)
+            heading_ys.append(num(heading_y))
+        # (block, parent index, column), first block on top
+        stack = [(block, -1, 0) for block in reversed(blocks)]
+        while stack:
+            block, parent, column = stack.pop()
+            index = len(ids)
+            lay = block['layout']
+            t = block['type']
+            ids.append(block['id'])
+            types.append(_TYPE_INDEX.get(t, 0))
+            parents.append(parent)
+            columns_in.append(column)
+            xs.append(num(lay.x))
+            ys.append(num(lay.y))
+            widths.append(num(lay.width))
+            heights.append(num(lay.height))
+            headers.append(num(lay.header_height))
+            line_counts.append(len(lay.lines))
+            text.extend(lay.lines)
+
+            sequences = child_sequences(block)
+            if not sequences:
+                column_counts.append(0)
+                continue
+            if t == 'loop':
+                # The spacer column holds nothing
+                sequences = ((), sequences[0])
+                heights_in = (0, lay.column_heights[0])
+            else:
+                heights_in = lay.column_heights
+            column_counts.append(len(sequences))
+            column_width.extend(num(w) for w in lay.columns)
+            column_height.extend(num(h) for h in heights_in)
+            if t == 'case':
+                column_label.extend(branch['label'] for branch in block['branches'])
+            else:
+                column_label.extend([None] * len(sequences))
+            for k in range(len(sequences) - 1, -1, -1):
+                stack.extend((child, index, k) for child in reversed(sequences[k]))
+
+    return {
+        'width': num(doc.width),
+        'height': num(doc.height),
+        'types': list(BLOCK_TYPES),
+        'headings': {'name': heading_names, 'y': heading_ys},
+        'blocks': {
+            'id': ids,
+            'type': types,
+            'parent': parents,
+            'column': columns_in,
+            'x': xs,
+            'y': ys,
+            'width': widths,
+            'height': heights,
+            'header': headers,
+            'lines': line_counts,
+            'columns': column_counts,
+        },
+        'text': text,
+        'column_width': column_width,
+        'column_height': column_height,
+        'column_label': column_label,
+    }
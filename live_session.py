@@ -0,0 +1,391 @@
+"""
+Incremental re-layout for the live preview.
+
+A LiveSession keeps the block tree of one diagram together with its
+BlockLayout records and applies edit operations to it. After an edit only
+the blocks on the path from the edited block up to the root are measured
+again. Only the highest block on that path whose column widths changed (or
+the edited block itself) is arranged again. Everything below it in its
+sequences is moved down or up by the height difference.
+
+Edit operations (JSON objects); "column" is the index into the block lists
+of the parent (decision: 0 yes, 1 no; case: branch index; loop: 0), a
+parent of null means the top level:
+
+    {"op": "set_label", "id": ..., "label": ..., "branch": k?}
+    {"op": "insert", "parent": id|null, "column": 0, "index": 2, "block": {...}}
+    {"op": "delete", "id": ...}
+    {"op": "move", "id": ..., "parent": id|null, "column": 0, "index": 0}
+
+Inserted blocks use the block tree shape ({"id", "type", "label", and
+"children" / "yes" + "no" / "branches"}).
+
+In the SVG every top-level block is a <g id="nsd-<id>">, so a client can
+swap in just the fragments an edit changed.
+
+Sessions live in the memory of one process; behind several workers they
+need sticky routing.
+"""
+import html
+import threading
+
+from converter import build_structure, check_structure, iter_render_blocks, parse_mermaid
+from graph_json import build_structure_from_graph
+from layout import (
+    MIN_DIAGRAM_WIDTH, arrange_blocks, child_sequences, column_widths,
+    layout_blocks, measure_block, measure_blocks, sequence_min_width,
+)
+from serving import check_deadline, check_depth, check_nodes
+
+BLOCK_TYPES = frozenset(('process', 'subprogram', 'loop', 'decision', 'case'))
+
+
+def _copy_block(spec):
+    """Validated copy of a block given in an insert operation."""
+    root = {}
+    stack = [(spec, root)]
+    while stack:
+        src, dst = stack.pop()
+        if not isinstance(src, dict) or src.get('type') not in BLOCK_TYPES:
+            raise ValueError(f'invalid block: {src!r:.80}')
+        if 'id' not in src:
+            raise ValueError('inserted blocks need an "id"')
+        dst['id'] = str(src['id'])
+        dst['type'] = t = src['type']
+        dst['label'] = str(src.get('label', ''))
+        if t == 'loop':
+            pairs = [(src.get('children', []), dst.setdefault('children', []))]
+        elif t == 'decision':
+            pairs = [(src.get('yes', []), dst.setdefault('yes', [])),
+                     (src.get('no', []), dst.setdefault('no', []))]
+        elif t == 'case':
+            branches = src.get('branches') or []
+            if not branches:
+                raise ValueError('a case needs at least one branch')
+            dst['branches'] = []
+            pairs = []
+            for branch in branches:
+                copy = {'label': str(branch.get('label', '')), 'children': []}
+                dst['branches'].append(copy)
+                pairs.append((branch.get('children', []), copy['children']))
+        else:
+            pairs = []
+        for src_seq, dst_seq in pairs:
+            for child in src_seq:
+                child_copy = {}
+                dst_seq.append(child_copy)
+                stack.append((child, child_copy))
+    return root
+
+
+def _iter_subtree(block):
+    stack = [block]
+    while stack:
+        b = stack.pop()
+        yield b
+        for seq in child_sequences(b):
+            stack.extend(seq)
+
+
+def _shift(block, delta):
+    for b in _iter_subtree(block):
+        b['layout'].y += delta
+
+
+class LiveSession:
+    """Block tree of one diagram with its layout, updated edit by edit."""
+
+    def __init__(self, blocks, min_width=MIN_DIAGRAM_WIDTH):
+        self.blocks = blocks
+        self.min_width = min_width
+        self.version = 0
+        self.lock = threading.Lock()
+        self._index = {}    # id -> block
+        self._parent = {}   # id -> (owner block or None for the top level, column)
+        self._register(blocks, None, 0)
+        self.width, self.height = layout_blocks(blocks, 0, 0, min_width)
+        # Top-level ids whose SVG changed in the current apply(); None means all
+        self._dirty = set()
+
+    @classmethod
+    def from_graph(cls, graph_data):
+        blocks = build_structure_from_graph(graph_data)
+        if blocks is None:
+            raise ValueError('No start node found')
+        return cls(blocks)
+
+    @classmethod
+    def from_mermaid(cls, mermaid_content):
+        graph, start_node = parse_mermaid(mermaid_content)
+        if start_node is None:
+            raise ValueError('No start node found')
+        analysis = check_structure(graph, start_node)
+        return cls(build_structure(graph, start_node, None, analysis=analysis))
+
+    # ── Bookkeeping ───────────────────────────────────────────
+
+    def _register(self, seq, owner, column):
+        stack = [(seq, owner, column)]
+        while stack:
+            seq, owner, column = stack.pop()
+            for block in seq:
+                block_id = block['id']
+                if block_id in self._index:
+                    raise ValueError(f'duplicate block id {block_id!r}')
+                self._index[block_id] = block
+                self._parent[block_id] = (owner, column)
+                for k, child_seq in enumerate(child_sequences(block)):
+                    stack.append((child_seq, block, k))
+
+    def _unregister(self, block):
+        for b in _iter_subtree(block):
+            del self._index[b['id']]
+            del self._parent[b['id']]
+
+    def _block(self, block_id):
+        block = self._index.get(block_id)
+        if block is None:
+            raise ValueError(f'unknown block id {block_id!r}')
+        return block
+
+    def _sequence(self, owner, column):
+        if owner is None:
+            return self.blocks
+        sequences = child_sequences(owner)
+        if not 0 <= column < len(sequences):
+            raise ValueError(f'block {owner["id"]!r} has no column {column}')
+        return sequences[column]
+
+    def _path(self, block):
+        """Blocks from the top level down to block."""
+        path = []
+        while block is not None:
+            path.append(block)
+            block = self._parent[block['id']][0]
+        path.reverse()
+        return path
+
+    def _mark(self, block):
+        if self._dirty is not None:
+            self._dirty.add(self._path(block)[0]['id'])
+
+    # ── Re-layout ─────────────────────────────────────────────
+
+    def _remeasure_up(self, block):
+        # Minimum widths from block up to the root; stops where nothing changes
+        while block is not None:
+            old = block['layout'].min_width
+            measure_block(block)
+            if block['layout'].min_width == old:
+                return
+            block = self._parent[block['id']][0]
+
+    def _check_root_width(self):
+        width = max(self.min_width, sequence_min_width(self.blocks))
+        if width == self.width:
+            return False
+        self.width = width
+        self.height = arrange_blocks(self.blocks, 0, 0, width)
+        self._dirty = None
+        return True
+
+    def _widened_ancestor(self, path):
+        # Highest block on the path whose columns no longer match its mins
+        for block in path:
+            lay = block['layout']
+            if column_widths(block, lay.width) != lay.columns:
+                return block
+        return None
+
+    def _rearrange(self, block):
+        lay = block['layout']
+        old_height = lay.height
+        arrange_blocks([block], lay.x, lay.y, lay.width)
+        self._mark(block)
+        owner, column = self._parent[block['id']]
+        seq = self._sequence(owner, column)
+        self._propagate(owner, column, self._position(seq, block) + 1, lay.height - old_height)
+
+    def _propagate(self, owner, column, index, delta):
+        """Moves seq[index:] by delta and resizes the enclosing blocks."""
+        while delta:
+            seq = self._sequence(owner, column)
+            for sibling in seq[index:]:
+                _shift(sibling, delta)
+                if owner is None:
+                    self._mark(sibling)
+            if owner is None:
+                self.height += delta
+                return
+            self._mark(owner)
+            lay = owner['layout']
+            lay.column_heights[column] += delta
+            new_height = lay.header_height + max(lay.column_heights, default=0)
+            delta = new_height - lay.height
+            lay.height = new_height
+            parent, column = self._parent[owner['id']]
+            index = self._position(self._sequence(parent, column), owner) + 1
+            owner = parent
+
+    @staticmethod
+    def _position(seq, block):
+        for i, b in enumerate(seq):
+            if b is block:
+                return i
+        raise ValueError(f'block {block["id"]!r} is not in its parent')
+
+    def _column_origin(self, owner, column):
+        # (x, width) of one of owner's block lists
+        if owner is None:
+            return 0, self.width
+        lay = owner['layout']
+        if owner['type'] == 'loop':
+            return lay.x + lay.columns[0], lay.columns[1]
+        # Added up in the same order as arrange_blocks, so the floats match
+        x = lay.x
+        for w in lay.columns[:column]:
+            x += w
+        return x, lay.columns[column]
+
+    def _sequence_changed(self, owner, column):
+        """After an insert/delete in owner's column: True if a wider re-layout handled it."""
+        if owner is not None:
+            self._remeasure_up(owner)
+        if self._check_root_width():
+            return True
+        if owner is not None:
+            widened = self._widened_ancestor(self._path(owner))
+            if widened is not None:
+                self._rearrange(widened)
+                return True
+        return False
+
+    # ── Edit operations ───────────────────────────────────────
+
+    def _set_label(self, op):
+        block = self._block(op.get('id'))
+        if 'branch' in op:
+            if block['type'] != 'case' or not 0 <= op['branch'] < len(block['branches']):
+                raise ValueError(f'block {block["id"]!r} has no branch {op["branch"]}')
+            block['branches'][op['branch']]['label'] = str(op.get('label', ''))
+        else:
+            block['label'] = str(op.get('label', ''))
+
+        self._remeasure_up(block)
+        if self._check_root_width():
+            return
+        widened = self._widened_ancestor(self._path(block)[:-1])
+        self._rearrange(widened if widened is not None else block)
+
+    def _insert(self, op, block=None):
+        owner = self._block(op['parent']) if op.get('parent') is not None else None
+        column = op.get('column', 0)
+        seq = self._sequence(owner, column)
+        index = op.get('index', len(seq))
+        if not 0 <= index <= len(seq):
+            raise ValueError(f'index {index} out of range')
+        if block is None:
+            block = _copy_block(op.get('block'))
+            check_nodes(len(self._index) + sum(1 for _ in _iter_subtree(block)))
+            measure_blocks([block])
+        # Also for a moved block: the target may be nested deeper
+        check_depth([block], len(self._path(owner)) if owner is not None else 0)
+
+        # Where the block goes, taken before the list changes
+        if index < len(seq):
+            y = seq[index]['layout'].y
+        elif seq:
+            last = seq[-1]['layout']
+            y = last.y + last.height
+        else:
+            y = 0 if owner is None else owner['layout'].y + owner['layout'].header_height
+
+        seq.insert(index, block)
+        self._register([block], owner, column)
+        self._mark(block)
+        if self._sequence_changed(owner, column):
+            return
+        x, width = self._column_origin(owner, column)
+        height = arrange_blocks([block], x, y, width)
+        self._propagate(owner, column, index + 1, height)
+
+    def _delete(self, op):
+        block = self._block(op.get('id'))
+        owner, column = self._parent[block['id']]
+        seq = self._sequence(owner, column)
+        index = self._position(seq, block)
+        height = block['layout'].height
+        if owner is not None:
+            self._mark(owner)
+        del seq[index]
+        self._unregister(block)
+        if self._sequence_changed(owner, column):
+            return block
+        self._propagate(owner, column, index, -height)
+        return block
+
+    def _move(self, op):
+        block = self._block(op.get('id'))
+        target = op.get('parent')
+        if target is not None and any(b['id'] == target for b in _iter_subtree(block)):
+            raise ValueError('cannot move a block into itself')
+        self._delete(op)
+        self._insert(op, block)
+
+    def apply(self, ops):
+        """
+        Applies a list of edit operations. Returns the ids of the top-level
+        blocks whose SVG changed, or None if the whole diagram changed.
+        On an error the session is left in an undefined state. Inserts and
+        moves are held to the node and depth limits of serving.enforce().
+        """
+        self._dirty = set()
+        handlers = {'set_label': self._set_label, 'insert': self._insert,
+                    'delete': self._delete, 'move': self._move}
+        for op in ops:
+            check_deadline()
+            handler = handlers.get(op.get('op')) if isinstance(op, dict) else None
+            if handler is None:
+                raise ValueError(f'unknown operation {op!r:.80}')
+            handler(op)
+        self.version += 1
+        dirty, self._dirty = self._dirty, set()
+        if dirty is not None:
+            dirty &= {b['id'] for b in self.blocks}
+        return dirty
+
+    # ── Output ────────────────────────────────────────────────
+
+    def _iter_fragment(self, block):
+        yield f'<g id="nsd-{html.escape(block["id"])}">'
+        yield from iter_render_blocks([block])
+        yield '</g>'
+
+    def svg(self):
+        parts = [f'<svg width="{self.width}" height="{self.height}" xmlns="http://www.w3.org/2000/svg" style="font-family: Arial, sans-serif;">']
+        for block in self.blocks:
+            parts.extend(self._iter_fragment(block))
+        parts.append('</svg>')
+        return ''.join(parts)
+
+    def fragments(self, ids):
+        """[{'id', 'svg'}] for the given top-level blocks, in document order."""
+        return [{'id': block['id'], 'svg': ''.join(self._iter_fragment(block))}
+                for block in self.blocks if block['id'] in ids]
+
+    def edit(self, ops, mode='fragments'):
+        """
+        apply() plus the response for the client: the full SVG, or the
+        changed fragments with the new size and top-level order. Falls back
+        to the full SVG when everything changed.
+        """
+        dirty = self.apply(ops)
+        if mode == 'full' or dirty is None:
+            return {'version': self.version, 'svg': self.svg()}
+        return {
+            'version': self.version,
+            'width': self.width,
+            'height': self.height,
+            'order': [block['id'] for block in self.blocks],
+            'fragments': self.fragments(dirty),
+        }
@@ -0,0 +1,94 @@
+import re
+
+# Node shapes the editor emits, one capture group per shape. Labels stop at
+# their closing quote or bracket, so a line with several shaped nodes
+# (`A["a"] --> B["b"]`) is never read as one long label.
+_SHAPES = (
+    r'\[\["([^"\n]*)"\]\]'       # [["..."]]  subprogram
+    r'|\["([^"\n]*)"\]'          # ["..."]    process
+    r'|\{"([^"\n]*)"\}'          # {"..."}    decision
+    r'|\(\["([^"\n]*)"\]\)'      # (["..."])  terminal / loop head
+    r'|\(\("([^"\n]*)"\)\)'      # (("..."))  loop
+    r'|\(\[([^\]\n]*)\]\)'       # ([...])    terminal
+)
+_SHAPE_TYPES = ('subprogram', 'process', 'decision', 'terminal', 'loop', 'terminal')
+
+# Node expression: identifier plus optional shape. Group 1 is the id, the
+# shape groups follow, so `lastindex` identifies the shape.
+_NODE_RE = re.compile(r'(\w+)\s*(?:' + _SHAPES + r')?')
+_NODE_TYPES = ('process', 'process') + _SHAPE_TYPES
+
+# One match per non-empty line. The two statement forms the editor emits
+# (`id --> id` with optional |label| and `id["label"]`) are decoded by the
+# regex itself; everything else lands in the last group for the slow path.
+_STATEMENT_RE = re.compile(
+    r'^[^\S\n]*(?:'
+    r'(?:graph|flowchart|classDef|%%|subgraph)[^\n]*'
+    r'|(\w+)[^\S\n]*(?:-->[^\S\n]*(?:\|([^|\n]*)\|[^\S\n]*)?(\w+)|' + _SHAPES + r')[^\S\n]*$'
+    r'|(\S[^\n]*))',
+    re.M,
+)
+
+# Optional `|label|` right after an arrow
+_EDGE_LABEL_RE = re.compile(r'[^\S\n]*(?:\|([^|\n]*)\|[^\S\n]*)?')
+
+
+def scan_mermaid(content, add_node, add_edge):
+    """
+    Single pass over Mermaid flowchart text.
+    Calls add_node(node_id, label, node_type) for every node occurrence and
+    add_edge(source_id, target_id, label) for every arrow, including each
+    hop of chained edges like `A --> B -->|x| C`.
+    A bare reference such as `B` is reported with label == node_id.
+    """
+    for m in _STATEMENT_RE.finditer(content):
+        node_id, edge_label, target, sub, proc, dec, term, loop, term2, other = m.groups()
+        if target is not None:
+            add_node(node_id, node_id, 'process')
+            add_node(target, target, 'process')
+            add_edge(node_id, target, edge_label or '')
+        elif node_id is not None:
+            if proc is not None: add_node(node_id, proc, 'process')
+            elif dec is not None: add_node(node_id, dec, 'decision')
+            elif term is not None: add_node(node_id, term, 'terminal')
+            elif sub is not None: add_node(node_id, sub, 'subprogram')
+            elif loop is not None: add_node(node_id, loop, 'loop')
+            else: add_node(node_id, term2, 'terminal')
+        elif other is not None:
+            _scan_statement(content, m.start(10), m.end(10), add_node, add_edge)
+
+
+def _scan_statement(content, pos, end, add_node, add_edge):
+    """General path for one line: shaped nodes on edges, chains, trailing text."""
+    m = _NODE_RE.match(content, pos, end)
+    prev_id = None
+    if m:
+        prev_id = m.group(1)
+        add_node(prev_id, m.group(m.lastindex), _NODE_TYPES[m.lastindex])
+        pos = m.end()
+
+    arrow = content.find('-->', pos, end)
+    while arrow != -1:
+        lm = _EDGE_LABEL_RE.match(content, arrow + 3, end)
+        m = _NODE_RE.match(content, lm.end(), end)
+        if m:
+            node_id = m.group(1)
+            add_node(node_id, m.group(m.lastindex), _NODE_TYPES[m.lastindex])
+            if prev_id:
+                add_edge(prev_id, node_id, lm.group(1) or '')
+            prev_id = node_id
+            pos = m.end()
+        else:
+            prev_id = None
+            pos = lm.end()
+        arrow = content.find('-->', pos, end)
+
+
+def parse_node_str(node_str):
+    """
+    Parses a single node expression like `A["Label"]`.
+    Returns (node_id, label, node_type) or (None, None, None).
+    """
+    m = _NODE_RE.match(node_str)
+    if not m: return None, None, None
+    return m.group(1), m.group(m.lastindex), _NODE_TYPES[m.lastindex]
@@ -0,0 +1,188 @@
+"""
+Pipeline instrumentation.
+
+The converter marks its stages with trace_stage() and reports sizes with
+trace_count(). Both only record something inside collect_trace(); outside
+of it they cost a context variable lookup, so the converter can stay
+instrumented when nobody is measuring.
+
+    with collect_trace() as trace:
+        convert_mermaid_to_nsd(text)
+    trace.stages   # {'parse': 0.0012, 'structure': ...} in seconds
+    trace.counts   # {'nodes': 120, 'edges': 131, ...}
+
+Work spread over threads records into a trace of its own per thread and
+adds it to the request's with trace_merge(); a Trace is not locked.
+
+MetricsRegistry aggregates finished traces into histograms and renders them
+in the Prometheus text format.
+"""
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+_active = ContextVar('nsd_trace', default=None)
+_NOT_TRACING = nullcontext()
+
+
+class Trace:
+    """Stage times (seconds) and counts of one conversion; repeated stages add up."""
+    __slots__ = ('stages', 'counts')
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+
+    def merge(self, other):
+        """Adds the stages and counts of another trace to this one."""
+        for name, seconds in other.stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+        for name, n in other.counts.items():
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def server_timing(self):
+        """The stages as a Server-Timing header value (durations in ms)."""
+        return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.stages.items())
+
+
+class _StageTimer:
+    __slots__ = ('stages', 'name', 'start')
+
+    def __init__(self, trace, name):
+        self.stages = trace.stages
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.stages[self.name] = self.stages.get(self.name, 0.0) + time.perf_counter() - self.start
+
+
+@contextmanager
+def collect_trace(trace=None):
+    """
+    Records the stages and counts of everything run inside the block, into
+    a new trace or, to carry on with one, into the given trace.
+    """
+    if trace is None:
+        trace = Trace()
+    token = _active.set(trace)
+    try:
+        yield trace
+    finally:
+        _active.reset(token)
+
+
+def tracing():
+    """True inside collect_trace(); for counts that are expensive to compute."""
+    return _active.get() is not None
+
+
+def trace_stage(name):
+    """Context manager adding the time spent in it to stage `name`."""
+    trace = _active.get()
+    if trace is None:
+        return _NOT_TRACING
+    return _StageTimer(trace, name)
+
+
+def trace_count(name, n):
+    trace = _active.get()
+    if trace is not None:
+        trace.counts[name] = trace.counts.get(name, 0) + n
+
+
+
+def trace_merge(other):
+    """Adds a finished trace (of a worker thread, say) to the active one."""
+    trace = _active.get()
+    if trace is not None:
+        trace.merge(other)
+
+
+# ── Aggregation ───────────────────────────────────────────────
+
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000, 10000000, 100000000)
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of (label, value) pairs."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}   # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, labels=()):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, series in sorted(self._series.items()):
+            for bound, n in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{_format_labels(labels + (("le", _format_value(bound)),))} {n}')
+            lines.append(f'{self.name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {series[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(series[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {series[-1]}')
+        return lines
+
+
+class MetricsRegistry:
+    """Thread-safe collection of conversion metrics, exported as Prometheus text."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_seconds = Histogram('nsd_stage_seconds', 'Time spent per conversion stage.', TIME_BUCKETS)
+        self._count_histograms = {}
+        self._requests = {}   # (endpoint, status) -> count
+
+    def observe(self, trace, endpoint, status):
+        with self._lock:
+            for name, seconds in trace.stages.items():
+                self.stage_seconds.observe(seconds, (('stage', name),))
+            for name, n in trace.counts.items():
+                hist = self._count_histograms.get(name)
+                if hist is None:
+                    hist = self._count_histograms[name] = Histogram(
+                        f'nsd_{name}', f'{name.replace("_", " ").capitalize()} per conversion.', SIZE_BUCKETS)
+                hist.observe(n)
+            key = (endpoint, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def render(self, extra=()):
+        """Prometheus text exposition; extra is a list of (name, type, help, value) samples."""
+        with self._lock:
+            lines = ['# HELP nsd_requests_total Instrumented requests by endpoint and status.',
+                     '# TYPE nsd_requests_total counter']
+            for (endpoint, status), n in sorted(self._requests.items()):
+                lines.append(f'nsd_requests_total{_format_labels((("endpoint", endpoint), ("status", status)))} {n}')
+            lines.extend(self.stage_seconds.render())
+            for name in sorted(self._count_histograms):
+                lines.extend(self._count_histograms[name].render())
+        for name, metric_type, help_text, value in extra:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import font_metrics
+import layout
+
+# Bump when the SVG output changes for the same input, so stale entries
+# in a shared disk cache are not served.
+CACHE_VERSION = 3
+
+
+def _normalize_mermaid(text):
+    # Indentation, trailing whitespace, CRLF and blank lines do not change the result.
+    # Only \n ends a statement: splitlines would also split at \u2028 and
+    # friends inside a label, so two different diagrams would share a key.
+    lines = text.replace('\r\n', '\n').split('\n')
+    return '\n'.join(line for line in (l.strip() for l in lines) if line)
+
+
+def _graph_json(graph):
+    # Key order does not matter, list order does (it is the edge order)
+    return json.dumps({'nodes': graph.get('nodes', []), 'edges': graph.get('edges', [])},
+                      sort_keys=True, separators=(',', ':'))
+
+
+def _source_bytes(source):
+    # Tagged with the kind of source, so Mermaid text and a graph never share a key
+    if isinstance(source, str):
+        return b'mermaid\0' + _normalize_mermaid(source).encode()
+    return b'graph\0' + _graph_json(source).encode()
+
+
+def _layout_constants():
+    return (layout.FONT_SIZE, font_metrics.metrics_key(), layout.LINE_HEIGHT,
+            layout.PADDING_X, layout.PADDING_Y, layout.MIN_BLOCK_WIDTH,
+            layout.MIN_DIAGRAM_WIDTH, layout.LOOP_SPACER_WIDTH,
+            layout.SUBPROGRAM_BORDER)
+
+
+def cache_key(source, subprograms=None, options=None):
+    """
+    Content hash of a conversion request: the program (normalized Mermaid
+    text or a graph dict with nodes/edges), the subprograms in order, output
+    options and the layout constants. Used as cache key and as ETag.
+    """
+    h = hashlib.sha256()
+    h.update(repr((CACHE_VERSION, _layout_constants(), sorted((options or {}).items()))).encode())
+    h.update(b'\0')
+    h.update(_source_bytes(source))
+    for node_id, sub_data in (subprograms or {}).items():
+        h.update(b'\0sub\0')
+        h.update(str(node_id).encode())
+        h.update(b'\0')
+        h.update(str(sub_data.get('name', node_id)).encode())
+        h.update(b'\0')
+        h.update(_normalize_mermaid(sub_data.get('mermaid', '')).encode())
+        if 'nodes' in sub_data:
+            h.update(b'\0')
+            h.update(_graph_json(sub_data).encode())
+    return h.hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU, capped by entry count and total size.
+    The size of a value is len(value) unless put() is given one.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        if size is None:
+            size = len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class DiskCache:
+    """
+    SQLite-backed cache tier that several worker processes can share.
+    Values are stored zlib-compressed; once the file holds more than
+    max_bytes of compressed data the least recently used entries go,
+    down to PRUNE_TARGET of max_bytes so a full cache is not pruned on
+    every put. Triggers keep the total size in nsd_cache_size, so a put
+    does not sum up the table.
+    """
+    PRUNE_TARGET = 0.9
+    # A hit only writes its access time when the stored one is older than
+    # this many seconds, so reading hot entries does not take the write lock
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # INSERT OR REPLACE only fires the delete trigger for the replaced row with this on
+        self._conn.execute('PRAGMA recursive_triggers=ON')
+        self._conn.executescript(
+            'BEGIN IMMEDIATE;'
+            'CREATE TABLE IF NOT EXISTS nsd_cache ('
+            ' key TEXT PRIMARY KEY, value BLOB NOT NULL,'
+            ' size INTEGER NOT NULL, accessed REAL NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS nsd_cache_accessed ON nsd_cache (accessed);'
+            'CREATE TABLE IF NOT EXISTS nsd_cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL);'
+            'INSERT OR IGNORE INTO nsd_cache_size SELECT 0, COALESCE(SUM(size), 0) FROM nsd_cache;'
+            'CREATE TRIGGER IF NOT EXISTS nsd_cache_added AFTER INSERT ON nsd_cache BEGIN'
+            ' UPDATE nsd_cache_size SET total = total + new.size; END;'
+            'CREATE TRIGGER IF NOT EXISTS nsd_cache_removed AFTER DELETE ON nsd_cache BEGIN'
+            ' UPDATE nsd_cache_size SET total = total - old.size; END;'
+            'COMMIT;')
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _total(self):
+        return self._conn.execute('SELECT total FROM nsd_cache_size').fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT value, accessed FROM nsd_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            now = time.time()
+            if now - row[1] >= self.TOUCH_INTERVAL:
+                self._conn.execute('UPDATE nsd_cache SET accessed = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def put(self, key, value):
+        blob = zlib.compress(value.encode('utf-8'))
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO nsd_cache (key, value, size, accessed) VALUES (?, ?, ?, ?)',
+                (key, blob, len(blob), time.time()))
+            total = self._total()
+            if total > self.max_bytes:
+                self._prune(total)
+
+    def _prune(self, total):
+        target = self.max_bytes * self.PRUNE_TARGET
+        doomed = []
+        for key, size in self._conn.execute('SELECT key, size FROM nsd_cache ORDER BY accessed'):
+            if total <= target:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany('DELETE FROM nsd_cache WHERE key = ?', doomed)
+        self.evictions += len(doomed)
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM nsd_cache').fetchone()[0]
+            total = self._total()
+        return {
+            'path': self.path,
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class NSDCache:
+    """In-memory LRU in front of an optional shared DiskCache."""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, disk_path=None, disk_max_bytes=512 * 1024 * 1024):
+        self.memory = LRUCache(max_entries, max_bytes)
+        self.disk = DiskCache(disk_path, disk_max_bytes) if disk_path else None
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        return value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def stats(self):
+        return {
+            'memory': self.memory.stats(),
+            'disk': self.disk.stats() if self.disk is not None else None,
+        }
+
+    @classmethod
+    def from_env(cls):
+        """
+        Configuration via environment, so every gunicorn worker started from
+        wsgi.py gets the same settings:
+          NSD_CACHE_ENTRIES, NSD_CACHE_BYTES   in-memory limits (0 entries disables)
+          NSD_CACHE_DB, NSD_CACHE_DB_BYTES     shared SQLite file and its size cap
+        """
+        return cls(
+            max_entries=int(os.environ.get('NSD_CACHE_ENTRIES', 256)),
+            max_bytes=int(os.environ.get('NSD_CACHE_BYTES', 64 * 1024 * 1024)),
+            disk_path=os.environ.get('NSD_CACHE_DB') or None,
+            disk_max_bytes=int(os.environ.get('NSD_CACHE_DB_BYTES', 512 * 1024 * 1024)),
+        )
@@ -0,0 +1,358 @@
+"""
+Paginated and viewport rendering of large diagrams.
+
+A PagedDocument lays out the main program and its subprograms once, stacked
+like in convert_mermaid_to_nsd, and can then render any part of it:
+
+    doc = load_document(mermaid_text, subprograms)
+    for svg in doc.iter_pages(PAGE_HEIGHTS['a4']):   # lazily, one page at a time
+        ...
+    doc.viewport(2000, 3000)                          # only the blocks in that range
+
+Pages are cut at block boundaries only: no simple block, block header or
+subprogram heading is split. Where parallel columns never end at the same
+height, a page ends at a ragged edge instead: the blocks crossing the cut
+line stay on the page, which is then a little taller than the cut. Where
+a cut goes through loops, decisions or cases, the next page starts with a
+continuation row per split block (loop spine, decision/case columns with
+their labels), nested blocks one row further down.
+"""
+import html
+
+from compact_svg import STYLE as COMPACT_STYLE, iter_render_compact, number_format
+from converter import (
+    SUBPROGRAM_GAP, SUBPROGRAM_LABEL_H, build_tree, iter_render_blocks,
+    subprogram_heading, subprogram_sources,
+)
+from layout import child_sequences, layout_blocks
+
+# Page heights in CSS pixels (96 dpi), portrait
+PAGE_HEIGHTS = {'a4': 1123, 'a3': 1587, 'letter': 1056}
+# Lower pages would mostly hold a single block and its continuation rows
+MIN_PAGE_HEIGHT = 200
+CONTINUATION_ROW = 24  # Height of the repeated header row of a split block
+
+_COMPOUND_TYPES = frozenset(('decision', 'case', 'loop'))
+
+
+def _first_below(seq, y):
+    # Index of the first block of a laid-out list whose bottom is below y
+    lo, hi = 0, len(seq)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        lay = seq[mid]['layout']
+        if lay.y + lay.height <= y:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _sequence_range(seq, y_from, y_to, by_top):
+    """(i, j) such that seq[i:j] are the blocks in [y_from, y_to), see visible_blocks."""
+    i = _first_below(seq, y_from)
+    if by_top and i < len(seq) and seq[i]['type'] not in _COMPOUND_TYPES and seq[i]['layout'].y < y_from:
+        i += 1
+    j = i
+    while j < len(seq) and seq[j]['layout'].y < y_to:
+        j += 1
+    return i, j
+
+
+def visible_blocks(blocks, y_from, y_to, by_top=False):
+    """
+    Copy of a laid-out block list with only the blocks that intersect
+    [y_from, y_to), at any depth. With by_top, simple blocks are only taken
+    if they start in the range, as a page owns the blocks that start on it.
+    The copies share the BlockLayout records, so the renderers draw them
+    where they are in the full diagram.
+    """
+    root = []
+    stack = [(blocks, root)]
+    while stack:
+        seq, out = stack.pop()
+        i, j = _sequence_range(seq, y_from, y_to, by_top)
+        for block in seq[i:j]:
+            t = block['type']
+            if t == 'decision':
+                copy = dict(block, yes=[], no=[])
+                stack.append((block['yes'], copy['yes']))
+                stack.append((block['no'], copy['no']))
+            elif t == 'case':
+                copy = dict(block, branches=[dict(branch, children=[]) for branch in block['branches']])
+                for branch, branch_copy in zip(block['branches'], copy['branches']):
+                    stack.append((branch['children'], branch_copy['children']))
+            elif t == 'loop':
+                copy = dict(block, children=[])
+                stack.append((block['children'], copy['children']))
+            else:
+                copy = block
+            out.append(copy)
+    return root
+
+
+def _outside(points, intervals):
+    # The sorted points that lie inside none of the open intervals
+    intervals = sorted(intervals)
+    merged = []
+    for a, b in intervals:
+        # Touching intervals stay apart, their common end is outside both
+        if merged and a < merged[-1][1]:
+            if b > merged[-1][1]:
+                merged[-1][1] = b
+        else:
+            merged.append([a, b])
+    result = []
+    k = 0
+    for p in points:
+        while k < len(merged) and merged[k][1] <= p:
+            k += 1
+        if k < len(merged) and merged[k][0] < p:
+            continue
+        result.append(p)
+    return result
+
+
+def _index_at_most(values, limit):
+    # Index of the largest of the sorted values <= limit, 0 if there is none
+    lo, hi = 0, len(values)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if values[mid] <= limit:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo - 1 if lo else 0
+
+
+class PagedDocument:
+    """A laid-out diagram with its subprograms, rendered in parts."""
+
+    def __init__(self, blocks, subprograms=None):
+        width, height = layout_blocks(blocks)
+        # (heading name or None for the main program, heading y, blocks)
+        self.sections = [(None, 0, blocks)]
+        for name, source in subprogram_sources(subprograms):
+            tree = build_tree(source)
+            if tree is None:
+                continue
+            heading_y = height + SUBPROGRAM_GAP
+            sub_w, sub_h = layout_blocks(tree, 0, heading_y + SUBPROGRAM_LABEL_H)
+            self.sections.append((name, heading_y, tree))
+            width = max(width, sub_w)
+            height = heading_y + SUBPROGRAM_LABEL_H + sub_h
+        self.width = width
+        self.height = height
+        self.cuts, self.ragged_cuts = self._valid_cuts()
+
+    def _iter_blocks(self):
+        stack = [block for _, _, blocks in self.sections for block in blocks]
+        while stack:
+            block = stack.pop()
+            yield block
+            for seq in child_sequences(block):
+                stack.extend(seq)
+
+    def _valid_cuts(self):
+        """
+        Sorted y positions where a page may end: (cuts between blocks in
+        every column, cuts that only avoid block headers and headings).
+        """
+        # Open intervals no cut may go through
+        headers = []
+        leaves = []
+        for name, heading_y, blocks in self.sections:
+            if name is not None and blocks:
+                # The heading stays with the first block (or its header)
+                first = blocks[0]
+                first_lay = first['layout']
+                unit = first_lay.header_height if first['type'] in _COMPOUND_TYPES else first_lay.height
+                headers.append((heading_y, first_lay.y + unit))
+        for block in self._iter_blocks():
+            lay = block['layout']
+            if block['type'] in _COMPOUND_TYPES:
+                headers.append((lay.y, lay.y + lay.header_height))
+            else:
+                leaves.append((lay.y, lay.y + lay.height))
+
+        points = {0, self.height}
+        for a, b in headers + leaves:
+            points.add(a)
+            points.add(b)
+        points = sorted(points)
+        return _outside(points, headers + leaves), _outside(points, headers)
+
+    def _bottom(self, y):
+        """Lowest bottom of the simple blocks crossing y, or y if none does."""
+        bottom = y
+        stack = [blocks for _, _, blocks in self.sections]
+        while stack:
+            seq = stack.pop()
+            i = _first_below(seq, y)
+            if i == len(seq) or seq[i]['layout'].y >= y:
+                continue
+            block = seq[i]
+            if block['type'] in _COMPOUND_TYPES:
+                stack.extend(child_sequences(block))
+            else:
+                bottom = max(bottom, block['layout'].y + block['layout'].height)
+        return bottom
+
+    def split_blocks(self, y):
+        """(level, block) for every loop, decision or case that a cut at y goes through."""
+        found = []
+        stack = [(blocks, 0) for _, _, blocks in self.sections]
+        while stack:
+            seq, level = stack.pop()
+            i = _first_below(seq, y)
+            if i == len(seq):
+                continue
+            block = seq[i]
+            lay = block['layout']
+            if lay.y < y and block['type'] in _COMPOUND_TYPES:
+                found.append((level, block))
+                for child_seq in child_sequences(block):
+                    stack.append((child_seq, level + 1))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def continuation_height(self, y):
+        """Height of the continuation rows a page starting at y begins with."""
+        split = self.split_blocks(y)
+        return (split[-1][0] + 1) * CONTINUATION_ROW if split else 0
+
+    def page_breaks(self, page_height):
+        """
+        [(y_from, y_to)] of the pages, each at most page_height high with its
+        continuation rows and ragged edge, unless a single block is taller.
+        """
+        if page_height < MIN_PAGE_HEIGHT:
+            raise ValueError(f'page height must be at least {MIN_PAGE_HEIGHT} px')
+        breaks = []
+        start = 0
+        while start < self.height:
+            limit = start + page_height - self.continuation_height(start)
+            # A clean cut, if the page gets at least half full with it
+            end = self.cuts[_index_at_most(self.cuts, limit)]
+            if end <= start + page_height / 2:
+                # Else a ragged one: the blocks crossing it must fit as well
+                ragged = self.ragged_cuts
+                k = _index_at_most(ragged, limit)
+                while k > 0 and ragged[k] > max(end, start):
+                    if self._bottom(ragged[k]) <= limit:
+                        end = ragged[k]
+                        break
+                    k -= 1
+            if end <= start:
+                # Not even one block fits: the page gets taller
+                end = next(c for c in self.cuts if c > start)
+            breaks.append((start, end))
+            start = end
+        return breaks
+
+    # ── Rendering ─────────────────────────────────────────────
+
+    def _iter_content(self, y_from, y_to, precision, id_prefix, by_top=False):
+        # Headings and blocks in [y_from, y_to) (see visible_blocks), in document coordinates
+        for k, (name, heading_y, blocks) in enumerate(self.sections):
+            if name is not None and heading_y < y_to and heading_y + SUBPROGRAM_LABEL_H > y_from:
+                yield subprogram_heading(name, heading_y, precision)
+            visible = visible_blocks(blocks, y_from, y_to, by_top)
+            if precision is None:
+                yield from iter_render_blocks(visible)
+            else:
+                yield from iter_render_compact(visible, precision, f'{id_prefix}{k}_')
+
+    def _svg_open(self, height, precision, extra=''):
+        if precision is None:
+            return (f'<svg width="{self.width}" height="{height}"{extra} xmlns="http://www.w3.org/2000/svg" '
+                    f'style="font-family: Arial, sans-serif;">')
+        num = number_format(precision)
+        return (f'<svg class="nsd" width="{num(self.width)}" height="{num(height)}"{extra} '
+                f'xmlns="http://www.w3.org/2000/svg">' + COMPACT_STYLE)
+
+    def _iter_continuation(self, y, band, num):
+        # The rows repeating the split blocks above y; styles inline, so they
+        # look the same in classic and compact documents
+        for level, block in self.split_blocks(y):
+            lay = block['layout']
+            row_y = level * CONTINUATION_ROW
+            label = html.escape(block['label'])
+            text_style = 'font-size:12px;font-style:italic;font-family:Arial,sans-serif'
+            if block['type'] == 'loop':
+                spacer_w, content_w = lay.columns
+                yield (f'<rect x="{num(lay.x)}" y="{row_y}" width="{num(lay.width)}" height="{CONTINUATION_ROW}" '
+                       f'style="fill:#e2e8f0;stroke:#000;stroke-width:1"/>')
+                if band > row_y + CONTINUATION_ROW:
+                    below = band - row_y - CONTINUATION_ROW
+                    yield (f'<rect x="{num(lay.x)}" y="{row_y + CONTINUATION_ROW}" width="{num(spacer_w)}" height="{below}" '
+                           f'style="fill:#e2e8f0;stroke:#000;stroke-width:1"/>')
+                    yield (f'<rect x="{num(lay.x + spacer_w)}" y="{row_y + CONTINUATION_ROW}" width="{num(content_w)}" '
+                           f'height="{below}" style="fill:#fff;stroke:#000;stroke-width:1"/>')
+                yield f'<text x="{num(lay.x + 10)}" y="{row_y + 16}" style="{text_style}">{label} (Forts.)</text>'
+                continue
+
+            if block['type'] == 'decision':
+                column_labels = ['Ja', 'Nein']
+            else:
+                column_labels = [html.escape(branch['label']) for branch in block['branches']]
+            x = lay.x
+            for i, (column_w, column_label) in enumerate(zip(lay.columns, column_labels)):
+                text = f'{label}: {column_label}' if i == 0 else column_label
+                yield (f'<rect x="{num(x)}" y="{row_y}" width="{num(column_w)}" height="{band - row_y}" '
+                       f'style="fill:#fff;stroke:#000;stroke-width:1"/>')
+                yield f'<text x="{num(x + 6)}" y="{row_y + 16}" style="{text_style}">{text}</text>'
+                x += column_w
+
+    def iter_page(self, y_from, y_to, precision=None, id_prefix='p'):
+        """
+        Yields the SVG of one page covering [y_from, y_to) of the document,
+        below the continuation rows for the blocks split at y_from. precision
+        selects compact output (see compact_svg). Ids in the page start with
+        id_prefix, so pages shown in one HTML document need different ones.
+        """
+        band = self.continuation_height(y_from) if y_from > 0 else 0
+        bottom = self._bottom(y_to)
+        num = str if precision is None else number_format(precision)
+        clip_id = f'{id_prefix}clip'
+        yield self._svg_open(band + bottom - y_from, precision)
+        # Blocks running over the page edge (frames of split blocks, fillers) are clipped
+        yield (f'<defs><clipPath id="{clip_id}"><rect y="{y_from}" width="{num(self.width)}" '
+               f'height="{bottom - y_from}"/></clipPath></defs>')
+        yield f'<g clip-path="url(#{clip_id})" transform="translate(0,{band - y_from})">'
+        yield from self._iter_content(y_from, y_to, precision, id_prefix, by_top=True)
+        yield '</g>'
+        if band:
+            yield from self._iter_continuation(y_from, band, num)
+        yield '</svg>'
+
+    def iter_pages(self, page_height=PAGE_HEIGHTS['a4'], precision=None):
+        """Lazily renders the pages; yields (y_from, y_to, svg) per page."""
+        for k, (y_from, y_to) in enumerate(self.page_breaks(page_height)):
+            yield y_from, y_to, ''.join(self.iter_page(y_from, y_to, precision, f'p{k}_'))
+
+    def viewport(self, y_from, y_to, precision=None, id_prefix='v'):
+        """
+        SVG of the document between y_from and y_to, drawing only the blocks
+        that intersect it. The viewBox keeps document coordinates, so the
+        client can place it at y_from of a canvas of the full height.
+        """
+        y_from = max(0, y_from)
+        y_to = min(self.height, y_to)
+        if y_to <= y_from:
+            raise ValueError('empty viewport')
+        num = str if precision is None else number_format(precision)
+        height = y_to - y_from
+        view_box = f' viewBox="0 {num(y_from)} {num(self.width)} {num(height)}"'
+        parts = [self._svg_open(height, precision, view_box)]
+        parts.extend(self._iter_content(y_from, y_to, precision, id_prefix))
+        parts.append('</svg>')
+        return ''.join(parts)
+
+
+def load_document(source, subprograms=None):
+    """PagedDocument of Mermaid text or a graph dict; ValueError without a start node."""
+    tree = build_tree(source)
+    if tree is None:
+        raise ValueError('No start node found')
+    return PagedDocument(tree, subprograms)
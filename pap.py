@@ -0,0 +1,615 @@
+"""
+Programmablaufplan (PAP): the flowchart of a program in the DIN 66001
+symbols, laid out and drawn as SVG on the server.
+
+Input is a Mermaid flowchart as the editor generates it, read with
+converter.parse_mermaid(). The layout is layered (Sugiyama style), every
+step linear or close to it in the size of the graph:
+
+1. A depth-first search from the start node finds the back edges (loops).
+2. Layers by longest path over the other edges; the node a loop exits to is
+   kept below the loop body. An edge spanning several layers gets a dummy
+   vertex in every layer it crosses, a back edge one in every layer from
+   its target up to its source, left of the loop, as the lane it runs in.
+3. Order within a layer: the search order, so the first branch of a
+   decision and loop lanes are on the left, refined by barycenter sweeps.
+4. x positions per layer: as close to the mean of the neighbours in the
+   layer above (below) as the spacing allows, by isotonic regression
+   (pool adjacent violators), in alternating downward and upward sweeps.
+5. Edges are routed orthogonally through the gaps between the layers.
+
+Symbols: start/end as rounded rectangle, statement as rectangle,
+decision and loop condition as diamond, subprogram call as rectangle with
+double side lines.
+"""
+import html
+import math
+from array import array
+
+from converter import parse_mermaid
+from font_metrics import measure
+from layout import FONT_SIZE, LINE_HEIGHT, wrap_text
+from metrics import trace_count, trace_stage
+from serving import check_deadline, check_layout_vertices
+
+PAD_X = 10
+PAD_Y = 10
+MIN_WIDTH = 80
+MIN_HEIGHT = 40
+MIN_DECISION_HEIGHT = 50
+MAX_TEXT_WIDTH = 220        # labels are wrapped to this width
+DECISION_TEXT_WIDTH = 160
+SUBPROGRAM_INSET = 8        # distance of the double side lines
+LAYER_GAP = 50              # between layers: edge bends and labels
+NODE_GAP = 40               # between the nodes of a layer
+EDGE_GAP = 20               # next to an edge passing through a layer
+SNAP = 3                    # smaller offsets of an edge between layers are drawn straight
+MARGIN = 20
+LABEL_FONT_SIZE = 12
+ORDER_SWEEPS = 2            # down and up barycenter sweeps each
+PLACE_SWEEPS = 3            # alternating, starting downwards
+
+TERMINAL = 'terminal'
+PROCESS = 'process'
+DECISION = 'decision'
+SUBPROGRAM = 'subprogram'
+
+ARROW_DEFS = ('<defs><marker id="pap-arrow" viewBox="0 0 10 10" refX="10" refY="5" '
+              'markerWidth="8" markerHeight="8" orient="auto">'
+              '<path d="M0,0L10,5L0,10z" fill="black"/></marker></defs>')
+
+
+class PapLayout:
+    """
+    Geometry of a laid-out PAP, as iter_pap_svg() draws it. All coordinates
+    are integers.
+
+    nodes:  (shape, center x, center y, width, height, lines) per node
+    edges:  (points, label, label x, label y, text-anchor) per edge; the
+            arrow points at the last point
+    """
+    __slots__ = ('width', 'height', 'nodes', 'edges')
+
+    def __init__(self, width, height, nodes, edges):
+        self.width = width
+        self.height = height
+        self.nodes = nodes
+        self.edges = edges
+
+
+def cache_options():
+    """Options part of the result cache key: the kind of diagram and its layout constants."""
+    return {'diagram': 'pap',
+            'layout': (PAD_X, PAD_Y, MIN_WIDTH, MIN_HEIGHT, MIN_DECISION_HEIGHT, MAX_TEXT_WIDTH,
+                       DECISION_TEXT_WIDTH, SUBPROGRAM_INSET, LAYER_GAP, NODE_GAP, EDGE_GAP,
+                       SNAP, MARGIN, LABEL_FONT_SIZE, ORDER_SWEEPS, PLACE_SWEEPS)}
+
+
+def node_shape(G, n):
+    """PAP symbol of a node, from its Mermaid shape and its edges."""
+    t = G.types[n]
+    out_degree = G.out_degree(n)
+    if t == 'decision' or t == 'loop' or out_degree > 1:
+        return DECISION
+    if t == 'terminal':
+        # The editor draws loop heads as terminals too; those have edges on both sides
+        return TERMINAL if out_degree == 0 or G.in_degree(n) == 0 else PROCESS
+    if t == 'subprogram':
+        return SUBPROGRAM
+    return PROCESS
+
+
+def _even(v):
+    return 2 * math.ceil(v / 2)
+
+
+def node_box(shape, label):
+    """(width, height, lines) of a node; width and height are even."""
+    max_width = DECISION_TEXT_WIDTH if shape == DECISION else MAX_TEXT_WIDTH
+    text_w = measure(label, FONT_SIZE)
+    if text_w <= max_width:
+        lines = [label] if label else []
+    else:
+        lines = wrap_text(label, max_width)
+        text_w = max(measure(line, FONT_SIZE) for line in lines)
+    text_h = len(lines) * LINE_HEIGHT
+
+    if shape == DECISION:
+        # The text box must fit inside the diamond: w_t/w + h_t/h <= 1
+        h = max(MIN_DECISION_HEIGHT, 2 * text_h + PAD_Y)
+        w = text_w / (1 - text_h / h) + PAD_X * 2
+    else:
+        h = max(MIN_HEIGHT, text_h + PAD_Y * 2)
+        w = text_w + PAD_X * 2
+        if shape == TERMINAL:
+            w += h / 2
+        elif shape == SUBPROGRAM:
+            w += SUBPROGRAM_INSET * 2
+    return _even(max(MIN_WIDTH, w)), _even(h), lines
+
+
+def _back_edges(G, start):
+    # Iterative depth-first search, the start node first, then the nodes it
+    # does not reach. Returns (flags by CSR edge position, pre, post).
+    n = len(G)
+    succ_start, succ_nodes = G.succ_start, G.succ_nodes
+    back = bytearray(len(succ_nodes))
+    state = bytearray(n)            # 0 new, 1 on the stack, 2 done
+    pre = array('i', bytes(4 * n))
+    post = array('i', bytes(4 * n))
+    pre_count = post_count = 0
+    roots = [start] + list(range(n)) if n else []
+    for root in roots:
+        if state[root]:
+            continue
+        state[root] = 1
+        pre[root] = pre_count
+        pre_count += 1
+        nodes = [root]
+        positions = [succ_start[root]]
+        while nodes:
+            v = nodes[-1]
+            p = positions[-1]
+            if p < succ_start[v + 1]:
+                positions[-1] = p + 1
+                w = succ_nodes[p]
+                s = state[w]
+                if s == 0:
+                    state[w] = 1
+                    pre[w] = pre_count
+                    pre_count += 1
+                    nodes.append(w)
+                    positions.append(succ_start[w])
+                elif s == 1:
+                    back[p] = 1
+            else:
+                nodes.pop()
+                positions.pop()
+                state[v] = 2
+                post[v] = post_count
+                post_count += 1
+    return back, pre, post
+
+
+def _loop_exits(G, back, pre, post):
+    # For every back edge u -> v: v's successors that are not on the way to u
+    # (the loop's exits) go below u. Returns {u: [exit, ...]}.
+    succ_start, succ_nodes = G.succ_start, G.succ_nodes
+    below = {}
+    for u in range(len(G)):
+        for p in range(succ_start[u], succ_start[u + 1]):
+            if not back[p]:
+                continue
+            v = succ_nodes[p]
+            for q in range(succ_start[v], succ_start[v + 1]):
+                w = succ_nodes[q]
+                # w is an ancestor of u in the search tree: the loop body
+                if back[q] or (pre[w] <= pre[u] and post[u] <= post[w]):
+                    continue
+                below.setdefault(u, []).append(w)
+    return below
+
+
+def _longest_path_layers(G, back, below):
+    # Kahn's algorithm over the forward edges plus the loop exit constraints.
+    # None if the constraints close a cycle.
+    n = len(G)
+    succ_start, succ_nodes = G.succ_start, G.succ_nodes
+    in_degree = array('i', bytes(4 * n))
+    for p, w in enumerate(succ_nodes):
+        if not back[p]:
+            in_degree[w] += 1
+    for targets in below.values():
+        for w in targets:
+            in_degree[w] += 1
+    layer = array('i', bytes(4 * n))
+    queue = [v for v in range(n) if in_degree[v] == 0]
+    for v in queue:
+        next_layer = layer[v] + 1
+        for p in range(succ_start[v], succ_start[v + 1]):
+            if back[p]:
+                continue
+            w = succ_nodes[p]
+            if layer[w] < next_layer:
+                layer[w] = next_layer
+            in_degree[w] -= 1
+            if in_degree[w] == 0:
+                queue.append(w)
+        for w in below.get(v, ()):
+            if layer[w] < next_layer:
+                layer[w] = next_layer
+            in_degree[w] -= 1
+            if in_degree[w] == 0:
+                queue.append(w)
+    return layer if len(queue) == n else None
+
+
+def _sort_layer(layer, neighbours, attached, pos, keys):
+    # Barycenter of the neighbours in the adjacent layer. Vertices without
+    # neighbours there keep their slots; lane ends (attached, lane end ->
+    # loop node) are put back directly left of their loop node.
+    rest = [v for v in layer if v not in attached] if attached else layer
+    movable = []
+    for v in rest:
+        nb = neighbours[v]
+        if len(nb) == 1:
+            keys[v] = pos[nb[0]]
+            movable.append(v)
+        elif nb:
+            keys[v] = sum(map(pos.__getitem__, nb)) / len(nb)
+            movable.append(v)
+    movable.sort(key=keys.__getitem__)
+    if len(movable) < len(rest):
+        moved = iter(movable)
+        movable = [next(moved) if neighbours[v] else v for v in rest]
+    if attached:
+        ends = {}
+        for v in layer:
+            if v in attached:
+                ends.setdefault(attached[v], []).append(v)
+        order = []
+        for v in movable:
+            if v in ends:
+                order.extend(ends[v])
+            order.append(v)
+        movable = order
+    layer[:] = movable
+    for i, v in enumerate(layer):
+        pos[v] = i
+
+
+def _place_layer(layer, offsets, neighbours, attached, X, half):
+    # x closest (least squares) to the neighbours' mean with the vertices
+    # kept apart: with x_i = t_i + offset_i that is isotonic regression of
+    # the targets t_i, solved by pooling adjacent violators. Lane ends aim
+    # for the place next to their loop node.
+    means = []
+    counts = []
+    for v, offset in zip(layer, offsets):
+        nb = neighbours[v]
+        if attached and v in attached:
+            anchor = attached[v]
+            t = X[anchor] - half[anchor] - EDGE_GAP - offset
+        elif len(nb) == 1:
+            t = X[nb[0]] - offset
+        elif nb:
+            t = sum(map(X.__getitem__, nb)) / len(nb) - offset
+        else:
+            t = X[v] - offset
+        c = 1
+        while means and means[-1] > t:
+            c0 = counts.pop()
+            t = (means.pop() * c0 + t * c) / (c0 + c)
+            c += c0
+        means.append(t)
+        counts.append(c)
+    i = 0
+    for t, c in zip(means, counts):
+        for _ in range(c):
+            X[layer[i]] = t + offsets[i]
+            i += 1
+
+
+def _straighten(chain, candidates, layers, vlayer, pos, X, half):
+    # Moves the dummies of an edge onto one vertical line, the first of the
+    # candidate x positions that keeps EDGE_GAP to the neighbours in every layer
+    for x in candidates:
+        for d in chain:
+            vertices = layers[vlayer[d]]
+            i = pos[d]
+            if i > 0:
+                v = vertices[i - 1]
+                if X[v] + half[v] + EDGE_GAP > x:
+                    break
+            if i + 1 < len(vertices):
+                v = vertices[i + 1]
+                if X[v] - half[v] - EDGE_GAP < x:
+                    break
+        else:
+            for d in chain:
+                X[d] = x
+            return
+
+
+def _side_free(u, x, vertices, pos, X, half, left_taken):
+    # Whether an edge can leave decision u sideways to x: beyond the corner
+    # and with no other vertex of the layer in between. Back edges leave and
+    # enter at the left corner, that one is taken at both ends of a loop.
+    i = pos[u]
+    if x < X[u] - half[u]:
+        if u in left_taken:
+            return False
+        return i == 0 or X[vertices[i - 1]] + half[vertices[i - 1]] < x
+    if x > X[u] + half[u]:
+        return i == len(vertices) - 1 or x < X[vertices[i + 1]] - half[vertices[i + 1]]
+    return False
+
+
+def layout_pap(G, start=None):
+    """Lays out a frozen FlowGraph as PAP. Returns a PapLayout."""
+    n = len(G)
+    if start is None:
+        start = G.start_node()
+    succ_start, succ_nodes, succ_labels = G.succ_start, G.succ_nodes, G.succ_labels
+
+    with trace_stage('measure'):
+        shapes = [node_shape(G, v) for v in range(n)]
+        boxes = [node_box(shape, label) for shape, label in zip(shapes, G.labels)]
+
+    with trace_stage('layering'):
+        back, pre, post = _back_edges(G, start)
+        layer = _longest_path_layers(G, back, _loop_exits(G, back, pre, post))
+        if layer is None:
+            layer = _longest_path_layers(G, back, {})
+        check_deadline()
+        spans = 0
+        for u in range(n):
+            for p in range(succ_start[u], succ_start[u + 1]):
+                span = layer[succ_nodes[p]] - layer[u]
+                spans += span - 1 if span > 0 else 1 - span
+        check_layout_vertices(n + spans)
+
+        # Vertices: the nodes, then the dummies. ups/downs are the neighbours
+        # in the layer above/below; gaps is 1 for nodes (NODE_GAP to another node).
+        vlayer = list(layer)
+        half = [box[0] // 2 for box in boxes]
+        gaps = bytearray(b'\1') * n
+        ups = [[] for _ in range(n)]
+        downs = [[] for _ in range(n)]
+        forward = []        # (u, v, label, dummies)
+        loops = []          # (u, v, label, lane dummies from v's layer to u's)
+        lanes_at = {}       # loop node -> its lanes, placed left of it
+        lane_ends = []      # (lane dummies, (loop end, loop node))
+        for u in range(n):
+            for p in range(succ_start[u], succ_start[u + 1]):
+                w = succ_nodes[p]
+                if back[p]:
+                    lo, hi = layer[w], layer[u]
+                    first = len(vlayer)
+                    chain = list(range(first, first + hi - lo + 1))
+                    vlayer.extend(range(lo, hi + 1))
+                    half.extend([0] * len(chain))
+                    gaps.extend(bytes(len(chain)))
+                    ups.append([])
+                    ups.extend([d] for d in chain[:-1])
+                    downs.extend([d] for d in chain[1:])
+                    downs.append([])
+                    lane_ends.append((chain, (u, w)))
+                    lanes_at.setdefault(w, []).append(chain)
+                    loops.append((u, w, succ_labels[p], chain))
+                    continue
+                chain = []
+                prev = u
+                for l in range(layer[u] + 1, layer[w]):
+                    d = len(vlayer)
+                    vlayer.append(l)
+                    half.append(0)
+                    gaps.append(0)
+                    ups.append([prev])
+                    downs.append([])
+                    downs[prev].append(d)
+                    chain.append(d)
+                    prev = d
+                downs[prev].append(w)
+                ups[w].append(prev)
+                forward.append((u, w, succ_labels[p], chain))
+        N = len(vlayer)
+        n_layers = max(vlayer) + 1 if N else 0
+        trace_count('layout_vertices', N)
+
+    with trace_stage('ordering'):
+        # Initial order: search order over the downward edges, a loop's lanes
+        # placed when its node is reached, so they are left of the loop body
+        layers = [[] for _ in range(n_layers)]
+        seen = bytearray(N)
+        for root in ([start] + list(range(n)) if n else []):
+            if seen[root]:
+                continue
+            stack = [root]
+            while stack:
+                v = stack.pop()
+                if seen[v]:
+                    continue
+                seen[v] = 1
+                if v < n:
+                    for chain in lanes_at.get(v, ()):
+                        for d in chain:
+                            seen[d] = 1
+                            layers[vlayer[d]].append(d)
+                layers[vlayer[v]].append(v)
+                stack.extend(reversed(downs[v]))
+        pos = [0] * N
+        for vertices in layers:
+            for i, v in enumerate(vertices):
+                pos[v] = i
+        # The ends of a lane sort with the loop's nodes, so they stay
+        # directly left of them and the edge reaches its lane without crossing
+        anchored = [{} for _ in range(n_layers)]
+        for chain, (u, w) in lane_ends:
+            anchored[vlayer[w]][chain[0]] = w
+            anchored[vlayer[u]][chain[-1]] = u
+        keys = [0] * N
+        for _ in range(ORDER_SWEEPS):
+            for l in range(1, n_layers):
+                _sort_layer(layers[l], ups, anchored[l], pos, keys)
+            for l in range(n_layers - 2, -1, -1):
+                _sort_layer(layers[l], downs, anchored[l], pos, keys)
+            check_deadline()
+
+    with trace_stage('placement'):
+        # Offset of each vertex from the first of its layer when packed tightly
+        offsets = []
+        for vertices in layers:
+            layer_offsets = [0] * len(vertices)
+            x = 0
+            prev = vertices[0]
+            for i in range(1, len(vertices)):
+                v = vertices[i]
+                x += half[prev] + half[v] + (NODE_GAP if gaps[prev] and gaps[v] else EDGE_GAP)
+                layer_offsets[i] = x
+                prev = v
+            offsets.append(layer_offsets)
+        X = [0] * N
+        for vertices, layer_offsets in zip(layers, offsets):
+            for v, x in zip(vertices, layer_offsets):
+                X[v] = x
+        for sweep in range(PLACE_SWEEPS):
+            if sweep % 2 == 0:
+                for l in range(1, n_layers):
+                    _place_layer(layers[l], offsets[l], ups, anchored[l], X, half)
+            else:
+                for l in range(n_layers - 2, -1, -1):
+                    _place_layer(layers[l], offsets[l], downs, anchored[l], X, half)
+            check_deadline()
+        for _, _, _, chain in forward:
+            if chain:
+                _straighten(chain, (X[chain[0]], X[chain[-1]]), layers, vlayer, pos, X, half)
+        for _, _, _, chain in loops:
+            xs = [X[d] for d in chain]
+            _straighten(chain, (max(xs), X[chain[0]], X[chain[-1]], min(xs)), layers, vlayer, pos, X, half)
+
+        left = min((X[v] - half[v] for v in range(N)), default=0)
+        right = max((X[v] + half[v] for v in range(N)), default=0)
+        shift = MARGIN - left
+        X = [round(x + shift) for x in X]
+
+        # Layer bands: every layer holds a node, its band is as high as the highest
+        band_h = [0] * n_layers
+        for v in range(n):
+            h = boxes[v][1]
+            if h > band_h[layer[v]]:
+                band_h[layer[v]] = h
+        band_top = [0] * n_layers
+        y = MARGIN
+        for l in range(n_layers):
+            band_top[l] = y
+            y += band_h[l] + LAYER_GAP
+        height = y - LAYER_GAP + MARGIN if n_layers else 2 * MARGIN
+        width = round(right - left) + 2 * MARGIN
+
+    with trace_stage('routing'):
+        cy = [band_top[layer[v]] + band_h[layer[v]] // 2 for v in range(n)]
+        nodes = [(shapes[v], X[v], cy[v], boxes[v][0], boxes[v][1], boxes[v][2]) for v in range(n)]
+        gap_half = LAYER_GAP // 2
+        left_taken = {v for u, w, _, _ in loops for v in (u, w)}
+        edges = []
+
+        for u, w, label, chain in forward:
+            x = X[u]
+            y = cy[u]
+            first_x = X[chain[0]] if chain else X[w]
+            if shapes[u] == DECISION and _side_free(u, first_x, layers[layer[u]], pos, X, half, left_taken):
+                # Out of the diamond's side corner, towards the branch
+                side = x - half[u] if first_x < x else x + half[u]
+                points = [(side, y), (first_x, y)]
+                if first_x < x:
+                    label_pos = (side - 4, y - 5, 'end')
+                else:
+                    label_pos = (side + 4, y - 5, 'start')
+                x = first_x
+            else:
+                points = [(x, y + boxes[u][1] // 2)]
+                label_pos = None
+            for d in chain:
+                if abs(X[d] - x) > SNAP:
+                    gy = band_top[vlayer[d]] - gap_half
+                    points.append((x, gy))
+                    points.append((X[d], gy))
+                    x = X[d]
+                    if label_pos is None:
+                        label_pos = (x + 4, gy + 14, 'start')
+            if abs(X[w] - x) > SNAP:
+                gy = band_top[layer[w]] - gap_half
+                points.append((x, gy))
+                points.append((X[w], gy))
+                x = X[w]
+                if label_pos is None:
+                    label_pos = (x + 4, gy + 14, 'start')
+            points.append((x, cy[w] - boxes[w][1] // 2))
+            if label_pos is None:
+                label_pos = (points[0][0] + 4, points[0][1] + 14, 'start')
+            edges.append((points, label, *label_pos))
+
+        for u, w, label, chain in loops:
+            if u == w:
+                # Self loop: out at the bottom, round the lane, in at the top
+                bottom = cy[u] + boxes[u][1] // 2
+                top = cy[u] - boxes[u][1] // 2
+                lane = X[chain[0]]
+                points = [(X[u], bottom), (X[u], bottom + 10), (lane, bottom + 10),
+                          (lane, top - 10), (X[u], top - 10), (X[u], top)]
+                edges.append((points, label, X[u] + 4, bottom + 14, 'start'))
+                continue
+            # Out of the left side, up the lane, into the loop node's left side
+            side = X[u] - half[u]
+            x = X[chain[-1]]
+            points = [(side, cy[u]), (x, cy[u])]
+            for i in range(len(chain) - 2, -1, -1):
+                d = chain[i]
+                if abs(X[d] - x) > SNAP:
+                    gy = band_top[vlayer[d] + 1] - gap_half
+                    points.append((x, gy))
+                    points.append((X[d], gy))
+                    x = X[d]
+            points.append((x, cy[w]))
+            points.append((X[w] - half[w], cy[w]))
+            edges.append((points, label, side - 4, cy[u] - 5, 'end'))
+
+    return PapLayout(width, height, nodes, edges)
+
+
+def _shape_svg(shape, x, y, w, h):
+    left = x - w // 2
+    top = y - h // 2
+    if shape == DECISION:
+        return f'<polygon points="{x},{top} {left + w},{y} {x},{top + h} {left},{y}"/>'
+    if shape == TERMINAL:
+        return f'<rect x="{left}" y="{top}" width="{w}" height="{h}" rx="{h // 2}"/>'
+    rect = f'<rect x="{left}" y="{top}" width="{w}" height="{h}"/>'
+    if shape == SUBPROGRAM:
+        inner_left = left + SUBPROGRAM_INSET
+        inner_right = left + w - SUBPROGRAM_INSET
+        rect += f'<path d="M{inner_left},{top}V{top + h}M{inner_right},{top}V{top + h}"/>'
+    return rect
+
+
+def iter_pap_svg(lay):
+    """Yields the SVG of a PapLayout in pieces: edges, then symbols, then texts."""
+    yield (f'<svg width="{lay.width}" height="{lay.height}" xmlns="http://www.w3.org/2000/svg" '
+           f'style="font-family: Arial, sans-serif;">')
+    yield ARROW_DEFS
+
+    yield '<g fill="none" stroke="black" stroke-width="1" marker-end="url(#pap-arrow)">'
+    for points, *_ in lay.edges:
+        yield '<path d="M' + 'L'.join(f'{x},{y}' for x, y in points) + '"/>'
+    yield '</g>'
+
+    yield '<g fill="white" stroke="black" stroke-width="1">'
+    for shape, x, y, w, h, _ in lay.nodes:
+        yield _shape_svg(shape, x, y, w, h)
+    yield '</g>'
+
+    yield f'<g font-size="{FONT_SIZE}" text-anchor="middle">'
+    for _, x, y, _, _, lines in lay.nodes:
+        # Baselines of the lines, centered around y
+        line_y = y - (len(lines) - 1) * LINE_HEIGHT // 2 + 5
+        for line in lines:
+            yield f'<text x="{x}" y="{line_y}">{html.escape(line)}</text>'
+            line_y += LINE_HEIGHT
+    yield '</g>'
+
+    yield f'<g font-size="{LABEL_FONT_SIZE}">'
+    for _, label, x, y, anchor in lay.edges:
+        if label:
+            yield f'<text x="{x}" y="{y}" text-anchor="{anchor}">{html.escape(label)}</text>'
+    yield '</g>'
+    yield '</svg>'
+
+
+def convert_mermaid_to_pap(mermaid_content):
+    """PAP SVG of a Mermaid flowchart."""
+    G, start = parse_mermaid(mermaid_content)
+    lay = layout_pap(G, start)
+    check_deadline()
+    with trace_stage('render'):
+        return ''.join(iter_pap_svg(lay))
@@ -0,0 +1,302 @@
+"""
+Limits and a bounded worker pool for conversions requested over HTTP.
+
+enforce() sets the limits for everything run inside it. The converter checks
+them with check_nodes() after parsing, check_depth() after building the
+block tree and check_deadline() between stages and in its long loops.
+Outside of enforce() a check costs a context variable lookup, so the batch
+CLI and the benchmarks convert without limits.
+
+    with enforce(ConversionLimits(max_nodes=1000, timeout=5).started()):
+        convert_mermaid_to_nsd(text)    # LimitExceeded, DeadlineExceeded
+
+ConversionPool runs conversions on a fixed number of threads with a bounded
+queue in front: a request beyond the queue is rejected with ServerBusy
+instead of piling up, and one that passes its deadline gets
+DeadlineExceeded while the conversion stops at its next check.
+run_many() feeds it a whole batch with a bounded number in flight.
+"""
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from layout import nesting_depth
+
+_active = ContextVar('nsd_limits', default=None)
+
+# Layout vertices (nodes plus edge bends) allowed per node of max_nodes
+LAYOUT_VERTEX_FACTOR = 8
+
+
+class ConversionError(Exception):
+    """A conversion refused or stopped by a limit; status is the HTTP status to answer with."""
+    status = 500
+    reason = 'error'
+
+
+class LimitExceeded(ConversionError):
+    status = 413
+    reason = 'too_large'
+
+
+class UnstructuredFlowchart(ConversionError):
+    """
+    A flowchart that cannot become a Struktogramm (see
+    flow_analysis.structure_problems). problems is a list of
+    {"problem", "nodes"} with the Mermaid ids of the offending nodes.
+    """
+    status = 422
+    reason = 'unstructured'
+
+    def __init__(self, problems):
+        super().__init__('Flowchart is not structured: ' + '; '.join(
+            f'{p["problem"].replace("_", " ")} at {", ".join(p["nodes"][:5])}'
+            + (f' and {p["count"] - 5} more' if p['count'] > 5 else '')
+            for p in problems))
+        self.problems = problems
+
+    def __reduce__(self):
+        # Raised in subprogram worker processes too
+        return type(self), (self.problems,)
+
+
+class ServerBusy(ConversionError):
+    status = 503
+    reason = 'busy'
+
+
+class DeadlineExceeded(ConversionError):
+    status = 504
+    reason = 'timeout'
+
+
+class ConversionLimits:
+    """
+    Limits of one conversion; 0 disables a limit. Subprograms converted in
+    worker processes get a pickled copy, so the same limits apply there.
+
+    max_nodes:  nodes per diagram (the program and every subprogram)
+    max_depth:  nesting depth of loops, decisions and cases
+    timeout:    seconds from started() until the conversion is given up
+    deadline:   time.monotonic() value set by started(), None before
+    """
+    __slots__ = ('max_nodes', 'max_depth', 'timeout', 'deadline')
+
+    def __init__(self, max_nodes=0, max_depth=0, timeout=0, deadline=None):
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.timeout = timeout
+        self.deadline = deadline
+
+    def started(self):
+        """A copy whose deadline runs from now."""
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        return ConversionLimits(self.max_nodes, self.max_depth, self.timeout, deadline)
+
+    def remaining(self):
+        """Seconds until the deadline, None without one."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    @classmethod
+    def from_env(cls):
+        """
+        NSD_MAX_NODES        nodes per diagram (default 250000)
+        NSD_MAX_DEPTH        nesting depth (default 1000)
+        NSD_CONVERT_TIMEOUT  seconds per conversion, including the wait in the queue (default 30)
+        """
+        return cls(
+            max_nodes=int(os.environ.get('NSD_MAX_NODES', 250000)),
+            max_depth=int(os.environ.get('NSD_MAX_DEPTH', 1000)),
+            timeout=float(os.environ.get('NSD_CONVERT_TIMEOUT', 30)),
+        )
+
+
+@contextmanager
+def enforce(limits):
+    """Applies the limits to everything run inside the block; None lifts them."""
+    token = _active.set(limits)
+    try:
+        yield limits
+    finally:
+        _active.reset(token)
+
+
+def active_limits():
+    """The limits set by the enclosing enforce(), or None."""
+    return _active.get()
+
+
+def check_nodes(n):
+    limits = _active.get()
+    if limits is not None and limits.max_nodes and n > limits.max_nodes:
+        raise LimitExceeded(f'Diagram has {n} nodes, at most {limits.max_nodes} are allowed')
+
+
+def check_layout_vertices(n):
+    # A layered layout (the PAP) adds a vertex per layer an edge crosses, up
+    # to quadratically many; they are bounded by a multiple of the nodes limit
+    limits = _active.get()
+    if limits is not None and limits.max_nodes and n > LAYOUT_VERTEX_FACTOR * limits.max_nodes:
+        raise LimitExceeded(f'Diagram layout needs {n} vertices, at most '
+                            f'{LAYOUT_VERTEX_FACTOR * limits.max_nodes} are allowed')
+
+
+def check_depth(blocks, level=0):
+    # Only walks the tree when a depth limit is set; level is the depth the
+    # blocks sit at, for blocks added to a larger tree
+    limits = _active.get()
+    if limits is not None and limits.max_depth:
+        depth = level + nesting_depth(blocks)
+        if depth > limits.max_depth:
+            raise LimitExceeded(f'Diagram is nested {depth} levels deep, at most {limits.max_depth} are allowed')
+
+
+def check_deadline():
+    limits = _active.get()
+    if limits is not None and limits.deadline is not None and time.monotonic() > limits.deadline:
+        raise DeadlineExceeded(f'Conversion took longer than {limits.timeout:g} s')
+
+
+class ConversionPool:
+    """
+    Runs conversions on `workers` threads; at most `queue_size` more wait
+    for a thread. Counters for /api/metrics are kept per pool.
+    """
+
+    def __init__(self, workers, queue_size):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='nsd-convert')
+        self._lock = threading.Lock()
+        self._place_freed = threading.Condition(self._lock)
+        self.pending = 0    # submitted, not finished (queued or running)
+        self.running = 0
+        self.completed = 0
+        self.rejected = {'too_large': 0, 'busy': 0, 'timeout': 0}
+
+    def submit(self, func, limits, wait_for_place=False):
+        """
+        Starts func() on a pool thread under the given limits and returns
+        its Future; the deadline starts now, so the time in the queue
+        counts. Raises ServerBusy if the queue is full, or with
+        wait_for_place only if no place frees up within the timeout.
+        """
+        with self._lock:
+            capacity = self.workers + self.queue_size
+            if wait_for_place and self.pending >= capacity:
+                self._place_freed.wait_for(lambda: self.pending < capacity, limits.timeout or None)
+            if self.pending >= capacity:
+                self.rejected['busy'] += 1
+                raise ServerBusy('Too many conversions in progress, try again shortly')
+            self.pending += 1
+        limits = limits.started()
+        # The copied context carries the request's metrics trace to the thread
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, self._call, func, limits)
+        future.add_done_callback(self._finished)
+        future.limits = limits
+        return future
+
+    def run(self, func, limits):
+        """
+        Calls func() on a pool thread (see submit) and returns its result.
+        Raises ServerBusy if the queue is full and the limit errors of the
+        conversion.
+        """
+        future = self.submit(func, limits)
+        try:
+            return future.result(timeout=future.limits.remaining())
+        except FutureTimeout:
+            # Still queued: dropped. Running: stops at its next check_deadline().
+            future.cancel()
+            self.count_rejected('timeout')
+            raise DeadlineExceeded(f'Conversion took longer than {limits.timeout:g} s') from None
+        except ConversionError as e:
+            self.count_rejected(e.reason)
+            raise
+
+    def run_many(self, calls, limits, in_flight):
+        """
+        Runs the functions of an iterable of (tag, func) pairs, at most
+        in_flight of them at a time, and yields (tag, result, error) in the
+        order they finish; error is the exception of a failed call, else
+        None. Each call has its own deadline. When the pool is full, the
+        next call waits for a place. Closing the generator cancels the
+        calls that have not started.
+        """
+        calls = iter(calls)
+        pending = {}
+        try:
+            while True:
+                while len(pending) < in_flight:
+                    call = next(calls, None)
+                    if call is None:
+                        break
+                    tag, func = call
+                    try:
+                        pending[self.submit(func, limits, wait_for_place=True)] = tag
+                    except ServerBusy as e:
+                        yield tag, None, e
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    tag = pending.pop(future)
+                    error = future.exception()
+                    if isinstance(error, ConversionError):
+                        self.count_rejected(error.reason)
+                    yield tag, None if error else future.result(), error
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _call(self, func, limits):
+        with self._lock:
+            self.running += 1
+        try:
+            with enforce(limits):
+                check_deadline()
+                return func()
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    def _finished(self, future):
+        with self._lock:
+            self.pending -= 1
+            self._place_freed.notify()
+            if not future.cancelled():
+                self.completed += 1
+
+    def count_rejected(self, reason):
+        """Counts a request refused by a limit, also for limits checked outside the pool."""
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'running': self.running,
+                'queued': self.pending - self.running,
+                'completed': self.completed,
+                'rejected': dict(self.rejected),
+            }
+
+    @classmethod
+    def from_env(cls):
+        """
+        NSD_CONVERT_WORKERS  threads converting at the same time (default: CPUs, at most 4)
+        NSD_CONVERT_QUEUE    requests waiting for a thread before new ones get 503 (default 16)
+        """
+        return cls(
+            workers=int(os.environ.get('NSD_CONVERT_WORKERS', min(4, os.cpu_count() or 1))),
+            queue_size=int(os.environ.get('NSD_CONVERT_QUEUE', 16)),
+        )
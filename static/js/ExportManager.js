@@ -7,7 +7,7 @@ import { TreeState } from './TreeState.js';
  *   - JSON Speichern / Laden
  *   - Mermaid-Code speichern / kopieren
  *   - NSD SVG exportieren (via Backend)
- *   - PAP SVG exportieren (client-seitig via Mermaid.js)
+ *   - PAP SVG exportieren (via Backend, Mermaid.js als Fallback)
  */
 export class ExportManager {
 	/**
@@ -15,6 +15,11 @@ export class ExportManager {
 	 */
 	constructor(editor) {
 		this.editor = editor;
+		// Sync-Sitzung auf dem Server: nach dem ersten Export werden nur noch
+		// Änderungen gegen die bestätigte Version gesendet (siehe graph_session.py)
+		this._sync = null;      // { session, version, snapshot, svg }
+		this._pap = null;       // { code, svg } des letzten PAP-Exports
+		this._mermaid = null;   // Promise auf das nachgeladene Mermaid.js
 	}
 
 	// ── JSON ──────────────────────────────────────────────────
@@ -64,29 +69,20 @@ export class ExportManager {
 		preview.innerHTML = 'Generating...';
 		modal.style.display = 'flex';
 
-		// Nur aktive Unterprogramme senden (dedupliziert, mit korrektem Namen)
+		// Nur aktive Unterprogramme senden (dedupliziert, mit korrektem Namen).
+		// Der Server liest das Graph-Format direkt, ohne Umweg über Mermaid.
 		const subprograms = {};
 		for (const { node, subRef } of this.editor._collectSubprogramNodes(this.editor.mainTreeState.root)) {
 			const state = this.editor.subprogramManager.get(subRef);
 			if (state) {
 				subprograms[subRef] = {
-					name:    node.text,
-					mermaid: this.editor.mermaidGenerator._generateFromTreeState(state)
+					name: node.text,
+					...state.toGraphFormat()
 				};
 			}
 		}
 
-		const body = {
-			mermaid: this.editor.mermaidGenerator.generate(),
-			subprograms
-		};
-
-		fetch('/api/convert_nsd', {
-			method:  'POST',
-			headers: { 'Content-Type': 'application/json' },
-			body:    JSON.stringify(body)
-		})
-			.then(r => r.json())
+		this._syncNSD(this.editor.mainTreeState.toGraphFormat(), subprograms)
 			.then(d => {
 				if (d.svg) this._openExportModal('Struktogramm (NSD)', d.svg, 'struktogramm.svg');
 				else preview.innerHTML = 'Fehler: ' + (d.error || '?');
@@ -94,7 +90,105 @@ export class ExportManager {
 			.catch(err => { preview.innerHTML = 'Fehler: ' + err; });
 	}
 
-	// ── PAP SVG (client-seitig) ───────────────────────────────
+	// ── Delta-Sync ────────────────────────────────────────────
+
+	/**
+	 * Liefert { svg } für Graph und Unterprogramme. Mit bestehender Sitzung
+	 * wird nur das Delta gesendet; ist die Sitzung abgelaufen (404) oder die
+	 * Version abgewichen (409), wird das ganze Diagramm neu hochgeladen.
+	 */
+	async _syncNSD(graph, subprograms) {
+		const snapshot = this._snapshot(graph, subprograms);
+		// Kompaktes SVG: gemeinsame Styles und Formen, gerundete Koordinaten
+		const options  = { compact: true };
+		const sync     = this._sync;
+
+		if (sync) {
+			const delta = this._delta(sync.snapshot, snapshot);
+			if (!delta) return { svg: sync.svg };
+			const r = await this._postJSON(`/api/sync/${sync.session}`,
+				{ base_version: sync.version, ...delta, ...options });
+			const d = await r.json();
+			if (r.ok) {
+				this._sync = { session: sync.session, version: d.version, snapshot, svg: d.svg };
+				return d;
+			}
+			if (r.status !== 404 && r.status !== 409) return d;
+			this._sync = null;
+		}
+
+		const r = await this._postJSON('/api/sync', { ...graph, subprograms, ...options });
+		const d = await r.json();
+		if (r.ok) this._sync = { session: d.session, version: d.version, snapshot, svg: d.svg };
+		return d;
+	}
+
+	_postJSON(url, body) {
+		return fetch(url, {
+			method:  'POST',
+			headers: { 'Content-Type': 'application/json' },
+			body:    JSON.stringify(body)
+		});
+	}
+
+	/** Knoten, ausgehende Kanten je Knoten und Unterprogramme als JSON-Strings zum Vergleichen. */
+	_snapshot(graph, subprograms) {
+		const nodes = new Map();
+		for (const node of graph.nodes) nodes.set(node.id, JSON.stringify(node));
+		const out = new Map();
+		for (const { from, ...edge } of graph.edges) {
+			if (!out.has(from)) out.set(from, []);
+			out.get(from).push(edge);
+		}
+		for (const [from, edges] of out) out.set(from, JSON.stringify(edges));
+		const subs = new Map();
+		for (const [id, sub] of Object.entries(subprograms)) subs.set(id, JSON.stringify(sub));
+		return { nodes, out, subs };
+	}
+
+	/** Unterschied zweier Snapshots im Format von graph_session.py, null wenn gleich. */
+	_delta(old, cur) {
+		const text = {}, put = [], remove = [], edges = {};
+		const subPut = {}, subRemove = [];
+		let changed = false;
+
+		for (const [id, json] of cur.nodes) {
+			const before = old.nodes.get(id);
+			if (before === json) continue;
+			changed = true;
+			const node = JSON.parse(json);
+			// Nur der Text geändert: reicht als {id: text}
+			if (before !== undefined && JSON.stringify({ ...JSON.parse(before), text: node.text }) === json) {
+				text[id] = node.text;
+			} else {
+				put.push(node);
+			}
+		}
+		for (const id of old.nodes.keys()) {
+			if (!cur.nodes.has(id)) { remove.push(id); changed = true; }
+		}
+		for (const [from, json] of cur.out) {
+			if (old.out.get(from) !== json) { edges[from] = JSON.parse(json); changed = true; }
+		}
+		for (const from of old.out.keys()) {
+			if (!cur.out.has(from) && cur.nodes.has(from)) { edges[from] = []; changed = true; }
+		}
+		for (const [id, json] of cur.subs) {
+			if (old.subs.get(id) !== json) { subPut[id] = JSON.parse(json); changed = true; }
+		}
+		for (const id of old.subs.keys()) {
+			if (!cur.subs.has(id)) { subRemove.push(id); changed = true; }
+		}
+
+		if (!changed) return null;
+		return {
+			nodes:       { text, put, remove },
+			edges,
+			subprograms: { put: subPut, remove: subRemove }
+		};
+	}
+
+	// ── PAP SVG (Backend, Mermaid.js nur als Fallback) ────────
 
 	async exportPAP() {
 		const modal   = document.getElementById('export-modal');
@@ -105,14 +199,63 @@ export class ExportManager {
 
 		try {
 			const mermaidCode = this.editor.mermaidGenerator.generate();
-			const { svg }     = await window.mermaid.render('mermaid-pap-' + Date.now(), mermaidCode);
-			const processed   = this._postProcessPAP(svg);
-			this._openExportModal('Programmablaufplan (PAP)', processed, 'programmablaufplan.svg');
+			let svg = this._pap && this._pap.code === mermaidCode ? this._pap.svg : null;
+			if (!svg) {
+				svg = await this._renderPAP(mermaidCode);
+				this._pap = { code: mermaidCode, svg };
+			}
+			this._openExportModal('Programmablaufplan (PAP)', svg, 'programmablaufplan.svg');
 		} catch (err) {
 			preview.innerHTML = 'Fehler: ' + err.message;
 		}
 	}
 
+	/**
+	 * Layout und SVG kommen vom Server (pap.py). Nur wenn der Server nicht
+	 * erreichbar ist oder einen Serverfehler meldet, wird Mermaid.js
+	 * nachgeladen und der PAP im Browser gerendert.
+	 */
+	async _renderPAP(mermaidCode) {
+		let r;
+		try {
+			r = await this._postJSON('/api/convert_pap', { mermaid: mermaidCode });
+		} catch (err) {
+			r = null;
+		}
+		if (r && r.status < 500) {
+			const d = await r.json();
+			if (!r.ok) throw new Error(d.error || r.statusText);
+			return d.svg;
+		}
+		const mermaid = await this._loadMermaid();
+		const { svg } = await mermaid.render('mermaid-pap-' + Date.now(), mermaidCode);
+		return this._postProcessPAP(svg);
+	}
+
+	_loadMermaid() {
+		if (!this._mermaid) {
+			this._mermaid = new Promise((resolve, reject) => {
+				const script   = document.createElement('script');
+				script.src     = 'https://cdn.jsdelivr.net/npm/mermaid/dist/mermaid.min.js';
+				script.onload  = () => {
+					window.mermaid.initialize({
+						startOnLoad: false,
+						theme: 'neutral',
+						flowchart: { htmlLabels: false },
+						htmlLabels: false
+					});
+					resolve(window.mermaid);
+				};
+				script.onerror = () => {
+					this._mermaid = null;
+					reject(new Error('Mermaid.js konnte nicht geladen werden'));
+				};
+				document.head.appendChild(script);
+			});
+		}
+		return this._mermaid;
+	}
+
 	_postProcessPAP(svg) {
 		const doc = new DOMParser().parseFromString(svg, 'image/svg+xml');
 		doc.querySelectorAll('.node rect,.node polygon,.node circle,.node ellipse').forEach(el => {
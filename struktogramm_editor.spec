@@ -16,10 +16,24 @@ a = Analysis(
         'werkzeug',
         'werkzeug.serving',
         'werkzeug.routing',
-        'networkx',
-        'networkx.algorithms',
-        'networkx.classes',
+        'assets',
+        'compact_svg',
         'converter',
+        'diagram_store',
+        'flow_analysis',
+        'flowgraph',
+        'font_metrics',
+        'graph_json',
+        'graph_session',
+        'layout',
+        'layout_json',
+        'live_session',
+        'mermaid_parser',
+        'metrics',
+        'paging',
+        'pap',
+        'serving',
+        'nsd_cache',
     ],
     hookspath=[],
     hooksconfig={},
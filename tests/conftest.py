@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Test client of the Flask app, saving diagrams to a fresh store."""
+    import app as app_module
+    monkeypatch.setattr(app_module, 'STORE_PATH', str(tmp_path / 'store.db'))
+    monkeypatch.setattr(app_module, '_diagram_store', None)
+    return app_module.app.test_client()
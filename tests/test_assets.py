@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from assets import build_assets, bundle_modules, fingerprint, minify_css, minify_js
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('src, expected', [
+    # Division after an operand, a regular expression after an operator or keyword
+    ('x = a / b / c;\n', 'x=a / b / c;\n'),
+    ('x = (a) / 2;\n', 'x=(a)/ 2;\n'),
+    ('x = s.replace(/ +\\/ /g, "");\n', 'x=s.replace(/ +\\/ /g,"");\n'),
+    ('return /[/]  x/.test(s);\n', 'return /[/]  x/.test(s);\n'),
+    ('x = "a" / 2;\n', 'x="a" / 2;\n'),
+    # Comments inside strings and regular expressions stay
+    ('s = "// not a comment";  // a comment\n', 's="// not a comment";\n'),
+    ("s = '/* no */' + /\\/*x/;\n", "s='/* no */' + /\\/*x/;\n"),
+    ('a = 1; /* one\n two */ b = 2;\n', 'a=1;\nb=2;\n'),
+    # Template literals with substitutions, nested braces and templates
+    ('t = `a  ${ {k: 1}.k }  b // c`;\n', 't=`a  ${{k:1}.k }  b // c`;\n'),
+    ('t = `${a ? `x ${b}` : "}"}  /`;\n', 't=`${a?`x ${b}`:"}"}  /`;\n'),
+    # Words stay apart, line breaks stay for automatic semicolon insertion
+    ('  const   x = 1\n\n\n  let y = typeof x\n', 'const x=1\nlet y=typeof x\n'),
+    ("return 'a'\n", "return 'a'\n"),
+])
+def test_minify_js(src, expected):
+    assert minify_js(src) == expected
+
+
+def test_unterminated_regex():
+    with pytest.raises(ValueError, match='unterminated regular expression'):
+        minify_js('x = /abc\n')
+
+
+def test_minify_css():
+    src = '/* c */\na:hover ,  b > c {\n  color : red;\n  margin: 0 1px;\n}\n.x :first-child { }\n'
+    assert minify_css(src) == 'a:hover,b>c{color :red;margin:0 1px}.x :first-child{}\n'
+
+
+def _write(directory, files):
+    for name, source in files.items():
+        (directory / name).write_text(source, encoding='utf-8')
+
+
+def test_bundle_orders_dependencies_first(tmp_path):
+    _write(tmp_path, {
+        'main.js': "import { A } from './a.js';\nimport { B } from './b.js';\nnew A(B);\n",
+        'a.js': "import { B } from './b.js';\nexport class A {}\n",
+        'b.js': "'use strict';\nexport const B = 1;\n",
+    })
+    assert bundle_modules(str(tmp_path)) == (
+        "// b.js\nconst B = 1;\n// a.js\n\nclass A {}\n// main.js\n\n\nnew A(B);\n")
+
+
+@pytest.mark.parametrize('files, message', [
+    ({'main.js': "import { A } from './a.js';\n", 'a.js': "import { M } from './main.js';\nexport class A {}\n"},
+     'circular import'),
+    ({'main.js': "import { B } from './a.js';\n", 'a.js': 'export class A {}\n'},
+     'does not export B'),
+    ({'main.js': "import A from './a.js';\n", 'a.js': 'export class A {}\n'},
+     'unsupported import'),
+    ({'main.js': 'export default 1;\n'},
+     'unsupported export'),
+])
+def test_bundle_rejects_what_it_does_not_know(tmp_path, files, message):
+    _write(tmp_path, files)
+    with pytest.raises(ValueError, match=message):
+        bundle_modules(str(tmp_path))
+
+
+def test_fingerprint_follows_the_content():
+    assert fingerprint('app.js', b'a') == fingerprint('app.js', b'a')
+    assert fingerprint('app.js', b'a') != fingerprint('app.js', b'b')
+    assert fingerprint('app.js', b'a').startswith('app.') and fingerprint('app.js', b'a').endswith('.js')
+
+
+def test_build_assets_fingerprints_the_bundle(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'js').mkdir(parents=True)
+    _write(static / 'js', {'main.js': 'let x = 1;\n'})
+    _write(static, {'style.css': 'a { color: red; }\n'})
+    first = build_assets(str(static))
+    assert first.files[first.urls['app.js']].body == b'let x=1;\n'
+    assert first.files[first.urls['style.css']].body == b'a{color:red}\n'
+    _write(static / 'js', {'main.js': 'let x = 2;\n'})
+    second = build_assets(str(static))
+    assert second.urls['app.js'] != first.urls['app.js']
+    assert second.urls['style.css'] == first.urls['style.css']
+
+
+def test_editor_bundle_builds():
+    bundle = build_assets(os.path.join(ROOT, 'static'))
+    assert set(bundle.urls) == {'app.js', 'style.css'}
+    for logical, name in bundle.urls.items():
+        assert name == fingerprint(logical, bundle.files[name].body)
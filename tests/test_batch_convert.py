@@ -0,0 +1,67 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import batch_convert
+from converter import convert_graph_to_nsd, convert_mermaid_to_nsd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MERMAID = 'flowchart TD\nS([Start]) --> A["a"]\nA --> E([End])'
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    src = tmp_path / 'src'
+    (src / 'sub').mkdir(parents=True)
+    (src / '.hidden').mkdir()
+    (src / 'one.mmd').write_text(MERMAID, encoding='utf-8')
+    (src / 'sub' / 'two.mmd').write_text(MERMAID.replace('"a"', '"b"'), encoding='utf-8')
+    (src / '.hidden' / 'skipped.mmd').write_text(MERMAID, encoding='utf-8')
+    (src / 'notes.txt').write_text('not a diagram', encoding='utf-8')
+    shutil.copy(os.path.join(ROOT, 'struktogramm_test.json'), src / 'editor.json')
+    return src
+
+
+def _svgs(directory):
+    return sorted(os.path.relpath(os.path.join(d, name), directory)
+                  for d, _, names in os.walk(directory) for name in names if name.endswith('.svg'))
+
+
+@pytest.mark.parametrize('jobs', ['1', '2'])
+def test_converts_a_directory(inputs, tmp_path, jobs):
+    out = tmp_path / 'out'
+    assert batch_convert.main([str(inputs), '-o', str(out), '-j', jobs, '-q']) == 0
+    assert _svgs(out) == ['editor.svg', 'one.svg', os.path.join('sub', 'two.svg')]
+    assert (out / 'one.svg').read_text(encoding='utf-8') == convert_mermaid_to_nsd(MERMAID)
+    with open(os.path.join(ROOT, 'struktogramm_test.json'), encoding='utf-8') as f:
+        graph = json.load(f)
+    assert (out / 'editor.svg').read_text(encoding='utf-8') == convert_graph_to_nsd(graph, {})
+    manifest = json.loads((out / batch_convert.MANIFEST_NAME).read_text(encoding='utf-8'))
+    assert sorted(manifest) == sorted(str(inputs / p) for p in ('editor.json', 'one.mmd', 'sub/two.mmd'))
+
+
+def test_unchanged_inputs_are_skipped(inputs, tmp_path):
+    out = str(tmp_path / 'out')
+    assert batch_convert.run([str(inputs)], out, jobs=1, quiet=True)[:2] == (3, 0)
+    assert batch_convert.run([str(inputs)], out, jobs=1, quiet=True)[:2] == (0, 3)
+    (inputs / 'one.mmd').write_text(MERMAID.replace('"a"', '"c"'), encoding='utf-8')
+    assert batch_convert.run([str(inputs)], out, jobs=1, quiet=True)[:2] == (1, 2)
+    # Another output format is another hash
+    assert batch_convert.run([str(inputs)], out, jobs=1, quiet=True, compact=True)[:2] == (3, 0)
+    assert batch_convert.run([str(inputs)], out, jobs=1, quiet=True, force=True, compact=True)[:2] == (3, 0)
+
+
+def test_next_to_the_inputs_and_failures(inputs, tmp_path):
+    (inputs / 'bad.json').write_text('{"nodes": []}', encoding='utf-8')
+    converted, _, failures = batch_convert.run([str(inputs / '*.mmd'), str(inputs / 'bad.json')], jobs=1,
+                                               quiet=True, manifest_path=str(tmp_path / 'manifest.json'))
+    assert converted == 1 and (inputs / 'one.svg').exists()
+    assert failures == [(str(inputs / 'bad.json'), 'ValueError: not an editor diagram (no nodes/edges)')]
+    assert batch_convert.main([str(inputs / 'bad.json'), '-q', '--manifest', str(tmp_path / 'm.json')]) == 1
+
+
+def test_missing_input(tmp_path):
+    with pytest.raises(SystemExit):
+        batch_convert.main([str(tmp_path / 'missing.mmd')])
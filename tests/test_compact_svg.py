@@ -0,0 +1,81 @@
+import re
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from compact_svg import number_format
+from converter import convert_mermaid_to_nsd
+
+SVG = '{http://www.w3.org/2000/svg}'
+
+PROGRAMS = {
+    'decision': ('S([Start]) --> C{"c"}\nC -->|Ja| A["a"]\nC -->|Nein| B["b"]\nA --> M["m"]\n'
+                 'B --> M\nM --> E([End])'),
+    'loop': 'S([Start]) --> L(["for i"])\nL --> X["x"]\nX --> L\nL -->|Exit| E([End])',
+    'case': ('S([Start]) --> K{"k"}\nK -->|1| A["a"]\nK -->|2| B["b"]\nK -->|3| C["c & <d>"]\n'
+             'A --> M["m"]\nB --> M\nC --> M\nM --> E([End])'),
+    'sequence': 'S([Start]) --> P["p"]\nP --> Q["q"]\nQ --> E([End])',
+}
+
+
+def _rect(x, y, e):
+    # By its edges: the compact output rounds those, not the sizes
+    return 'rect', '', (x, y, x + float(e.get('width')), y + float(e.get('height')))
+
+
+def _flatten(svg):
+    # (tag, text, coordinates) of every rect and text, absolute, with <use>
+    # resolved and the <g> translations added up
+    root = ET.fromstring(svg)
+    defs = {e.get('id'): e for e in root.iter() if e.get('id')}
+    items = []
+
+    def walk(element, dx, dy):
+        for e in element:
+            tag = e.tag[len(SVG):]
+            x = dx + float(e.get('x', 0))
+            y = dy + float(e.get('y', 0))
+            if tag == 'g':
+                m = re.fullmatch(r'translate\(([-\d.]+),([-\d.]+)\)', e.get('transform', 'translate(0,0)'))
+                walk(e, dx + float(m.group(1)), dy + float(m.group(2)))
+            elif tag == 'use':
+                shape = defs[e.get('href')[1:]]
+                if shape.tag == SVG + 'rect':
+                    items.append(_rect(x, y, shape))
+            elif tag == 'rect':
+                items.append(_rect(x, y, e))
+            elif tag == 'text':
+                items.append(('text', e.text, (x, y)))
+    walk(root, 0, 0)
+    return sorted(items, key=lambda item: (item[0], item[1], [round(v) for v in item[2]]))
+
+
+@pytest.mark.parametrize('name', sorted(PROGRAMS))
+def test_same_drawing_as_the_full_output(name):
+    text = 'flowchart TD\n' + PROGRAMS[name]
+    full = convert_mermaid_to_nsd(text)
+    compact = convert_mermaid_to_nsd(text, compact=True)
+    assert len(compact) < len(full)
+    drawn, expected = _flatten(compact), _flatten(full)
+    assert len(drawn) == len(expected)
+    for (tag, text, coordinates), (tag_expected, text_expected, coordinates_expected) in zip(drawn, expected):
+        assert (tag, text) == (tag_expected, text_expected)
+        # Off by the rounding to one decimal at most
+        assert coordinates == pytest.approx(coordinates_expected, abs=0.1)
+
+
+def test_repeated_shapes_are_defined_once():
+    svg = convert_mermaid_to_nsd('flowchart TD\n' + PROGRAMS['decision'], compact=True)
+    root = ET.fromstring(svg)
+    assert root.get('class') == 'nsd'
+    defs, = root.findall(SVG + 'defs')
+    # Start, m and End are full width, the two branches half width
+    assert [(d.get('width'), d.get('height')) for d in defs] == [('800', '40'), ('400', '40')]
+    assert len(list(root.iter(SVG + 'use'))) == 5
+
+
+@pytest.mark.parametrize('precision, value, expected', [
+    (1, 12.0, '12'), (1, 12.25, '12.2'), (1, -0.04, '0'), (2, 3.10, '3.1'), (0, 2.6, '3'),
+])
+def test_number_format(precision, value, expected):
+    assert number_format(precision)(value) == expected
@@ -0,0 +1,57 @@
+import pytest
+
+from diagram_store import DiagramStore
+
+GRAPH = {
+    'nodes': [{'id': 'start_node_id', 'type': 'start', 'text': 'Start'},
+              {'id': 'end_node_id', 'type': 'end', 'text': 'End'}],
+    'edges': [{'from': 'start_node_id', 'to': 'end_node_id'}],
+}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DiagramStore(str(tmp_path / 'store.db'))
+    for k in range(5):
+        store.save(GRAPH, name=f'diagram {k}')
+    return store
+
+
+def test_list_limit_and_offset(store):
+    assert len(store.list_diagrams()) == 5
+    assert len(store.list_diagrams(limit=2)) == 2
+    assert len(store.list_diagrams(limit=2, offset=4)) == 1
+
+
+def test_negative_limit_lists_nothing(store):
+    assert store.list_diagrams(limit=-1) == []
+
+
+def test_negative_offset_is_rejected(store):
+    with pytest.raises(ValueError):
+        store.list_diagrams(offset=-1)
+
+
+def test_list_endpoint(client):
+    for k in range(3):
+        assert client.post('/api/save', json={**GRAPH, 'name': f'd{k}'}).status_code == 200
+    assert len(client.get('/api/diagrams?limit=-1').get_json()['diagrams']) == 0
+    assert len(client.get('/api/diagrams?limit=2').get_json()['diagrams']) == 2
+    assert client.get('/api/diagrams?offset=-1').status_code == 400
+
+
+@pytest.mark.parametrize('subprograms', [
+    {'s': {'nodes': 'abc', 'edges': []}},
+    {'s': {'nodes': [{'id': 'x', 'text': 5}], 'edges': []}},
+    {'s': {**GRAPH, 'name': ['sub']}},
+    {'s': 'abc'},
+])
+def test_save_rejects_malformed_subprograms(client, subprograms):
+    response = client.post('/api/save', json={**GRAPH, 'subprograms': subprograms})
+    assert response.status_code == 400
+
+
+def test_save_and_load_with_subprogram(client):
+    saved = client.post('/api/save', json={**GRAPH, 'subprograms': {'s': {**GRAPH, 'name': 'sub'}}}).get_json()
+    data = client.get(f'/api/load?id={saved["id"]}').get_json()['data']
+    assert data['subprograms'] == {'s': {**GRAPH, 'name': 'sub'}}
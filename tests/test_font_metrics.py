@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+from font_metrics import DEFAULT_WIDTH, WIDE_WIDTH, char_width, measure, measure_many, text_units
+
+
+@pytest.mark.parametrize('texts', [
+    [],
+    [''],
+    ['Start', 'i < 10', 'Größe ändern', '', 'x'],
+    # NUL inside a text: the joined lookup must not split it
+    ['a\0b', 'c'],
+    ['\0', '\0\0', ''],
+    # Not Latin-1
+    ['→ weiter', 'a', '漢字'],
+    ['a\0→', 'b'],
+])
+def test_measure_many_equals_measure(texts):
+    assert measure_many(texts, 14) == [measure(t, 14) for t in texts]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_measure_many_on_random_texts(seed):
+    rnd = random.Random(seed)
+    alphabet = 'abc XYZ 019 äöüß\0\t€…→漢'
+    texts = [''.join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 12))) for _ in range(rnd.randint(1, 30))]
+    assert measure_many(texts, 12) == [measure(t, 12) for t in texts]
+
+
+def test_widths():
+    assert text_units('Hi') == char_width('H') + char_width('i') == 722 + 222
+    assert measure('Hi', 10) == 9.44
+    # Latin-1 in steps of 4/1000 em: '@' (1015) is stored as 254 quarters
+    assert char_width('@') == 1016
+    assert char_width('\0') == char_width('\n') == 0
+    assert char_width('\t') == char_width(' ')
+    assert char_width('—') == 1000
+    assert char_width('漢') == WIDE_WIDTH
+    assert char_width('ж') == DEFAULT_WIDTH
@@ -0,0 +1,45 @@
+import pytest
+
+from graph_json import build_structure_from_graph, validate_graph
+
+
+def _graph(text='x = 1', label=None):
+    edge = {'from': 'a', 'to': 'end_node_id'}
+    if label is not None:
+        edge['label'] = label
+    return {
+        'nodes': [{'id': 'start_node_id', 'type': 'start', 'text': 'Start'},
+                  {'id': 'a', 'type': 'command', 'text': text},
+                  {'id': 'end_node_id', 'type': 'end', 'text': 'End'}],
+        'edges': [{'from': 'start_node_id', 'to': 'a'}, edge],
+    }
+
+
+def test_valid_graph_builds():
+    blocks = build_structure_from_graph(_graph())
+    assert [b['label'] for b in blocks] == ['Start', 'x = 1', 'End']
+
+
+@pytest.mark.parametrize('graph', [
+    _graph(text=5),
+    _graph(text={'q': 5}),
+    _graph(label=['yes']),
+    {'nodes': [{'id': 1, 'type': 'start'}], 'edges': []},
+    {'nodes': [{'id': 'a', 'type': 3}], 'edges': []},
+    {'nodes': [], 'edges': [{'from': 'a', 'to': None}]},
+    {'nodes': 'abc', 'edges': []},
+])
+def test_malformed_graph_is_rejected(graph):
+    with pytest.raises(ValueError):
+        validate_graph(graph)
+
+
+def test_convert_endpoint_answers_400_for_malformed_field(client):
+    response = client.post('/api/convert_nsd/graph', json=_graph(text=5))
+    assert response.status_code == 400
+    assert '"text"' in response.get_json()['error']
+
+
+def test_live_endpoint_answers_400_for_malformed_field(client):
+    response = client.post('/api/live', json=_graph(text=5))
+    assert response.status_code == 400
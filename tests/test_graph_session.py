@@ -0,0 +1,71 @@
+import pytest
+
+from graph_session import GraphSession, VersionConflict
+
+
+def _graph():
+    return {
+        'nodes': [{'id': 'start_node_id', 'type': 'start', 'text': 'Start'},
+                  {'id': 'a', 'type': 'command', 'text': 'x = 1'},
+                  {'id': 'end_node_id', 'type': 'end', 'text': 'End'}],
+        'edges': [{'from': 'start_node_id', 'to': 'a'}, {'from': 'a', 'to': 'end_node_id'}],
+    }
+
+
+def test_text_delta_is_applied():
+    session = GraphSession(_graph())
+    assert session.apply({'base_version': 1, 'nodes': {'text': {'a': 'x = 2'}}}) == 2
+    assert session.nodes['a']['text'] == 'x = 2'
+
+
+def test_stale_delta_conflicts():
+    session = GraphSession(_graph())
+    with pytest.raises(VersionConflict):
+        session.apply({'base_version': 7})
+
+
+@pytest.mark.parametrize('base_version', [True, 1.0, '1', None])
+def test_base_version_must_be_an_integer(base_version):
+    session = GraphSession(_graph())
+    with pytest.raises(ValueError):
+        session.apply({'base_version': base_version, 'nodes': {'text': {'a': 'x = 2'}}})
+    assert session.version == 1
+    assert session.nodes['a']['text'] == 'x = 1'
+
+
+@pytest.mark.parametrize('delta', [
+    {'nodes': {'text': {'a': {'q': 5}}}},
+    {'nodes': {'text': {'a': 5}}},
+    {'nodes': {'put': [{'id': 'b', 'text': 5}]}},
+    {'nodes': {'remove': 'a'}},
+    {'nodes': {'remove': [['a']]}},
+    {'edges': {'a': [{'to': 'end_node_id', 'label': 1}]}},
+    {'edges': {'a': [{'to': 5}]}},
+    {'subprograms': {'remove': 'abc'}},
+    {'subprograms': {'put': {'s': {'nodes': [{'id': 'x', 'text': 1}], 'edges': []}}}},
+])
+def test_malformed_delta_leaves_session_unchanged(delta):
+    session = GraphSession(_graph(), {'abc': {'nodes': [], 'edges': []}})
+    with pytest.raises(ValueError):
+        session.apply({'base_version': 1, **delta})
+    assert session.version == 1
+    assert session.graph() == _graph()
+    assert list(session.subprograms) == ['abc']
+
+
+def test_malformed_subprogram_upload_is_rejected():
+    with pytest.raises(ValueError):
+        GraphSession(_graph(), {'s': {'nodes': [{'id': 'x', 'text': 1}], 'edges': []}})
+
+
+def test_sync_endpoint_answers_400_and_keeps_session(client):
+    response = client.post('/api/sync', json=_graph())
+    assert response.status_code == 200
+    session = response.get_json()['session']
+
+    response = client.post(f'/api/sync/{session}', json={'base_version': 1, 'nodes': {'text': {'a': {'q': 5}}}})
+    assert response.status_code == 400
+
+    response = client.post(f'/api/sync/{session}', json={'base_version': 1, 'nodes': {'text': {'a': 'y = 2'}}})
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 2
@@ -0,0 +1,72 @@
+import pytest
+
+import benchmark
+from layout_json import BLOCK_TYPES, document_layout
+from paging import load_document
+
+MAIN = ('flowchart TD\nS([Start]) --> K{"k"}\nK -->|1| L(["for i"])\nL --> X["i++"]\nX --> L\n'
+        'L -->|Exit| M["m"]\nK -->|2| A["a"]\nK -->|3| C{"c"}\nC -->|Ja| B["b"]\nC -->|Nein| D["d"]\n'
+        'B --> N["n"]\nD --> N\nA --> M\nN --> M\nM --> E([End])')
+SUB = {'f': {'name': 'f', 'mermaid': 'flowchart TD\nS([Start f]) --> A["a"]\nA --> E([End f])'}}
+
+
+@pytest.fixture(scope='module')
+def layout():
+    return document_layout(load_document(MAIN, SUB))
+
+
+def test_arrays_have_equal_lengths(layout):
+    blocks = layout['blocks']
+    n = len(blocks['id'])
+    assert all(len(values) == n for values in blocks.values())
+    assert sum(blocks['lines']) == len(layout['text'])
+    columns = sum(blocks['columns'])
+    assert len(layout['column_width']) == len(layout['column_height']) == len(layout['column_label']) == columns
+    assert len(layout['headings']['name']) == len(layout['headings']['y']) == 1
+
+
+def test_blocks_in_document_order(layout):
+    blocks = layout['blocks']
+    assert blocks['id'] == ['S', 'K', 'L', 'X', 'A', 'C', 'B', 'D', 'N', 'M', 'E', 'S', 'A', 'E']
+    assert blocks['parent'] == [-1, -1, 1, 2, 1, 1, 5, 5, 1, -1, -1, -1, -1, -1]
+    # The loop body is in the loop's second column, after the spacer
+    assert blocks['column'] == [0, 0, 0, 1, 1, 2, 0, 1, 2, 0, 0, 0, 0, 0]
+    # Children sit inside their parent's column
+    for k, p in enumerate(blocks['parent']):
+        if p == -1:
+            assert blocks['column'][k] == 0
+        else:
+            assert blocks['column'][k] < blocks['columns'][p]
+            assert blocks['y'][p] < blocks['y'][k] < blocks['y'][p] + blocks['height'][p]
+
+
+def test_case_columns_carry_their_labels(layout):
+    blocks = layout['blocks']
+    offset = 0
+    labels = {}
+    for t, count in zip(blocks['type'], blocks['columns']):
+        labels.setdefault(BLOCK_TYPES[t], []).append(layout['column_label'][offset:offset + count])
+        offset += count
+    assert labels['case'] == [['1', '2', '3']]
+    assert labels['decision'] == [[None, None]]
+    assert labels['loop'] == [[None, None]]
+
+
+def test_subprogram_below_a_heading(layout):
+    blocks = layout['blocks']
+    assert layout['headings']['name'] == ['f']
+    heading_y = layout['headings']['y'][0]
+    sub = [k for k in range(len(blocks['id'])) if blocks['y'][k] > heading_y]
+    assert [blocks['id'][k] for k in sub] == ['S', 'A', 'E']
+    assert layout['height'] == blocks['y'][sub[-1]] + blocks['height'][sub[-1]]
+
+
+@pytest.mark.parametrize('precision', [0, 2])
+def test_numbers_are_rounded(precision):
+    layout = document_layout(load_document(benchmark.make_diagram(50, seed=3)[1]), precision)
+    blocks = layout['blocks']
+    for name in ('x', 'y', 'width', 'height', 'header'):
+        for v in blocks[name]:
+            assert v == round(v, precision)
+            # Whole numbers are written without a fraction
+            assert type(v) is int or v != int(v)
@@ -0,0 +1,52 @@
+import pytest
+
+from live_session import LiveSession
+from serving import ConversionLimits, LimitExceeded, enforce
+
+MERMAID = 'flowchart TD\n    S([Start]) --> A["x = 1"]\n    A --> E([End])'
+
+
+def _loop(block_id, children=()):
+    return {'id': block_id, 'type': 'loop', 'label': 'while true', 'children': list(children)}
+
+
+def test_insert_and_delete():
+    session = LiveSession.from_mermaid(MERMAID)
+    result = session.edit([{'op': 'insert', 'parent': None, 'index': 1,
+                            'block': {'id': 'b', 'type': 'process', 'label': 'y = 2'}}])
+    assert result['order'] == ['S', 'b', 'A', 'E']
+    result = session.edit([{'op': 'delete', 'id': 'b'}])
+    assert result['order'] == ['S', 'A', 'E']
+
+
+def test_insert_beyond_node_limit_is_refused():
+    session = LiveSession.from_mermaid(MERMAID)
+    block = _loop('l', [{'id': f'p{k}', 'type': 'process', 'label': 'x'} for k in range(5)])
+    with enforce(ConversionLimits(max_nodes=8)), pytest.raises(LimitExceeded):
+        session.edit([{'op': 'insert', 'parent': None, 'index': 1, 'block': block}])
+
+
+def test_insert_beyond_depth_limit_is_refused():
+    session = LiveSession.from_mermaid(MERMAID)
+    with enforce(ConversionLimits(max_depth=3)):
+        session.edit([{'op': 'insert', 'parent': None, 'block': _loop('l1', [_loop('l2')])}])
+        # l2's body sits at depth 2; a loop there nests a third level, one more a fourth
+        session.edit([{'op': 'insert', 'parent': 'l2', 'block': _loop('l3')}])
+        with pytest.raises(LimitExceeded):
+            session.edit([{'op': 'insert', 'parent': 'l3', 'block': _loop('l4')}])
+        session.edit([{'op': 'insert', 'parent': None, 'block': _loop('m1', [_loop('m2')])}])
+        with pytest.raises(LimitExceeded):
+            session.edit([{'op': 'move', 'id': 'm1', 'parent': 'l2'}])
+
+
+def test_live_edit_endpoint_applies_the_limits(client, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, 'conversion_limits', ConversionLimits(max_nodes=10, max_depth=10, timeout=30))
+    session = client.post('/api/live', json={'mermaid': MERMAID}).get_json()['session']
+    ops = [{'op': 'insert', 'parent': None, 'block': {'id': f'p{k}', 'type': 'process', 'label': 'x'}}
+           for k in range(20)]
+    response = client.post(f'/api/live/{session}/edit', json={'ops': ops})
+    assert response.status_code == 413
+    # The session was left half-edited and is gone
+    response = client.post(f'/api/live/{session}/edit', json={'ops': []})
+    assert response.status_code == 404
@@ -0,0 +1,156 @@
+import random
+
+import pytest
+
+from converter import build_structure, parse_mermaid
+from serving import UnstructuredFlowchart
+from flow_analysis import LOOP_IRREDUCIBLE, LOOP_NONE, LOOP_REDUCIBLE, LOOP_SELF, loop_forest
+from flowgraph import FlowGraph
+
+
+def _random_graph(rnd, n):
+    G = FlowGraph()
+    for v in range(n):
+        G.add_node(f'n{v}', f'n{v}', 'process')
+    for v in range(n):
+        for w in rnd.sample(range(n), rnd.randint(0, min(3, n))):
+            G.add_edge(f'n{v}', f'n{w}')
+    return G.freeze()
+
+
+def _reachable(G, start):
+    seen = {start}
+    stack = [start]
+    while stack:
+        for w in G.successors(stack.pop()):
+            if w not in seen:
+                seen.add(w)
+                stack.append(w)
+    return seen
+
+
+def _dominators(G, start, nodes):
+    dom = {v: set(nodes) for v in nodes}
+    dom[start] = {start}
+    preds = {v: [u for u in nodes if v in G.successors(u)] for v in nodes}
+    changed = True
+    while changed:
+        changed = False
+        for v in nodes:
+            if v != start:
+                new = {v} | set.intersection(*(dom[u] for u in preds[v]))
+                if new != dom[v]:
+                    dom[v] = new
+                    changed = True
+    return dom
+
+
+def _natural_loops(G, nodes, dom):
+    """Header -> body of the merged natural loops, or None if the graph is irreducible."""
+    back = [(u, h) for u in nodes for h in G.successors(u) if h in dom[u]]
+    # Reducible iff the graph without its back edges has no cycle
+    forward = {u: [w for w in G.successors(u) if w not in dom[u]] for u in nodes}
+    state = dict.fromkeys(nodes, 0)
+
+    def cyclic(v):
+        state[v] = 1
+        for w in forward[v]:
+            if state[w] == 1 or (state[w] == 0 and cyclic(w)):
+                return True
+        state[v] = 2
+        return False
+    if any(state[v] == 0 and cyclic(v) for v in nodes):
+        return None
+
+    loops = {}
+    for u, h in back:
+        body = loops.setdefault(h, {h})
+        stack = [u]
+        while stack:
+            v = stack.pop()
+            if v not in body:
+                body.add(v)
+                stack.extend(p for p in nodes if v in G.successors(p))
+    return loops
+
+
+@pytest.mark.parametrize('seed', range(300))
+def test_matches_natural_loops_on_random_graphs(seed):
+    rnd = random.Random(seed)
+    G = _random_graph(rnd, rnd.randint(1, 8))
+    forest = loop_forest(G, 0)
+    nodes = _reachable(G, 0)
+    assert sorted(forest.order) == sorted(nodes)
+    loops = _natural_loops(G, nodes, _dominators(G, 0, nodes))
+
+    if loops is None:
+        assert any(forest.kind[v] == LOOP_IRREDUCIBLE for v in nodes)
+        return
+    for v in nodes:
+        if v not in loops:
+            assert forest.kind[v] == LOOP_NONE
+        elif loops[v] == {v}:
+            assert forest.kind[v] == LOOP_SELF
+        else:
+            assert forest.kind[v] == LOOP_REDUCIBLE
+        for h, body in loops.items():
+            assert forest.contains(h, v) == (v in body)
+        # Parent link: the smallest other loop around v
+        around = [h for h, body in loops.items() if v in body and h != v]
+        innermost = min(around, key=lambda h: len(loops[h]), default=-1)
+        assert forest.header[v] == innermost
+
+
+def _structure(text):
+    G, start = parse_mermaid(text)
+    return build_structure(G, start, None)
+
+
+def _shape(blocks):
+    # (type, label, nested shapes) without ids, for compact expectations
+    shape = []
+    for b in blocks:
+        if b['type'] == 'loop':
+            shape.append(('loop', b['label'], _shape(b['children'])))
+        elif b['type'] == 'decision':
+            shape.append(('decision', b['label'], _shape(b['yes']), _shape(b['no'])))
+        elif b['type'] == 'case':
+            shape.append(('case', b['label'], [(br['label'], _shape(br['children'])) for br in b['branches']]))
+        else:
+            shape.append(b['label'])
+    return shape
+
+
+@pytest.mark.parametrize('text, expected', [
+    # Loops are found by their back edge, whatever the header's shape or edge labels
+    ('S([Start]) --> C{"i < 3"}\nC -->|Ja| B["i++"]\nB --> C\nC -->|Nein| E([End])',
+     ['Start', ('loop', 'i < 3', ['i++']), 'End']),
+    ('S([Start]) --> C["again"]\nC --> B["i++"]\nB --> C\nC --> E([End])',
+     ['Start', ('loop', 'again', ['i++']), 'End']),
+    # The exit edge listed first
+    ('S([Start]) --> C(["while x"])\nC -->|Exit| E([End])\nC --> B["step"]\nB --> C',
+     ['Start', ('loop', 'while x', ['step']), 'End']),
+    # An "Exit" label alone makes no loop
+    ('S([Start]) --> C{"c"}\nC -->|Exit| A["a"]\nC -->|Ja| B["b"]\nA --> M["m"]\nB --> M\nM --> E([End])',
+     ['Start', ('case', 'c', [('Exit', ['a']), ('Ja', ['b'])]), 'm', 'End']),
+    # Nested loops whose inner exit is the outer back edge
+    ('S([Start]) --> L{"outer"}\nL -->|Ja| K{"inner"}\nK -->|Ja| X["x"]\nX --> K\nK -->|Nein| L\nL -->|Nein| E([End])',
+     ['Start', ('loop', 'outer', [('loop', 'inner', ['x'])]), 'End']),
+    # A decision in a loop body whose branches meet at the header
+    ('S([Start]) --> L(["for i"])\nL --> C{"odd"}\nC -->|Ja| A["a"]\nC -->|Nein| B["b"]\nA --> L\nB --> L\nL -->|Exit| E([End])',
+     ['Start', ('loop', 'for i', [('decision', 'odd', ['a'], ['b'])]), 'End']),
+])
+def test_loops_from_the_graph_shape(text, expected):
+    assert _shape(_structure('flowchart TD\n' + text)) == expected
+
+
+@pytest.mark.parametrize('text, header', [
+    # Tested at the end of the body: repeat ... until has no block of its own
+    ('S([Start]) --> B["b"]\nB --> C{"again?"}\nC -->|ja| B\nC -->|nein| D["d"]\nD --> E([End])', 'B'),
+    # Left from the middle of the body as well as at the header
+    ('S([Start]) --> L{"l"}\nL -->|Ja| A["a"]\nA --> C{"c"}\nC -->|Ja| L\nC -->|Nein| E([End])\nL -->|Nein| E', 'L'),
+])
+def test_loops_not_left_at_the_header_are_refused(text, header):
+    with pytest.raises(UnstructuredFlowchart) as info:
+        _structure('flowchart TD\n' + text)
+    assert info.value.problems == [{'problem': 'unstructured_loop', 'nodes': [header], 'count': 1}]
@@ -0,0 +1,43 @@
+import pytest
+
+from converter import parse_mermaid
+
+
+def _parsed(text):
+    G, _ = parse_mermaid('flowchart TD\n' + text)
+    nodes = {G.ids[n]: (G.labels[n], G.types[n]) for n in range(len(G))}
+    edges = [(G.ids[u], G.ids[v], G.edge_label(u, v)) for u in range(len(G)) for v in G.successors(u)]
+    return nodes, edges
+
+
+@pytest.mark.parametrize('text, nodes, edges', [
+    ('A["a"] --> B["b"]',
+     {'A': ('a', 'process'), 'B': ('b', 'process')},
+     [('A', 'B', '')]),
+    ('A([s]) --> B([e])',
+     {'A': ('s', 'terminal'), 'B': ('e', 'terminal')},
+     [('A', 'B', '')]),
+    ('S([Start]) --> L(["solange x"])',
+     {'S': ('Start', 'terminal'), 'L': ('solange x', 'terminal')},
+     [('S', 'L', '')]),
+    ('A["a"] --> B["b"] --> C["c"]',
+     {'A': ('a', 'process'), 'B': ('b', 'process'), 'C': ('c', 'process')},
+     [('A', 'B', ''), ('B', 'C', '')]),
+    ('A{"c"} -->|Ja| B[["sub"]] -->|Exit| C',
+     {'A': ('c', 'decision'), 'B': ('sub', 'subprogram'), 'C': ('C', 'process')},
+     [('A', 'B', 'Ja'), ('B', 'C', 'Exit')]),
+    ('A["x --> y"]',
+     {'A': ('x --> y', 'process')},
+     []),
+    ('A -->|Nein| B',
+     {'A': ('A', 'process'), 'B': ('B', 'process')},
+     [('A', 'B', 'Nein')]),
+])
+def test_shaped_labelled_and_chained_edges(text, nodes, edges):
+    assert _parsed(text) == (nodes, edges)
+
+
+def test_definition_then_reference_keeps_label():
+    nodes, edges = _parsed('A["erst"]\nB{"frage"}\nA --> B\nB -->|Ja| A')
+    assert nodes == {'A': ('erst', 'process'), 'B': ('frage', 'decision')}
+    assert edges == [('A', 'B', ''), ('B', 'A', 'Ja')]
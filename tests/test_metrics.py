@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from metrics import MetricsRegistry, collect_trace, trace_count, trace_merge, trace_stage
+
+
+def test_merge_adds_up_stages_and_counts():
+    with collect_trace() as outer:
+        trace_count('nodes', 2)
+        with collect_trace() as inner:
+            with trace_stage('parse'):
+                pass
+            trace_count('nodes', 3)
+        trace_merge(inner)
+    assert outer.counts == {'nodes': 5}
+    assert outer.stages['parse'] == inner.stages['parse']
+
+
+def test_collect_trace_carries_on_with_a_given_trace():
+    with collect_trace() as trace:
+        trace_count('nodes', 1)
+    with collect_trace(trace):
+        trace_count('nodes', 1)
+    assert trace.counts == {'nodes': 2}
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    import app as app_module
+    registry = MetricsRegistry()
+    monkeypatch.setattr(app_module, 'METRICS_ENABLED', True)
+    monkeypatch.setattr(app_module, 'metrics_registry', registry)
+    return registry
+
+
+def _stage_count(registry, stage):
+    series = registry.stage_seconds._series.get((('stage', stage),))
+    return series[-1] if series else 0
+
+
+def test_batch_records_the_streamed_conversions(client, registry):
+    diagrams = [{'mermaid': f'flowchart TD\n    S([Start]) --> A["x = {k}"]\n    A --> E([End])'}
+                for k in range(6)]
+    response = client.post('/api/convert_nsd/batch', json={'diagrams': diagrams})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[-1] == {'done': 6, 'errors': 0}
+    # Recorded when the response is closed, not when the view returned
+    assert not registry._requests
+    response.close()
+    assert registry._requests == {('convert_nsd_batch', '200'): 1}
+    assert _stage_count(registry, 'parse') == 1
+    assert _stage_count(registry, 'total') == 1
+    assert registry.stage_seconds._series[(('stage', 'parse'),)][-2] > 0
@@ -0,0 +1,65 @@
+import os
+
+from nsd_cache import DiskCache, cache_key
+
+
+def test_mermaid_and_graph_sources_do_not_share_keys():
+    graph = {'nodes': [], 'edges': []}
+    # The Mermaid text equal to the graph's JSON encoding
+    text = '{"edges":[],"nodes":[]}'
+    assert cache_key(text) != cache_key(graph)
+
+
+def test_key_ignores_mermaid_formatting():
+    assert cache_key('flowchart TD\n  A --> B\n') == cache_key('flowchart TD\r\n\r\nA --> B')
+
+
+def test_key_keeps_unicode_line_separators_in_labels():
+    # str.splitlines would break the first label at U+2028 as well
+    assert cache_key('flowchart TD\nA(["x\u2028y"])-->B["b"]') != cache_key('flowchart TD\nA(["x\ny"])-->B["b"]')
+
+
+def test_disk_cache_stays_under_its_cap(tmp_path):
+    cache = DiskCache(str(tmp_path / 'cache.db'), max_bytes=4000)
+    for k in range(200):
+        cache.put(f'k{k}', os.urandom(200).hex())
+        assert cache.stats()['bytes'] <= 4000
+    assert cache.get('k199') is not None
+    assert cache.get('k0') is None
+    assert cache.evictions > 0
+
+
+def test_disk_cache_sees_puts_of_other_processes(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first = DiskCache(path, max_bytes=6000)
+    second = DiskCache(path, max_bytes=6000)
+    for k in range(40):
+        first.put(f'a{k}', os.urandom(100).hex())
+        second.put(f'b{k}', os.urandom(100).hex())
+    assert first.stats()['bytes'] <= 6000
+
+
+def test_disk_cache_total_matches_the_table(tmp_path):
+    cache = DiskCache(str(tmp_path / 'cache.db'), max_bytes=5000)
+    for k in range(100):
+        # Every third put replaces an entry
+        cache.put(f'k{k // 3 if k % 3 else k}', os.urandom(50 + k).hex())
+    real = cache._conn.execute('SELECT SUM(size) FROM nsd_cache').fetchone()[0]
+    assert cache.stats()['bytes'] == real
+    # A cache opened on an existing file starts from its contents
+    assert DiskCache(cache.path, max_bytes=5000).stats()['bytes'] == real
+
+
+def test_disk_cache_hits_touch_old_entries_only(tmp_path):
+    cache = DiskCache(str(tmp_path / 'cache.db'))
+    cache.put('k', 'value')
+
+    def accessed():
+        return cache._conn.execute("SELECT accessed FROM nsd_cache WHERE key = 'k'").fetchone()[0]
+
+    fresh = accessed()
+    assert cache.get('k') == 'value'
+    assert accessed() == fresh
+    cache._conn.execute("UPDATE nsd_cache SET accessed = accessed - ? WHERE key = 'k'", (cache.TOUCH_INTERVAL,))
+    assert cache.get('k') == 'value'
+    assert accessed() > fresh
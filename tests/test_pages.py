@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+import benchmark
+from serving import ConversionLimits
+
+
+@pytest.fixture(scope='module')
+def mermaid():
+    return benchmark.make_diagram(400, seed=5)[1]
+
+
+def _lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_pages_cover_the_diagram(client, mermaid):
+    lines = _lines(client.post('/api/convert_nsd/pages', json={'mermaid': mermaid, 'page_size': 'a4'}))
+    head, pages = lines[0], lines[1:]
+    assert len(pages) == len(head['pages']) > 1
+    assert [p['page'] for p in pages] == list(range(len(pages)))
+    assert pages[-1]['y_to'] == head['height']
+
+
+def test_selected_pages(client, mermaid):
+    lines = _lines(client.post('/api/convert_nsd/pages', json={'mermaid': mermaid, 'pages': [1, 0]}))
+    assert [p['page'] for p in lines[1:]] == [0, 1]
+
+
+@pytest.mark.parametrize('options', [
+    {'page_height': True},
+    {'page_height': 1},
+    {'page_height': 'a4'},
+    {'page_size': ['a4']},
+    {'page_size': 'a5'},
+    {'pages': [[0]]},
+])
+def test_bad_page_options_answer_400(client, mermaid, options):
+    response = client.post('/api/convert_nsd/pages', json={'mermaid': mermaid, **options})
+    assert response.status_code == 400
+
+
+def test_deadline_ends_the_stream(client, mermaid, monkeypatch):
+    import app as app_module
+    # Laid out before, so only the rendering runs into the deadline
+    client.post('/api/convert_nsd/pages', json={'mermaid': mermaid}).close()
+    monkeypatch.setattr(app_module, 'conversion_limits', ConversionLimits(timeout=1e-9))
+    lines = _lines(client.post('/api/convert_nsd/pages', json={'mermaid': mermaid}))
+    assert lines[-1]['status'] == 504
+    assert 'svg' not in lines[-1]
@@ -0,0 +1,101 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from converter import parse_mermaid
+from pap import (DECISION, LAYER_GAP, NODE_GAP, PROCESS, SUBPROGRAM, TERMINAL, _back_edges,
+                 convert_mermaid_to_pap, layout_pap, node_shape)
+
+SVG = '{http://www.w3.org/2000/svg}'
+
+CHAIN = 'flowchart TD\nS([Start]) --> A["a"]\nA --> B["b"]\nB --> E([End])'
+DECISION_MERGE = ('flowchart TD\nS([Start]) --> C{"c"}\nC -->|Ja| A["a"]\nC -->|Nein| B["b"]\n'
+                  'A --> M["m"]\nB --> M\nM --> E([End])')
+LOOP = 'flowchart TD\nS([Start]) --> L{"i < 3"}\nL -->|Ja| X["i++"]\nX --> L\nL -->|Nein| E([End])'
+
+
+def _layout(text):
+    G, start = parse_mermaid(text)
+    return G, layout_pap(G, start)
+
+
+def _node(G, lay, node_id):
+    return lay.nodes[G.index[node_id]]
+
+
+def _back(G, start):
+    back, _, _ = _back_edges(G, start)
+    return [(G.ids[u], G.ids[G.succ_nodes[p]])
+            for u in range(len(G)) for p in range(G.succ_start[u], G.succ_start[u + 1]) if back[p]]
+
+
+def test_node_shapes():
+    G, _ = parse_mermaid('flowchart TD\nS([Start]) --> A["a"]\nA --> P[["p"]]\nP --> C{"c"}\n'
+                         'C -->|Ja| L(["for i"])\nL --> X["x"]\nX --> L\nL -->|Exit| E([End])\n'
+                         'C -->|Nein| E')
+    shapes = {G.ids[v]: node_shape(G, v) for v in range(len(G))}
+    # The loop head is a terminal in Mermaid, with a back edge and an exit it is a decision
+    assert shapes == {'S': TERMINAL, 'A': PROCESS, 'P': SUBPROGRAM, 'C': DECISION,
+                      'L': DECISION, 'X': PROCESS, 'E': TERMINAL}
+
+
+def test_linear_chain_is_one_column():
+    G, lay = _layout(CHAIN)
+    assert _back(G, G.index['S']) == []
+    xs = {x for _, x, _, _, _, _ in lay.nodes}
+    assert len(xs) == 1
+    ys = [_node(G, lay, v)[2] for v in ('S', 'A', 'B', 'E')]
+    assert ys == sorted(ys) and len(set(ys)) == 4
+    # One straight edge between neighbouring layers each, from bottom to top
+    assert len(lay.edges) == 3
+    for points, *_ in lay.edges:
+        assert len({x for x, _ in points}) == 1
+        assert points[-1][1] - points[0][1] == LAYER_GAP
+
+
+def test_decision_branches_side_by_side_and_merge():
+    G, lay = _layout(DECISION_MERGE)
+    assert _back(G, G.index['S']) == []
+    c, a, b, m = (_node(G, lay, v) for v in 'CABM')
+    # Both branches in the layer below the decision, the yes branch on the left
+    assert a[2] == b[2] > c[2]
+    assert a[1] + a[3] // 2 + NODE_GAP <= b[1] - b[3] // 2
+    assert m[2] > a[2]
+    labels = {label for _, label, *_ in lay.edges}
+    assert labels == {'Ja', 'Nein', ''}
+
+
+def test_loop_has_one_back_edge_on_the_left():
+    G, lay = _layout(LOOP)
+    assert _back(G, G.index['S']) == [('X', 'L')]
+    loop, body, end = (_node(G, lay, v) for v in 'LXE')
+    assert body[2] > loop[2]
+    # The exit is kept below the loop body
+    assert end[2] > body[2]
+    # The back edge leaves the body at its left side and enters the loop's left corner
+    back, = [points for points, *_ in lay.edges if points[0] == (body[1] - body[3] // 2, body[2])]
+    assert back[-1] == (loop[1] - loop[3] // 2, loop[2])
+    assert min(x for x, _ in back) < loop[1] - loop[3] // 2
+
+
+def test_self_loop():
+    G, _ = parse_mermaid('flowchart TD\nS([Start]) --> A["a"]\nA --> A\nA --> E([End])')
+    assert _back(G, G.index['S']) == [('A', 'A')]
+
+
+@pytest.mark.parametrize('text', [CHAIN, DECISION_MERGE, LOOP])
+def test_svg_has_a_symbol_and_text_per_node(text):
+    G, lay = _layout(text)
+    svg = ET.fromstring(convert_mermaid_to_pap(text))
+    assert svg.get('width') == str(lay.width) and svg.get('height') == str(lay.height)
+    edges, symbols, texts, labels = svg.findall(SVG + 'g')
+    assert len(edges.findall(SVG + 'path')) == len(G.succ_nodes)
+    assert len(symbols) == len(G)
+    assert sorted(t.text for t in texts) == sorted(G.labels)
+    assert sorted(t.text for t in labels) == sorted(label for label in G.succ_labels if label)
+
+
+def test_labels_are_escaped():
+    svg = convert_mermaid_to_pap('flowchart TD\nS([Start]) --> A["a < b & c"]\nA --> E([End])')
+    assert '>a &lt; b &amp; c</text>' in svg
+    ET.fromstring(svg)
@@ -0,0 +1,82 @@
+import os
+import random
+
+import pytest
+
+from converter import parse_mermaid
+from flow_analysis import immediate_post_dominators
+from flowgraph import FlowGraph
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'structure')
+
+
+def _brute_force_ipdom(G):
+    # Post-dominator sets by fixpoint iteration; None for nodes that reach no end
+    n = len(G)
+    succ = [list(G.successors(v)) for v in range(n)]
+    pdom = [{v} if not succ[v] else None for v in range(n)]
+    changed = True
+    while changed:
+        changed = False
+        for v in range(n):
+            if not succ[v]:
+                continue
+            sets = [pdom[s] for s in succ[v] if pdom[s] is not None]
+            if not sets:
+                continue
+            new = {v} | set.intersection(*sets)
+            if new != pdom[v]:
+                pdom[v] = new
+                changed = True
+    ipdom = []
+    for v in range(n):
+        strict = pdom[v] - {v} if pdom[v] is not None else set()
+        # The nearest one is post-dominated by all the others
+        nearest = [p for p in strict if pdom[p] == strict]
+        ipdom.append(nearest[0] if nearest else -1)
+    return ipdom
+
+
+def _random_graph(rnd, n):
+    G = FlowGraph()
+    for v in range(n):
+        G.add_node(f'n{v}', f'n{v}', 'process')
+    for v in range(n):
+        if rnd.random() < 0.15:
+            continue    # an end
+        for w in rnd.sample(range(n), rnd.randint(1, min(3, n))):
+            G.add_edge(f'n{v}', f'n{w}')
+    return G.freeze()
+
+
+@pytest.mark.parametrize('seed', range(300))
+def test_matches_brute_force_on_random_graphs(seed):
+    rnd = random.Random(seed)
+    G = _random_graph(rnd, rnd.randint(2, 9))
+    assert list(immediate_post_dominators(G)) == _brute_force_ipdom(G)
+
+
+@pytest.mark.parametrize('name, branch, merge', [
+    ('decision', 'C', 'H'),
+    ('case', 'K', 'M'),
+    ('loops', 'C', 'L2'),    # the branches meet at the loop header again
+    ('two_ends', 'C', None),
+])
+def test_merge_node_of_branches(name, branch, merge):
+    with open(os.path.join(FIXTURES, name + '.mmd'), encoding='utf-8') as f:
+        G, _ = parse_mermaid(f.read())
+    ipdom = immediate_post_dominators(G)
+    m = ipdom[G.index[branch]]
+    assert (G.ids[m] if m != -1 else None) == merge
+
+
+def test_long_ladder_of_decisions():
+    depth = 10000
+    lines = ['flowchart TD', 'S([Start]) --> C0{"c0"}']
+    for i in range(depth):
+        lines += [f'C{i} -->|Ja| A{i}["a"]', f'C{i} -->|Nein| B{i}["b"]',
+                  f'A{i} --> C{i + 1}{{"c"}}', f'B{i} --> C{i + 1}']
+    lines.append(f'C{depth} --> E([End])')
+    G, _ = parse_mermaid('\n'.join(lines))
+    ipdom = immediate_post_dominators(G)
+    assert all(G.ids[ipdom[G.index[f'C{i}']]] == f'C{i + 1}' for i in range(depth))
@@ -0,0 +1,178 @@
+import threading
+import time
+
+import pytest
+
+from serving import (ConversionLimits, ConversionPool, DeadlineExceeded, LimitExceeded, ServerBusy,
+                     check_deadline, check_depth, check_nodes, enforce)
+
+
+@pytest.fixture
+def pool():
+    pool = ConversionPool(workers=1, queue_size=1)
+    yield pool
+    pool._executor.shutdown(wait=True)
+
+
+def _occupy(pool, n):
+    # n conversions that hold their thread or queue place until the event is set
+    release = threading.Event()
+    threads = [threading.Thread(target=pool.run, args=(lambda: release.wait(5), ConversionLimits()))
+               for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    running = min(n, pool.workers)
+    while pool.stats()['running'] < running or pool.stats()['queued'] < n - running:
+        time.sleep(0.001)
+    return release, threads
+
+
+def test_limits_only_inside_enforce():
+    check_nodes(10 ** 9)
+    with enforce(ConversionLimits(max_nodes=3, max_depth=1)):
+        check_nodes(3)
+        with pytest.raises(LimitExceeded, match='4 nodes'):
+            check_nodes(4)
+        loop = {'type': 'loop', 'label': 'l', 'children': []}
+        check_depth([loop])
+        with pytest.raises(LimitExceeded, match='2 levels'):
+            check_depth([{'type': 'loop', 'label': 'l', 'children': [loop]}])
+        # Blocks added below the top level
+        with pytest.raises(LimitExceeded, match='2 levels'):
+            check_depth([loop], level=1)
+    with enforce(ConversionLimits(timeout=1, deadline=time.monotonic() - 1)):
+        with pytest.raises(DeadlineExceeded):
+            check_deadline()
+
+
+def test_full_queue_is_busy(pool):
+    release, threads = _occupy(pool, 2)    # one running, one queued
+    with pytest.raises(ServerBusy):
+        pool.run(lambda: 1, ConversionLimits())
+    assert pool.stats()['rejected']['busy'] == 1
+    release.set()
+    for thread in threads:
+        thread.join()
+
+
+def test_deadline_while_queued(pool):
+    release, threads = _occupy(pool, 1)
+    ran = []
+    with pytest.raises(DeadlineExceeded):
+        pool.run(lambda: ran.append(1), ConversionLimits(timeout=0.05))
+    release.set()
+    threads[0].join()
+    # The queued call was dropped
+    assert ran == []
+    assert pool.stats()['rejected']['timeout'] == 1
+
+
+def test_deadline_while_running(pool):
+    def slow():
+        while True:
+            time.sleep(0.01)
+            check_deadline()
+    with pytest.raises(DeadlineExceeded):
+        pool.run(slow, ConversionLimits(timeout=0.05))
+    # The conversion stops at its next check and frees the thread
+    assert pool.run(lambda: 1, ConversionLimits()) == 1
+
+
+def test_limit_errors_are_counted(pool):
+    def too_large():
+        check_nodes(11)
+    with pytest.raises(LimitExceeded):
+        pool.run(too_large, ConversionLimits(max_nodes=10))
+    assert pool.stats()['rejected']['too_large'] == 1
+
+
+def test_run_many():
+    pool = ConversionPool(workers=4, queue_size=4)
+    lock = threading.Lock()
+    active = [0, 0]     # now, most at once
+
+    def call(i):
+        def func():
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            if i == 3:
+                check_nodes(11)
+            return i * i
+        return func
+    results = {tag: (result, error) for tag, result, error in
+               pool.run_many(((i, call(i)) for i in range(6)), ConversionLimits(max_nodes=10), in_flight=2)}
+    assert sorted(results) == list(range(6))
+    assert all(results[i] == (i * i, None) for i in range(6) if i != 3)
+    assert isinstance(results[3][1], LimitExceeded)
+    assert active[1] <= 2
+    assert pool.stats()['rejected']['too_large'] == 1
+    pool._executor.shutdown(wait=True)
+
+
+def test_run_many_waits_for_a_place(pool):
+    release, threads = _occupy(pool, 2)
+    threading.Timer(0.05, release.set).start()
+    results = list(pool.run_many([('a', lambda: 1)], ConversionLimits(timeout=5), in_flight=1))
+    assert results == [('a', 1, None)]
+    assert pool.stats()['rejected']['busy'] == 0
+
+
+MERMAID = 'flowchart TD\nS([Start]) --> A["{}"]\nA --> E([End])'
+
+
+@pytest.fixture
+def app_module(monkeypatch):
+    import app as app_module
+    pool = ConversionPool(workers=1, queue_size=1)
+    monkeypatch.setattr(app_module, 'conversion_pool', pool)
+    monkeypatch.setattr(app_module, 'conversion_limits', ConversionLimits())
+    yield app_module
+    pool._executor.shutdown(wait=True)
+
+
+def _convert(client, label):
+    return client.post('/api/convert_nsd', json={'mermaid': MERMAID.replace('{}', label)})
+
+
+def test_too_many_nodes_is_413(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'conversion_limits', ConversionLimits(max_nodes=2))
+    response = _convert(client, 'nodes')
+    assert response.status_code == 413
+    assert '3 nodes' in response.get_json()['error']
+
+
+def test_too_deep_is_413(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'conversion_limits', ConversionLimits(max_depth=1))
+    mermaid = ('flowchart TD\nS([Start]) --> L(["outer"])\nL --> K(["inner"])\nK --> X["x"]\n'
+               'X --> K\nK -->|Exit| L\nL -->|Exit| E([End])')
+    response = client.post('/api/convert_nsd', json={'mermaid': mermaid})
+    assert response.status_code == 413
+    assert '2 levels' in response.get_json()['error']
+
+
+def test_busy_is_503(client, app_module):
+    release, threads = _occupy(app_module.conversion_pool, 2)
+    try:
+        response = _convert(client, 'busy')
+    finally:
+        release.set()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert app_module.conversion_pool.stats()['rejected']['busy'] == 1
+
+
+def test_deadline_is_504(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'conversion_limits', ConversionLimits(timeout=0.2))
+    release, threads = _occupy(app_module.conversion_pool, 1)
+    try:
+        response = _convert(client, 'deadline')
+    finally:
+        release.set()
+    assert response.status_code == 504
+    assert app_module.conversion_pool.stats()['rejected']['timeout'] == 1
+    # Nothing was cached for the request that timed out
+    assert _convert(client, 'deadline').status_code == 200
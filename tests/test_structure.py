@@ -0,0 +1,116 @@
+import json
+import os
+
+import pytest
+
+from converter import build_structure, convert_mermaid_to_nsd, parse_mermaid
+from graph_json import build_structure_from_graph
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, 'fixtures', 'structure')
+ROOT = os.path.dirname(HERE)
+
+
+def _as_fixture(blocks):
+    # The fixtures predate block ids and subprogram blocks, calls are plain process blocks there
+    if isinstance(blocks, list):
+        return [_as_fixture(b) for b in blocks]
+    if isinstance(blocks, dict):
+        tree = {k: _as_fixture(v) for k, v in blocks.items() if k != 'id'}
+        if tree.get('type') == 'subprogram':
+            tree['type'] = 'process'
+        return tree
+    return blocks
+
+
+def _expected(name):
+    with open(os.path.join(FIXTURES, name + '.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _structure(text):
+    G, start = parse_mermaid(text)
+    return build_structure(G, start, None)
+
+
+def _depth(blocks):
+    depth = 0
+    stack = [(blocks, 0)]
+    while stack:
+        seq, level = stack.pop()
+        for b in seq:
+            if b['type'] == 'decision':
+                stack += [(b['yes'], level + 1), (b['no'], level + 1)]
+            elif b['type'] == 'case':
+                stack += [(br['children'], level + 1) for br in b['branches']]
+            elif b['type'] == 'loop':
+                stack.append((b['children'], level + 1))
+            else:
+                continue
+            depth = max(depth, level + 1)
+    return depth
+
+
+@pytest.mark.parametrize('name', ['decision', 'loops', 'case', 'two_ends', 'struktogramm_test'])
+def test_matches_recursive_builder(name):
+    with open(os.path.join(FIXTURES, name + '.mmd'), encoding='utf-8') as f:
+        text = f.read()
+    assert _as_fixture(_structure(text)) == _expected(name)
+
+
+def test_graph_format_matches_recursive_builder():
+    with open(os.path.join(ROOT, 'struktogramm_test.json'), encoding='utf-8') as f:
+        graph = json.load(f)
+    assert _as_fixture(build_structure_from_graph(graph)) == _expected('struktogramm_test')
+
+
+def test_block_ids_are_the_mermaid_ids():
+    blocks = _structure('flowchart TD\n    S([Start]) --> A["a"]\n    A --> E([End])')
+    assert [b['id'] for b in blocks] == ['S', 'A', 'E']
+
+
+# 10k levels: the recursive builder stopped at the recursion limit (1000)
+DEEP = 10000
+
+
+def _nested_loops(depth):
+    lines = ['flowchart TD', 'S([Start]) --> L0(["loop 0"])']
+    lines += [f'L{i} --> L{i + 1}(["loop {i + 1}"])' for i in range(depth - 1)]
+    lines += [f'L{depth - 1} --> X["x"]', f'X --> L{depth - 1}']
+    lines += [f'L{i} -->|Exit| L{i - 1}' for i in range(depth - 1, 0, -1)]
+    lines.append('L0 -->|Exit| E([End])')
+    return '\n'.join(lines)
+
+
+def _nested_decisions(depth):
+    lines = ['flowchart TD', 'S([Start]) --> C0{"c0"}']
+    for i in range(depth):
+        inner = f'C{i + 1}{{"c{i + 1}"}}' if i < depth - 1 else 'X["x"]'
+        lines += [f'C{i} -->|Ja| {inner}', f'C{i} -->|Nein| N{i}["n{i}"]', f'N{i} --> M{i}["m{i}"]']
+    lines.append(f'X --> M{depth - 1}')
+    lines += [f'M{i} --> M{i - 1}' for i in range(depth - 1, 0, -1)]
+    lines.append('M0 --> E([End])')
+    return '\n'.join(lines)
+
+
+@pytest.mark.parametrize('program', [_nested_loops, _nested_decisions])
+def test_deep_nesting_without_recursion(program):
+    text = program(DEEP)
+    assert _depth(_structure(text)) == DEEP
+    # Layout and rendering walk the tree without recursion as well
+    svg = convert_mermaid_to_nsd(text)
+    assert svg.endswith('</svg>') and '>x</text>' in svg
+
+
+def test_deep_graph_format():
+    nodes = [{'id': 'start_node_id', 'type': 'start', 'text': 'Start'},
+             {'id': 'end_node_id', 'type': 'end', 'text': 'End'}]
+    edges = [{'from': 'start_node_id', 'to': 'l0'}]
+    for i in range(DEEP):
+        nodes.append({'id': f'l{i}', 'type': 'while_loop', 'text': f'loop {i}'})
+        body = f'l{i + 1}' if i < DEEP - 1 else 'x'
+        exit_to = f'l{i - 1}' if i else 'end_node_id'
+        edges += [{'from': f'l{i}', 'to': body}, {'from': f'l{i}', 'to': exit_to, 'label': 'Exit'}]
+    nodes.append({'id': 'x', 'type': 'command', 'text': 'x'})
+    edges.append({'from': 'x', 'to': f'l{DEEP - 1}'})
+    assert _depth(build_structure_from_graph({'nodes': nodes, 'edges': edges})) == DEEP
@@ -0,0 +1,93 @@
+import os
+import pickle
+
+import pytest
+
+import converter
+from converter import build_structure, check_structure, convert_mermaid_to_nsd, parse_mermaid
+from flow_analysis import MAX_REPORTED_NODES
+from serving import UnstructuredFlowchart
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'structure')
+
+
+def _problems(text):
+    G, start = parse_mermaid('flowchart TD\n' + text)
+    with pytest.raises(UnstructuredFlowchart) as info:
+        check_structure(G, start)
+    return info.value.problems
+
+
+@pytest.mark.parametrize('text, expected', [
+    # A second node without predecessors
+    ('S([Start]) --> A["a"]\nX["x"] --> A\nA --> E([End])',
+     [('multiple_entries', ['S', 'X'])]),
+    # A loop between A and B, entered at both
+    ('S([Start]) --> C{"c"}\nC -->|Ja| A["a"]\nC -->|Nein| B["b"]\nA --> B\nB --> A\nB --> E([End])',
+     [('irreducible_loop', ['A'])]),
+    # A loop without an exit
+    ('S([Start]) --> A["a"]\nA --> B["b"]\nB --> A',
+     [('endless_loop', ['A'])]),
+    # The yes branch ends in a loop without an exit, so it never meets the no branch
+    ('S([Start]) --> C{"c"}\nC -->|Ja| A["a"]\nA --> A2["a2"]\nA2 --> A\nC -->|Nein| E([End])',
+     [('endless_loop', ['A']), ('no_merge', ['C'])]),
+    # F jumps from the yes branch of D into the no branch of C
+    ('S([Start]) --> C{"c"}\nC -->|Ja| A["a"]\nC -->|Nein| B["b"]\nA --> D{"d"}\n'
+     'D -->|Ja| F["f"]\nD -->|Nein| G["g"]\nB --> G\nF --> H["h"]\nG --> H\nH --> E([End])',
+     [('jump', ['G'])]),
+    # The test is at the end of the body: the loop headed by B is not left at B
+    ('S([Start]) --> B["b"]\nB --> C{"again?"}\nC -->|Ja| B\nC -->|Nein| E([End])',
+     [('unstructured_loop', ['B'])]),
+    # C leaves the loop headed by L from the middle of its body
+    ('S([Start]) --> L{"l"}\nL -->|Ja| A["a"]\nA --> C{"c"}\nC -->|Ja| L\nC -->|Nein| E([End])\nL -->|Nein| E',
+     [('unstructured_loop', ['L'])]),
+])
+def test_one_example_per_problem(text, expected):
+    problems = _problems(text)
+    assert [(p['problem'], p['nodes']) for p in problems] == expected
+    assert all(p['count'] == len(p['nodes']) for p in problems)
+
+
+@pytest.mark.parametrize('name', ['decision', 'loops', 'case', 'two_ends'])
+def test_structured_programs_pass(name):
+    with open(os.path.join(FIXTURES, name + '.mmd'), encoding='utf-8') as f:
+        G, start = parse_mermaid(f.read())
+    assert build_structure(G, start, None)
+
+
+def test_reported_nodes_are_capped():
+    # Every rung jumps from the yes branch into the no branch
+    rungs = 2 * MAX_REPORTED_NODES
+    lines = ['S([Start]) --> C0{"c"}']
+    for i in range(rungs):
+        lines += [f'C{i} -->|Ja| A{i}["a"]', f'C{i} -->|Nein| B{i}["b"]', f'A{i} --> B{i}',
+                  f'A{i} --> C{i + 1}{{"c"}}', f'B{i} --> C{i + 1}']
+    lines.append(f'C{rungs} --> E([End])')
+    problem, = _problems('\n'.join(lines))
+    assert problem['problem'] == 'jump'
+    assert problem['count'] == rungs
+    assert len(problem['nodes']) == MAX_REPORTED_NODES
+
+
+def test_error_survives_pickling():
+    # Raised in the subprogram worker processes as well
+    problems = _problems('S([Start]) --> A["a"]\nA --> B["b"]\nB --> A')
+    error = pickle.loads(pickle.dumps(UnstructuredFlowchart(problems)))
+    assert error.problems == problems
+    assert str(error) == 'Flowchart is not structured: endless loop at A'
+
+
+def test_convert_endpoint_answers_422_with_the_problems(client):
+    mermaid = 'flowchart TD\nS([Start]) --> A["a"]\nX["x"] --> A\nA --> E([End])'
+    response = client.post('/api/convert_nsd', json={'mermaid': mermaid})
+    assert response.status_code == 422
+    assert response.get_json()['problems'] == [{'problem': 'multiple_entries', 'nodes': ['S', 'X'], 'count': 2}]
+
+
+def test_checked_once_per_conversion(monkeypatch):
+    calls = []
+    check = converter.structure_problems
+    monkeypatch.setattr(converter, 'structure_problems', lambda *args: calls.append(1) or check(*args))
+    convert_mermaid_to_nsd('flowchart TD\nS([Start]) --> L{"i < 3"}\nL -->|Ja| X["i++"]\nX --> L\n'
+                           'L -->|Nein| E([End])')
+    assert calls == [1]